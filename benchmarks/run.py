@@ -0,0 +1,233 @@
+"""インプロセスのベンチマーク
+
+ネットワークを使わず mock_exporter.asgi.application に対して直接リクエストを送り、
+結果をJSONで出力する。
+
+    python -m benchmarks.run --output bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+from channels.testing import HttpCommunicator, WebsocketCommunicator  # noqa: E402
+from mock_exporter.asgi import application  # noqa: E402
+from metrics_app import views  # noqa: E402
+
+HEADERS = [(b'host', b'localhost'), (b'content-type', b'application/json')]
+
+
+async def request(method, path, body=b'', headers=HEADERS):
+    communicator = HttpCommunicator(application, method, path, body, headers)
+    response = await communicator.get_response(timeout=30)
+    await communicator.wait()
+    return response
+
+
+async def post_json(path, data):
+    return await request('POST', path, json.dumps(data).encode('utf-8'))
+
+
+def summarize(durations):
+    """所要時間（秒）のリストから統計値を算出"""
+    durations = sorted(durations)
+    return {
+        'count': len(durations),
+        'mean_ms': statistics.fmean(durations) * 1000,
+        'p50_ms': durations[len(durations) // 2] * 1000,
+        'p99_ms': durations[min(len(durations) - 1, int(len(durations) * 0.99))] * 1000,
+        'max_ms': durations[-1] * 1000,
+    }
+
+
+def reset_metrics(count):
+    """メトリクスを全て削除し、count個のメトリクスを作成（計測対象外）
+
+    作成・削除はビューと同じ関数で行う（メトリクスごとのログは出力しない）。
+    """
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for metric_id in list(views.metrics_registry):
+            views.delete_metric_by_id(metric_id)
+        metric_ids = []
+        for i in range(count):
+            metric_id = views.create_new_metric(f'bench_metric_{i}')
+            views.set_metric_value(metric_id, float(i))
+            metric_ids.append(metric_id)
+    if metric_ids:
+        views.current_metric_id = metric_ids[0]
+    return metric_ids
+
+
+async def bench_update(requests):
+    """update_metric のスループット"""
+    metric_id = reset_metrics(1)[0]
+    durations = []
+    started = time.perf_counter()
+    for i in range(requests):
+        t = time.perf_counter()
+        await post_json('/update_metric/', {'metric_id': metric_id, 'metric_value': i})
+        durations.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    return {'requests_per_sec': requests / elapsed, 'latency': summarize(durations)}
+
+
+async def bench_bulk_update(requests, batch_size):
+    """bulk_update_metrics のスループット（1秒あたりの更新数）"""
+    metric_ids = reset_metrics(batch_size)
+    durations = []
+    started = time.perf_counter()
+    for i in range(requests):
+        updates = [{'metric_id': metric_id, 'metric_value': i} for metric_id in metric_ids]
+        t = time.perf_counter()
+        await post_json('/bulk_update_metrics/', {'updates': updates})
+        durations.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    return {
+        'batch_size': batch_size,
+        'updates_per_sec': requests * batch_size / elapsed,
+        'latency': summarize(durations),
+    }
+
+
+async def bench_observe(requests, batch_size):
+    """observe_metrics のスループット（1秒あたりのヒストグラム観測数）"""
+    reset_metrics(0)
+    metric_id = views.create_new_metric('bench_histogram', 'histogram')
+    values = [(i % 1000) / 100 for i in range(batch_size)]
+    body = json.dumps([{'metric_id': metric_id, 'values': values}]).encode('utf-8')
+    durations = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        t = time.perf_counter()
+        await request('POST', '/observe_metrics/', body)
+        durations.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    return {
+        'batch_size': batch_size,
+        'observations_per_sec': requests * batch_size / elapsed,
+        'latency': summarize(durations),
+    }
+
+
+async def bench_webhook(requests):
+    """webhook の受信レート"""
+    durations = []
+    headers = [(b'host', b'localhost'), (b'content-type', b'text/plain')]
+    started = time.perf_counter()
+    for i in range(requests):
+        t = time.perf_counter()
+        await request('POST', '/webhook/', f'benchmark message {i}'.encode('utf-8'), headers)
+        durations.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    return {'messages_per_sec': requests / elapsed, 'latency': summarize(durations)}
+
+
+async def bench_scrape(series_counts, scrapes):
+    """/metrics のレイテンシ（系列数ごと、変更直後・変更なし・If-None-Match一致の3通り）"""
+    results = []
+    for count in series_counts:
+        metric_ids = reset_metrics(count)
+        cold, warm, not_modified, size = [], [], [], 0
+        for i in range(scrapes):
+            # 1系列だけ変更してから取得（差分の再生成を含む）
+            views.set_metric_value(metric_ids[i % count], float(i))
+            t = time.perf_counter()
+            response = await request('GET', '/metrics')
+            cold.append(time.perf_counter() - t)
+            size = len(response['body'])
+            etag = dict(response['headers'])[b'ETag']
+
+            t = time.perf_counter()
+            await request('GET', '/metrics')
+            warm.append(time.perf_counter() - t)
+
+            t = time.perf_counter()
+            await request('GET', '/metrics', headers=HEADERS + [(b'if-none-match', etag)])
+            not_modified.append(time.perf_counter() - t)
+        results.append({
+            'series': count,
+            'payload_bytes': size,
+            'after_update': summarize(cold),
+            'unchanged': summarize(warm),
+            'not_modified': summarize(not_modified),
+        })
+    return results
+
+
+async def bench_fanout(client_counts, rounds):
+    """N個のWebSocketクライアントへの配信レイテンシ"""
+    metric_id = reset_metrics(1)[0]
+    results = []
+    for count in client_counts:
+        clients = [WebsocketCommunicator(application, '/ws/webhook/') for _ in range(count)]
+        for client in clients:
+            await client.connect()
+
+        durations = []
+        for i in range(rounds):
+            t = time.perf_counter()
+            await post_json('/bulk_update_metrics/', [{'metric_id': metric_id, 'metric_value': i}])
+            await asyncio.gather(*(client.receive_from(timeout=10) for client in clients))
+            durations.append(time.perf_counter() - t)
+
+        for client in clients:
+            await client.disconnect()
+        results.append({'clients': count, 'latency': summarize(durations)})
+    return results
+
+
+async def run(args):
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'results': {
+            'update_metric': await bench_update(args.requests),
+            'bulk_update_metrics': await bench_bulk_update(args.requests, args.batch_size),
+            'observe_metrics': await bench_observe(args.requests // 10 or 1, args.observe_batch_size),
+            'webhook': await bench_webhook(args.requests),
+            'scrape': await bench_scrape(args.series, args.scrapes),
+            'fanout': await bench_fanout(args.clients, args.rounds),
+        },
+    }
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='mock-exporter benchmarks')
+    parser.add_argument('--requests', type=int, default=1000, help='HTTPベンチマークのリクエスト数')
+    parser.add_argument('--batch-size', type=int, default=100, help='一括更新1回あたりの更新数')
+    parser.add_argument('--observe-batch-size', type=int, default=100000,
+                        help='observe_metrics 1回あたりの観測値の数')
+    parser.add_argument('--series', type=int_list, default=[1, 10, 100, 1000, 10000, 100000],
+                        help='/metrics を計測する系列数（カンマ区切り）')
+    parser.add_argument('--scrapes', type=int, default=20, help='系列数ごとの取得回数')
+    parser.add_argument('--clients', type=int_list, default=[1, 10, 100],
+                        help='配信レイテンシを計測するクライアント数（カンマ区切り）')
+    parser.add_argument('--rounds', type=int, default=50, help='クライアント数ごとの配信回数')
+    parser.add_argument('--output', help='結果のJSONを書き込むファイル（省略時は標準出力）')
+    args = parser.parse_args()
+
+    # アプリケーションのログ出力がJSONに混ざらないよう標準エラーに回す
+    with contextlib.redirect_stdout(sys.stderr):
+        result = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(result + '\n')
+    else:
+        print(result)
+
+
+if __name__ == '__main__':
+    main()
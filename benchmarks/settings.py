@@ -0,0 +1,4 @@
+# ベンチマーク用の設定（スナップショットの復元・保存による影響を避ける）
+from mock_exporter.settings import *
+
+METRICS_SNAPSHOT_PATH = None
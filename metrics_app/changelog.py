@@ -0,0 +1,37 @@
+import uuid
+from .ringbuffer import MessageRingBuffer
+
+
+class MetricChangeLog:
+    """メトリクスの変更履歴
+
+    作成・削除・名前変更・値の変更のたびに状態バージョンを1つ進め、
+    変更されたメトリクスIDを固定容量のリングバッファに記録する。
+    instance はプロセスごとに異なるため、再起動や別ワーカーのバージョンとは区別できる。
+    """
+
+    def __init__(self, capacity):
+        self.instance = uuid.uuid4().hex
+        self._log = MessageRingBuffer(capacity)
+
+    @property
+    def version(self):
+        """現在の状態バージョン（変更がなければ0）"""
+        return self._log.last_seq
+
+    def etag(self):
+        """現在の状態を表すETag"""
+        return f'"{self.instance}-{self.version}"'
+
+    def record(self, metric_id=None):
+        """変更を記録して新しいバージョンを返す（選択中のメトリクスの変更などはIDなし）"""
+        return self._log.append({'metric_id': metric_id})
+
+    def changed_since(self, version):
+        """versionより後に変更されたメトリクスIDの集合
+
+        履歴が既に上書きされている場合や、未来のバージョンが指定された場合はNoneを返す。
+        """
+        if version > self.version or version + 1 < self._log.first_seq:
+            return None
+        return {entry['metric_id'] for entry in self._log.since(version)} - {None}
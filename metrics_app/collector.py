@@ -0,0 +1,666 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from functools import partial
+import gzip
+import math
+import re
+import sys
+import threading
+import uuid
+from prometheus_client import Histogram
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.utils import floatToGoString
+
+# 作成できるメトリクスの種類
+METRIC_TYPES = ('gauge', 'counter', 'histogram', 'summary')
+
+# 観測値を記録する（値を直接設定できない）種類
+OBSERVED_TYPES = ('histogram', 'summary')
+
+LABEL_NAME = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+
+# 種類ごとに予約されているラベル名
+RESERVED_LABELS = {'histogram': ('le',), 'summary': ('quantile',)}
+
+# 種類ごとにexpositionで使われる名前の接尾辞（prometheus_clientのCollectorRegistryと同じ）
+NAME_SUFFIXES = {
+    'counter': ('_total', '_created'),
+    'histogram': ('_bucket', '_sum', '_count', '_created'),
+    'summary': ('_sum', '_count', '_created'),
+}
+
+
+def histogram_buckets(buckets=None):
+    """ヒストグラムのバケット上限を検証し、+Infで終わるタプルに変換"""
+    if buckets is None:
+        return tuple(Histogram.DEFAULT_BUCKETS)
+    bounds = [float(bound) for bound in buckets]
+    if not bounds:
+        raise ValueError('buckets must not be empty')
+    if any(math.isnan(bound) for bound in bounds):
+        raise ValueError('buckets must not contain NaN')
+    if any(a >= b for a, b in zip(bounds, bounds[1:])):
+        raise ValueError('buckets must be in strictly ascending order')
+    if bounds[-1] != math.inf:
+        bounds.append(math.inf)
+    if len(bounds) < 2:
+        raise ValueError('buckets must contain at least one finite bound')
+    return tuple(bounds)
+
+
+def validate_label_names(label_names, metric_type='gauge'):
+    """ラベル名を検証してタプルに変換"""
+    label_names = tuple(label_names or ())
+    for label_name in label_names:
+        if not isinstance(label_name, str) or not LABEL_NAME.match(label_name) or label_name.startswith('__'):
+            raise ValueError(f"Invalid label name: {label_name}")
+        if label_name in RESERVED_LABELS.get(metric_type, ()):
+            raise ValueError(f"Reserved label name for {metric_type}: {label_name}")
+    if len(set(label_names)) != len(label_names):
+        raise ValueError("Duplicated label names")
+    return label_names
+
+
+def exposition_names(name, metric_type='gauge'):
+    """メトリクスがexpositionで使う（他のメトリクスと重複できない）名前のタプル"""
+    if metric_type == 'counter':
+        name = name.removesuffix('_total')
+    return (name,) + tuple(name + suffix for suffix in NAME_SUFFIXES.get(metric_type, ()))
+
+
+def escape_label_value(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def sample_lines(name, metric_type, labels, value, count, buckets):
+    """1系列分のサンプル行を生成
+
+    labels は (ラベル名, 整形済みの name="value") のラベル名順のリスト、buckets は (上限, 件数)。
+    prometheus_clientと同じくラベルはラベル名順に並べる。
+    """
+    selector = '{' + ','.join(pair for _, pair in labels) + '}' if labels else ''
+    value = floatToGoString(value)
+    if metric_type == 'counter':
+        return f"{name.removesuffix('_total')}_total{selector} {value}\n"
+    if metric_type == 'gauge':
+        return f"{name}{selector} {value}\n"
+
+    lines = []
+    if metric_type == 'histogram':
+        # le もラベル名順の位置に入れる
+        before = ''.join(f'{pair},' for label_name, pair in labels if label_name < 'le')
+        after = ''.join(f',{pair}' for label_name, pair in labels if label_name > 'le')
+        cumulative = 0.0
+        for bound, bucket_count in zip(*buckets):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{before}le="{floatToGoString(bound)}"{after}}} {floatToGoString(cumulative)}\n')
+    lines.append(f"{name}_count{selector} {floatToGoString(count)}\n{name}_sum{selector} {value}\n")
+    return ''.join(lines)
+
+
+class MetricChild:
+    """ラベル付きメトリクスの子（1つのラベル値の組の系列）"""
+
+    __slots__ = ('labels', 'value', 'count', 'bucket_counts', 'line')
+
+    def __init__(self, labels, bucket_len=0):
+        self.labels = labels        # (ラベル名, 整形済みの name="value") のラベル名順のリスト
+        self.value = 0.0
+        self.count = 0.0
+        self.bucket_counts = array('d', bytes(8 * bucket_len)) if bucket_len else None
+        self.line = None            # 生成済みのサンプル行（dirtyならNone）
+
+
+class MetricChildren:
+    """ラベル付きメトリクスの子の集合
+
+    ラベル値の組をタプルにして子を引く辞書のキーとし、O(1)で子を取得する。
+    ラベルごとに ラベル値 -> キーの集合 の索引を持ち、ラベルの一致条件による一括削除では
+    索引から対象の子のみを求める。
+    """
+
+    def __init__(self, label_names, bounds=None):
+        self.label_names = label_names
+        self.bounds = bounds
+        self.children = {}          # ラベル値のタプル -> MetricChild
+        self._postings = [{} for _ in label_names]  # ラベルの位置 -> ラベル値 -> キーの集合
+
+    def __len__(self):
+        return len(self.children)
+
+    def key(self, labels):
+        """ラベル（名前 -> 値の辞書、またはラベル名の順の値のリスト）をキーに変換"""
+        if isinstance(labels, dict):
+            if labels.keys() != set(self.label_names):
+                raise ValueError(f"labels must be {list(self.label_names)}")
+            values = [labels[label_name] for label_name in self.label_names]
+        elif isinstance(labels, (list, tuple)):
+            if len(labels) != len(self.label_names):
+                raise ValueError(f"labels must be {list(self.label_names)}")
+            values = labels
+        else:
+            raise ValueError("labels are required for labeled metric")
+        return tuple(value if type(value) is str else str(value) for value in values)
+
+    def child(self, key):
+        """キーの子を取得（なければ作成）"""
+        child = self.children.get(key)
+        if child is None:
+            # 子を作成するときのみラベル値を intern し、同じラベル値の文字列を子の間で共有する
+            key = tuple(map(sys.intern, key))
+            labels = sorted(
+                (label_name, f'{label_name}="{escape_label_value(value)}"')
+                for label_name, value in zip(self.label_names, key))
+            child = MetricChild(labels, len(self.bounds) if self.bounds else 0)
+            self.children[key] = child
+            for postings, value in zip(self._postings, key):
+                postings.setdefault(value, set()).add(key)
+        return child
+
+    def _position(self, label_name):
+        try:
+            return self.label_names.index(label_name)
+        except ValueError:
+            raise ValueError(f"Unknown label name: {label_name}") from None
+
+    def match(self, match=None, match_re=None):
+        """ラベルが全て一致する子のキーを返す
+
+        match はラベル名 -> 値（完全一致）、match_re はラベル名 -> 正規表現（全体一致）。
+        どちらも指定しない場合は全ての子を返す。
+        """
+        conditions = []
+        for label_name, value in (match or {}).items():
+            conditions.append(self._postings[self._position(label_name)].get(str(value), set()))
+        for label_name, pattern in (match_re or {}).items():
+            postings = self._postings[self._position(label_name)]
+            regex = re.compile(pattern)
+            conditions.append(set().union(*(
+                keys for value, keys in postings.items() if regex.fullmatch(value))))
+        if not conditions:
+            return list(self.children)
+        conditions.sort(key=len)
+        return list(conditions[0].intersection(*conditions[1:]))
+
+    def remove(self, keys):
+        """子を削除し、削除した件数を返す"""
+        removed = 0
+        for key in keys:
+            if self.children.pop(key, None) is None:
+                continue
+            removed += 1
+            for postings, value in zip(self._postings, key):
+                members = postings[value]
+                members.discard(key)
+                if not members:
+                    del postings[value]
+        return removed
+
+    def invalidate(self):
+        for child in self.children.values():
+            child.line = None
+
+    def render(self, name, metric_type):
+        """全ての子のサンプル行を生成（変更された子の行のみ再生成）"""
+        lines = []
+        for child in self.children.values():
+            if child.line is None:
+                child.line = sample_lines(name, metric_type, child.labels, child.value,
+                                          child.count, (self.bounds, child.bucket_counts))
+            lines.append(child.line)
+        return ''.join(lines)
+
+
+class DynamicMetricsCollector:
+    """動的メトリクスをまとめて保持し、exposition形式で出力するクラス
+
+    メトリクスごとにGaugeを作成してREGISTRYへ登録する代わりに、
+    値を array('d') に、名前をスロット単位のリストに保持する。
+    作成・削除・名前変更はいずれもO(1)でREGISTRYには触れない。
+    REGISTRYには登録せず、出力は render() のみで行う（MetricFamilyは生成しない）。
+
+    値はgauge・counterでは現在値、histogram・summaryでは観測値の合計を表す。
+    histogram・summaryの観測数と、histogramのバケットごとの件数は別に保持する。
+    ラベル付きメトリクスの値は、スロットごとの MetricChildren が子ごとに保持する。
+
+    変更のたびにバージョンを進め、変更されたスロットだけをdirtyにする。
+    render() はdirtyなスロットの行のみを再生成し、変更がなければ
+    前回のexpositionをそのまま返す。
+    """
+
+    def __init__(self):
+        self._values = array('d')   # スロット -> 値
+        self._counts = array('d')   # スロット -> 観測数（histogram・summary）
+        self._ids = array('q')      # スロット -> メトリクスID
+        self._names = []            # スロット -> Prometheus名（空きスロットはNone）
+        self._types = []            # スロット -> メトリクスの種類
+        self._buckets = []          # スロット -> (バケット上限, バケットごとの件数)（histogram以外はNone）
+        self._children = []         # スロット -> ラベル付きメトリクスの子（ラベルなしはNone）
+        self._slots = {}            # メトリクスID -> スロット
+        self._name_slots = {}       # Prometheus名 -> スロット
+        self._sorted_ids = []       # 昇順のメトリクスID（IDは増加順に払い出されるため通常は末尾に追加する）
+        self._free = []             # 再利用可能な空きスロット
+        self._series = 0            # 系列数（ラベル付きメトリクスは子の数）
+        self._blocks = []           # スロット -> 生成済みのexposition行 (text, OpenMetrics)（dirtyならNone）
+        self._lock = threading.Lock()
+
+        # 再起動後に同じバージョン番号でもETagが衝突しないようにする
+        self._instance = uuid.uuid4().hex[:8]
+        self._version = 0
+        self._rendered_version = None
+        self._rendered = {}         # OpenMetrics形式か -> 連結済みのexposition
+        self._encoded = {}          # (OpenMetrics形式か, gzip圧縮か) -> キャッシュ済みのバイト列
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, metric_id):
+        return metric_id in self._slots
+
+    @property
+    def series_count(self):
+        """系列数（ラベルなしのメトリクスは1、ラベル付きメトリクスは子の数）"""
+        return self._series
+
+    def metric_series_count(self, metric_id):
+        """1つのメトリクスの系列数（存在しなければ0）"""
+        slot = self._slots.get(metric_id)
+        if slot is None:
+            return 0
+        children = self._children[slot]
+        return 1 if children is None else len(children)
+
+    @property
+    def version(self):
+        """変更のたびに増加するバージョン"""
+        return self._version
+
+    def metric_id_for(self, name):
+        """Prometheus名（*_total などexpositionで使う名前を含む）からメトリクスIDを取得（存在しなければNone）"""
+        slot = self._name_slots.get(name)
+        return None if slot is None else self._ids[slot]
+
+    def sorted_ids(self, after=None, chunk=1000):
+        """メトリクスIDを昇順に返すイテレーター（afterを指定した場合はそれより大きいIDのみ）
+
+        chunk件ずつ複製し、続きは最後に返したIDから二分探索で再開するため、
+        途中で追加・削除されても影響を受けず、afterの位置から読み始められる。
+        """
+        while True:
+            with self._lock:
+                start = 0 if after is None else bisect_right(self._sorted_ids, after)
+                metric_ids = self._sorted_ids[start:start + chunk]
+            if not metric_ids:
+                return
+            yield from metric_ids
+            after = metric_ids[-1]
+
+    def metric_type(self, metric_id):
+        """メトリクスの種類を取得"""
+        return self._types[self._slots[metric_id]]
+
+    def label_names(self, metric_id):
+        """ラベル名のタプルを取得（ラベルなしは空）"""
+        children = self._children[self._slots[metric_id]]
+        return () if children is None else children.label_names
+
+    def etag(self, variant=''):
+        """現在の状態を表すETag（variantで形式・圧縮の違いを区別する）"""
+        return f'"{self._instance}-{self._version}{variant}"'
+
+    def name_available(self, name, metric_type='gauge', metric_id=None):
+        """その種類のメトリクスがnameを使えるか（metric_idを指定した場合はそのメトリクス自身の名前は除く）"""
+        slot = self._slots.get(metric_id)
+        return all(self._name_slots.get(reserved, slot) == slot
+                   for reserved in exposition_names(name, metric_type))
+
+    def _check_name(self, name, metric_type='gauge', slot=None):
+        # counterの *_total やhistogramの *_bucket など、種類ごとに使う名前を全て予約する
+        for reserved in exposition_names(name, metric_type):
+            if self._name_slots.get(reserved, slot) != slot:
+                raise ValueError(f"Duplicated timeseries in CollectorRegistry: {reserved}")
+        # prometheus_clientと同じ規則で名前を検証する
+        GaugeMetricFamily(name, '')
+
+    def add(self, metric_id, name, value=0.0, metric_type='gauge', buckets=None, label_names=()):
+        """メトリクスを追加（bucketsはhistogramのバケット上限、label_namesはラベル名）"""
+        if metric_type not in METRIC_TYPES:
+            raise ValueError(f"Unknown metric type: {metric_type}")
+        label_names = validate_label_names(label_names, metric_type)
+        if metric_type in OBSERVED_TYPES or label_names:
+            value = 0.0
+        bucket_state = None
+        if metric_type == 'histogram':
+            bounds = histogram_buckets(buckets)
+            bucket_state = (bounds, array('d', bytes(8 * len(bounds))))
+        children = MetricChildren(label_names, bucket_state and bucket_state[0]) if label_names else None
+
+        with self._lock:
+            if metric_id in self._slots:
+                raise ValueError(f"Metric already exists: ID={metric_id}")
+            self._check_name(name, metric_type)
+
+            if self._free:
+                slot = self._free.pop()
+                self._values[slot] = value
+                self._counts[slot] = 0.0
+                self._ids[slot] = metric_id
+                self._names[slot] = name
+                self._types[slot] = metric_type
+                self._buckets[slot] = bucket_state
+                self._children[slot] = children
+                self._blocks[slot] = None
+            else:
+                slot = len(self._names)
+                self._values.append(value)
+                self._counts.append(0.0)
+                self._ids.append(metric_id)
+                self._names.append(name)
+                self._types.append(metric_type)
+                self._buckets.append(bucket_state)
+                self._children.append(children)
+                self._blocks.append(None)
+
+            self._slots[metric_id] = slot
+            for reserved in exposition_names(name, metric_type):
+                self._name_slots[reserved] = slot
+            if not self._sorted_ids or metric_id > self._sorted_ids[-1]:
+                self._sorted_ids.append(metric_id)
+            else:
+                insort(self._sorted_ids, metric_id)
+            self._series += 0 if children is not None else 1
+            self._version += 1
+
+    def add_many(self, items):
+        """(メトリクスID, Prometheus名, 値) のgaugeをまとめて追加（スナップショットからの復元用）"""
+        items = list(items)
+        with self._lock:
+            for metric_id, name, _ in items:
+                if metric_id in self._slots:
+                    raise ValueError(f"Metric already exists: ID={metric_id}")
+                if name in self._name_slots:
+                    raise ValueError(f"Duplicated timeseries in CollectorRegistry: {name}")
+
+            start = len(self._names)
+            self._ids.extend(metric_id for metric_id, _, _ in items)
+            self._names.extend(name for _, name, _ in items)
+            self._values.extend(value for _, _, value in items)
+            self._counts.extend(bytes(8 * len(items)))
+            self._types.extend(['gauge'] * len(items))
+            self._buckets.extend([None] * len(items))
+            self._children.extend([None] * len(items))
+            self._blocks.extend([None] * len(items))
+            for slot, (metric_id, name, _) in enumerate(items, start):
+                self._slots[metric_id] = slot
+                self._name_slots[name] = slot
+            self._sorted_ids.extend(metric_id for metric_id, _, _ in items)
+            self._sorted_ids.sort()
+            self._series += len(items)
+            self._version += 1
+
+    def remove(self, metric_id):
+        """メトリクスを削除（スロットは再利用される）"""
+        with self._lock:
+            slot = self._slots.pop(metric_id)
+            for reserved in exposition_names(self._names[slot], self._types[slot]):
+                del self._name_slots[reserved]
+            del self._sorted_ids[bisect_left(self._sorted_ids, metric_id)]
+            children = self._children[slot]
+            self._series -= 1 if children is None else len(children)
+            self._names[slot] = None
+            self._values[slot] = 0.0
+            self._counts[slot] = 0.0
+            self._buckets[slot] = None
+            self._children[slot] = None
+            self._blocks[slot] = None
+            self._free.append(slot)
+            self._version += 1
+
+    def rename(self, metric_id, name):
+        """メトリクス名を変更（値は保持される）"""
+        with self._lock:
+            slot = self._slots[metric_id]
+            old_name = self._names[slot]
+            if name == old_name:
+                return
+            metric_type = self._types[slot]
+            self._check_name(name, metric_type, slot)
+            for reserved in exposition_names(old_name, metric_type):
+                del self._name_slots[reserved]
+            self._names[slot] = name
+            for reserved in exposition_names(name, metric_type):
+                self._name_slots[reserved] = slot
+            if self._children[slot] is not None:
+                self._children[slot].invalidate()
+            self._blocks[slot] = None
+            self._version += 1
+
+    def _child(self, slot, labels):
+        """ラベルに対応する子を取得・作成（ラベルなしのメトリクスではNone）
+
+        ロックを保持した状態で呼び出す。
+        """
+        children = self._children[slot]
+        if children is None:
+            if labels:
+                raise ValueError("Metric has no labels")
+            return None
+        count = len(children)
+        child = children.child(children.key(labels))
+        self._series += len(children) - count
+        return child
+
+    def set(self, metric_id, value, labels=None):
+        """メトリクス値を設定（histogram・summaryは観測値を記録する必要があるため不可）
+
+        counterは単調増加である必要があるため、現在値以上の値（加算）のみ設定できる。
+        ラベル付きメトリクスでは labels の子に設定する（子がなければ作成する）。
+        """
+        with self._lock:
+            slot = self._slots[metric_id]
+            if self._types[slot] in OBSERVED_TYPES:
+                raise ValueError(f"Cannot set value of {self._types[slot]} metric, use observe instead")
+            child = self._child(slot, labels)
+            if self._types[slot] == 'counter':
+                current = self._values[slot] if child is None else child.value
+                if not value >= current:
+                    raise ValueError(f"Counters cannot be decreased: {value} < {current}")
+            if child is None:
+                self._values[slot] = value
+            else:
+                child.value = float(value)
+                child.line = None
+            self._blocks[slot] = None
+            self._version += 1
+
+    def get(self, metric_id, labels=None):
+        """メトリクス値を取得（ラベル付きメトリクスで子がなければKeyError）"""
+        if labels is None:
+            return self._values[self._slots[metric_id]]
+        with self._lock:
+            children = self._children[self._slots[metric_id]]
+            if children is None:
+                raise ValueError("Metric has no labels")
+            return children.children[children.key(labels)].value
+
+    def children(self, metric_id, match=None, match_re=None):
+        """ラベル付きメトリクスの子を (ラベル値のタプル, 値, 観測数) のリストで取得"""
+        with self._lock:
+            children = self._children[self._slots[metric_id]]
+            if children is None:
+                raise ValueError("Metric has no labels")
+            return [
+                (key, children.children[key].value, children.children[key].count)
+                for key in sorted(children.match(match, match_re))
+            ]
+
+    def remove_children(self, metric_id, match=None, match_re=None):
+        """ラベルが一致する子をまとめて削除し、削除した件数を返す（条件がなければ全ての子）"""
+        with self._lock:
+            slot = self._slots[metric_id]
+            children = self._children[slot]
+            if children is None:
+                raise ValueError("Metric has no labels")
+            removed = children.remove(children.match(match, match_re))
+            self._series -= removed
+            if removed:
+                self._blocks[slot] = None
+                self._version += 1
+            return removed
+
+    def observe_many(self, metric_id, values, labels=None):
+        """複数の観測値をまとめて記録し、記録した件数を返す
+
+        histogramではbisectで各観測値のバケットを求めてバケットごとに件数を集計し、
+        ロックを1回取得する間にまとめて加算する。counterでは合計を加算する。
+        ラベル付きメトリクスでは labels の子に記録する。
+        """
+        values = [float(value) for value in values]
+        total = math.fsum(values)
+
+        slot = self._slots[metric_id]
+        metric_type = self._types[slot]
+        if metric_type == 'gauge':
+            raise ValueError("Cannot observe gauge metric, use set instead")
+        if metric_type == 'counter' and any(value < 0 for value in values):
+            raise ValueError("Counters can only be incremented by non-negative amounts")
+
+        bucket_counts = None
+        if metric_type == 'histogram':
+            bounds = self._buckets[slot][0]
+            bucket_counts = Counter(map(partial(bisect_left, bounds), values))
+
+        with self._lock:
+            if self._slots.get(metric_id) != slot:
+                raise KeyError(metric_id)
+            child = self._child(slot, labels)
+            if child is None:
+                self._values[slot] += total
+                if metric_type in OBSERVED_TYPES:
+                    self._counts[slot] += len(values)
+                counts = bucket_counts and self._buckets[slot][1]
+            else:
+                child.value += total
+                if metric_type in OBSERVED_TYPES:
+                    child.count += len(values)
+                counts = child.bucket_counts
+                child.line = None
+            if bucket_counts is not None:
+                for index, count in bucket_counts.items():
+                    counts[index] += count
+            self._blocks[slot] = None
+            self._version += 1
+        return len(values)
+
+    def state(self, metric_id):
+        """(種類, 値, 観測数, バケット上限, バケットごとの件数) を取得（スナップショット用）"""
+        with self._lock:
+            slot = self._slots[metric_id]
+            bounds, counts = self._buckets[slot] or ((), ())
+            return (self._types[slot], self._values[slot], self._counts[slot],
+                    tuple(bounds), tuple(counts))
+
+    def children_state(self, metric_id):
+        """子を (ラベル値のタプル, 値, 観測数, バケットごとの件数) のリストで取得（スナップショット用）"""
+        with self._lock:
+            children = self._children[self._slots[metric_id]]
+            if children is None:
+                return []
+            return [
+                (key, child.value, child.count, tuple(child.bucket_counts or ()))
+                for key, child in children.children.items()
+            ]
+
+    def load_children(self, metric_id, children_state):
+        """子の値・観測数・バケットごとの件数を復元"""
+        with self._lock:
+            slot = self._slots[metric_id]
+            children = self._children[slot]
+            if children is None:
+                raise ValueError("Metric has no labels")
+            for key, value, count, bucket_counts in children_state:
+                child = self._child(slot, key)
+                if child.bucket_counts is not None:
+                    if len(bucket_counts) != len(child.bucket_counts):
+                        raise ValueError("Bucket count mismatch")
+                    child.bucket_counts[:] = array('d', bucket_counts)
+                child.value = value
+                child.count = count
+                child.line = None
+            self._blocks[slot] = None
+            self._version += 1
+
+    def load_observations(self, metric_id, value, count, bucket_counts=()):
+        """観測値の合計・観測数・バケットごとの件数を復元"""
+        with self._lock:
+            slot = self._slots[metric_id]
+            if self._buckets[slot] is not None:
+                counts = self._buckets[slot][1]
+                if len(bucket_counts) != len(counts):
+                    raise ValueError("Bucket count mismatch")
+                counts[:] = array('d', bucket_counts)
+            self._values[slot] = value
+            self._counts[slot] = count
+            self._blocks[slot] = None
+            self._version += 1
+
+    def render(self, openmetrics=False, compress=False):
+        """expositionを生成（変更されたスロットの行のみ再生成）
+
+        counter以外の行はtext形式とOpenMetrics形式で共通のため、OpenMetrics形式では
+        counterのHELP・TYPE行の違いを除けば末尾に # EOF を付けるだけでよい。
+        gzip圧縮したバイト列も同じバージョンの間はキャッシュされる。
+        """
+        with self._lock:
+            if self._rendered_version != self._version:
+                self._rebuild()
+
+            key = (openmetrics, compress)
+            if key not in self._encoded:
+                if openmetrics not in self._rendered:
+                    index = 1 if openmetrics else 0
+                    self._rendered[openmetrics] = b''.join(
+                        block[index] for name, block in zip(self._names, self._blocks)
+                        if name is not None)
+                body = self._rendered[openmetrics]
+                if openmetrics:
+                    body += b'# EOF\n'
+                self._encoded[key] = gzip.compress(body) if compress else body
+            return self._encoded[key]
+
+    def _render_block(self, slot):
+        """スロットのexposition行を (text形式, OpenMetrics形式) で生成"""
+        name = self._names[slot]
+        metric_type = self._types[slot]
+        help_text = f"Dynamic metric {self._ids[slot]} created from web interface"
+
+        children = self._children[slot]
+        if children is None:
+            samples = sample_lines(name, metric_type, (), self._values[slot],
+                                   self._counts[slot], self._buckets[slot])
+        else:
+            samples = children.render(name, metric_type)
+
+        if metric_type == 'counter':
+            # text形式は *_total をメトリクス名とし、OpenMetrics形式は *_total を除いた名前とする
+            base = name.removesuffix('_total')
+            return (
+                f"# HELP {base}_total {help_text}\n# TYPE {base}_total counter\n{samples}".encode('utf-8'),
+                f"# HELP {base} {help_text}\n# TYPE {base} counter\n{samples}".encode('utf-8'),
+            )
+
+        block = f"# HELP {name} {help_text}\n# TYPE {name} {metric_type}\n{samples}".encode('utf-8')
+        return (block, block)
+
+    def _rebuild(self):
+        # ロックを保持した状態で呼び出す
+        blocks = self._blocks
+        for slot, name in enumerate(self._names):
+            if name is None or blocks[slot] is not None:
+                continue
+            blocks[slot] = self._render_block(slot)
+
+        self._rendered = {}
+        self._rendered_version = self._version
+        self._encoded.clear()
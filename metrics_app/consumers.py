@@ -1,8 +1,33 @@
+import asyncio
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
+from .sendqueue import ClientSendQueue
+from .sync import metric_sync_coalescer
+from .instrumentation import WEBSOCKET_CLIENTS, WEBSOCKET_MESSAGES
+from .protocol import BINARY_SUBPROTOCOL, pack_values, unpack_values, valid_metric_id
+
+def parse_metric_id(value):
+    """クライアントから受信したメトリクスIDを整数に変換（不正な値・uint32の範囲外はNone）"""
+    if isinstance(value, bool):
+        return None
+    try:
+        metric_id = int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return metric_id if valid_metric_id(metric_id) else None
 
 class WebhookConsumer(AsyncWebsocketConsumer):
     async def connect(self):
+        # バイナリサブプロトコルが指定された場合、メトリクス値はバイナリフレームで送受信する
+        # （名前は変更時のみ metric_names としてJSONで送る）
+        self.binary = BINARY_SUBPROTOCOL in self.scope.get('subprotocols', [])
+        self.sent_names = {}        # クライアントに送信済みの名前: メトリクスID -> (元の名前, Prometheus名)
+        self.received_names = {}    # クライアントから受信した名前: メトリクスID -> (元の名前, Prometheus名)
+        # グループからのイベントはキューに入れるだけにし、送信はライタータスクが行う
+        # （送信が遅いクライアントでもチャネルレイヤーからの受信が滞らない）
+        self.queue = ClientSendQueue()
+        self.writer = None
+
         # WebSocketクライアントをwebhook_messagesグループに追加
         await self.channel_layer.group_add(
             "webhook_messages",
@@ -13,9 +38,14 @@ class WebhookConsumer(AsyncWebsocketConsumer):
             "metrics_sync",
             self.channel_name
         )
-        await self.accept()
+        await self.accept(subprotocol=BINARY_SUBPROTOCOL if self.binary else None)
+        self.writer = asyncio.get_running_loop().create_task(self.write_loop())
+        WEBSOCKET_CLIENTS.inc()
 
     async def disconnect(self, close_code):
+        WEBSOCKET_CLIENTS.dec()
+        if self.writer is not None:
+            self.writer.cancel()
         # WebSocketクライアントをwebhook_messagesグループから削除
         await self.channel_layer.group_discard(
             "webhook_messages",
@@ -27,58 +57,193 @@ class WebhookConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         # クライアントからのメッセージを受信
+        WEBSOCKET_MESSAGES.labels(type(self).__name__, 'in').inc()
+        if bytes_data is not None:
+            await self.receive_values(bytes_data)
+            return
         try:
             text_data_json = json.loads(text_data)
-            message_type = text_data_json.get('type')
-            
-            if message_type == 'metric_update':
-                # スライダー値の更新をグループの他のクライアントに送信
-                metric_id = text_data_json.get('metric_id')
-                metric_name = text_data_json.get('metric_name')
-                prometheus_name = text_data_json.get('prometheus_name')
-                metric_value = text_data_json.get('metric_value')
-                
-                await self.channel_layer.group_send(
-                    "metrics_sync",
-                    {
-                        "type": "metric_sync",
-                        "metric_id": metric_id,
-                        "metric_name": metric_name,
-                        "prometheus_name": prometheus_name,
-                        "metric_value": metric_value,
-                        "sender_channel": self.channel_name
-                    }
-                )
         except json.JSONDecodeError:
             # 無効なJSONの場合は無視
-            pass
+            return
+        if not isinstance(text_data_json, dict):
+            # オブジェクト以外のフレームは無視
+            return
+        message_type = text_data_json.get('type')
+        
+        if message_type == 'metric_update':
+            # スライダー値の更新をグループの他のクライアントに送信
+            # （ティック単位でまとめて送信される）
+            metric_id = parse_metric_id(text_data_json.get('metric_id'))
+            if metric_id is None:
+                # メトリクスIDが不正なフレームは無視
+                return
+            metric_name = text_data_json.get('metric_name')
+            prometheus_name = text_data_json.get('prometheus_name')
+            metric_value = text_data_json.get('metric_value')
+            
+            await metric_sync_coalescer.submit({
+                "metric_id": metric_id,
+                "metric_name": metric_name,
+                "prometheus_name": prometheus_name,
+                "metric_value": metric_value,
+                "sender_channel": self.channel_name
+            })
+        elif message_type == 'metric_names':
+            # 以降のバイナリフレームで使う名前を記録
+            metrics = text_data_json.get('metrics')
+            for metric in metrics if isinstance(metrics, list) else []:
+                metric_id = parse_metric_id(metric.get('metric_id')) if isinstance(metric, dict) else None
+                if metric_id is None:
+                    continue
+                self.received_names[metric_id] = (
+                    metric.get('metric_name'), metric.get('prometheus_name'))
+
+    async def receive_values(self, bytes_data):
+        """バイナリフレームで受信したメトリクス値を同期"""
+        try:
+            updates = unpack_values(bytes_data)
+        except ValueError:
+            # 不正な長さのフレームは無視
+            return
+        for metric_id, metric_value in updates:
+            # 名前が通知されていないメトリクスは無視
+            names = self.received_names.get(metric_id)
+            if names is None:
+                continue
+            await metric_sync_coalescer.submit({
+                "metric_id": metric_id,
+                "metric_name": names[0],
+                "prometheus_name": names[1],
+                "metric_value": metric_value,
+                "sender_channel": self.channel_name
+            })
+
+    def metrics_frames(self, metrics):
+        """メトリクス値をクライアントのプロトコルに合わせた送信フレームのリストに変換"""
+        if not self.binary:
+            return [{'text_data': json.dumps({
+                'type': 'metric_sync_batch',
+                'metrics': metrics
+            })}]
+
+        names, updates = [], []
+        for metric in metrics:
+            # バイナリフレームに格納できないIDは送信しない
+            metric_id = metric.get('metric_id')
+            if not valid_metric_id(metric_id):
+                continue
+            try:
+                metric_value = float(metric['metric_value'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            metric_names = (metric.get('metric_name'), metric.get('prometheus_name'))
+            if self.sent_names.get(metric_id) != metric_names:
+                self.sent_names[metric_id] = metric_names
+                names.append({
+                    'metric_id': metric_id,
+                    'metric_name': metric_names[0],
+                    'prometheus_name': metric_names[1]
+                })
+            updates.append((metric_id, metric_value))
 
-    # グループからのwebhookメッセージを受信してクライアントに送信
+        # 名前は初回と変更時のみ送り、値はまとめて1フレームで送る
+        frames = []
+        if names:
+            frames.append({'text_data': json.dumps({
+                'type': 'metric_names',
+                'metrics': names
+            })})
+        if updates:
+            frames.append({'bytes_data': pack_values(updates)})
+        return frames
+
+    def batch_frames(self, messages, count, metrics_update, metrics):
+        """送信キューから取り出した分を送信フレームのリストに変換"""
+        frames = []
+        # webhookメッセージが複数溜まっていれば webhook_batch として1フレームで送る
+        if len(messages) == 1 and count == 1:
+            frames.append({'text_data': json.dumps({
+                'type': 'webhook_message',
+                'message': messages[0]
+            })})
+        elif messages:
+            frames.append({'text_data': json.dumps({
+                'type': 'webhook_batch',
+                'count': count,
+                'messages': messages
+            })})
+        if metrics_update:
+            frames.append({'text_data': json.dumps({
+                'type': 'metrics_update'
+            })})
+        if metrics:
+            frames += self.metrics_frames(metrics)
+        return frames
+
+    async def send(self, *args, **kwargs):
+        # クライアントへの送信数を計測
+        WEBSOCKET_MESSAGES.labels(type(self).__name__, 'out').inc()
+        await super().send(*args, **kwargs)
+
+    async def write_loop(self):
+        """送信キューに溜まった分をまとめてクライアントに送信するライタータスク
+
+        変換できない内容を含む分は記録して読み飛ばし、送信を続ける。
+        送信自体に失敗した場合のみ接続を閉じて終了する。
+        """
+        while True:
+            batch = await self.queue.get()
+            try:
+                frames = self.batch_frames(*batch)
+            except Exception as e:
+                print(f"Error encoding WebSocket messages: {e}")
+                continue
+            try:
+                for frame in frames:
+                    await self.send(**frame)
+            except Exception as e:
+                print(f"Error sending to WebSocket client: {e}")
+                try:
+                    await self.close()
+                except Exception:
+                    pass
+                return
+
+    # グループからのwebhookメッセージを受信して送信キューに追加
     async def webhook_message(self, event):
-        message = event['message']
-        
-        # WebSocketクライアントにメッセージを送信
-        await self.send(text_data=json.dumps({
-            'type': 'webhook_message',
-            'message': message
-        }))
+        self.queue.put_messages([event['message']])
 
-    # グループからのメトリクス同期メッセージを受信してクライアントに送信
+    # 一括webhookの通知を受信して送信キューに追加（最新の一部のメッセージと件数）
+    async def webhook_batch(self, event):
+        self.queue.put_messages(event['messages'], event['count'])
+
+    # グループからのメトリクス同期メッセージを受信して送信キューに追加
     async def metric_sync(self, event):
         # 送信者と同じクライアントには送信しない
         if event.get('sender_channel') != self.channel_name:
-            await self.send(text_data=json.dumps({
-                'type': 'metric_sync',
+            self.queue.put_metrics([{
                 'metric_id': event.get('metric_id'),
                 'metric_name': event['metric_name'],
                 'prometheus_name': event.get('prometheus_name'),
                 'metric_value': event['metric_value']
-            }))
+            }])
+
+    # 一括更新されたメトリクス値を送信キューに追加（ライタータスクが1フレームで送信する）
+    async def metric_sync_batch(self, event):
+        if event.get('sender_channel') == self.channel_name:
+            return
+        # 自分が送信者の更新は除外する
+        metrics = [
+            {key: value for key, value in metric.items() if key != 'sender_channel'}
+            for metric in event['metrics']
+            if metric.get('sender_channel') != self.channel_name
+        ]
+        if metrics:
+            self.queue.put_metrics(metrics)
 
-    # メトリクス一覧の更新通知を受信してクライアントに送信
+    # メトリクス一覧の更新通知を受信して送信キューに追加
     async def metrics_update(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'metrics_update'
-        }))
+        self.queue.put_metrics_update()
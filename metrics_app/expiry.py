@@ -0,0 +1,177 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from django.conf import settings
+from channels.layers import get_channel_layer
+from .instrumentation import timed_group_send
+
+
+class MetricExpiry:
+    """メトリクスの最終更新時刻とTTLを管理
+
+    最終更新時刻は古い順に OrderedDict で保持し、更新のたびに末尾へ移動する（O(1)）。
+    先頭から取り出せば最も長く更新されていないメトリクス（LRU）が得られる。
+
+    TTLを持つメトリクスは期限のヒープで管理する。更新のたびにヒープを書き換える代わりに、
+    期限が来た要素を取り出したときに最終更新時刻から期限を計算し直し、
+    まだ期限前であれば新しい期限で入れ直す。
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._last_updated = OrderedDict()  # メトリクスID -> 最終更新時刻（古い順）
+        self._ttls = {}                     # メトリクスID -> TTL（秒）
+        self._deadlines = []                # (期限, メトリクスID) のヒープ
+
+    def __len__(self):
+        return len(self._last_updated)
+
+    def __contains__(self, metric_id):
+        return metric_id in self._last_updated
+
+    @property
+    def has_ttl(self):
+        return bool(self._ttls)
+
+    def ttl(self, metric_id):
+        return self._ttls.get(metric_id)
+
+    def track(self, metric_id, ttl=None):
+        """メトリクスの追跡を開始（ttlはNoneなら期限なし）"""
+        now = self.clock()
+        self._last_updated[metric_id] = now
+        self._last_updated.move_to_end(metric_id)
+        if ttl is None:
+            self._ttls.pop(metric_id, None)
+            return
+        self._ttls[metric_id] = ttl
+        heapq.heappush(self._deadlines, (now + ttl, metric_id))
+
+    def touch(self, metric_id):
+        """メトリクスが更新されたことを記録"""
+        if metric_id in self._last_updated:
+            self._last_updated[metric_id] = self.clock()
+            self._last_updated.move_to_end(metric_id)
+
+    def forget(self, metric_id):
+        """メトリクスの追跡を終了（ヒープに残った要素は取り出したときに読み飛ばす）"""
+        self._last_updated.pop(metric_id, None)
+        self._ttls.pop(metric_id, None)
+
+    def pop_expired(self, limit):
+        """TTLを過ぎたメトリクスIDを最大limit件取り出す"""
+        now = self.clock()
+        expired = []
+        while self._deadlines and len(expired) < limit and self._deadlines[0][0] <= now:
+            _, metric_id = heapq.heappop(self._deadlines)
+            ttl = self._ttls.get(metric_id)
+            if ttl is None:
+                continue
+            deadline = self._last_updated[metric_id] + ttl
+            if deadline <= now:
+                expired.append(metric_id)
+                self.forget(metric_id)
+            else:
+                heapq.heappush(self._deadlines, (deadline, metric_id))
+        return expired
+
+    def pop_least_recent(self, limit):
+        """最も長く更新されていないメトリクスIDを最大limit件取り出す"""
+        victims = list(itertools.islice(self._last_updated, limit))
+        for metric_id in victims:
+            self.forget(metric_id)
+        return victims
+
+
+class MetricSweeper:
+    """期限切れ・系列数の上限超過となったメトリクスを少しずつ削除するasyncioタスク
+
+    1回に削除するのは最大 METRICS_SWEEP_BATCH 件で、残りがあればイベントループに
+    制御を返してから続ける。スクレイプ（/metrics）では削除処理を行わない。
+    1回の掃除で削除したメトリクスがあれば metrics_update を1回だけ送信する。
+
+    series_count は全体の系列数、metric_series_count はメトリクスごとの系列数を返す
+    （ラベル付きメトリクスは子の数だけ系列を持つ）。
+    """
+
+    def __init__(self, expiry, series_count, evict, metric_series_count, group="metrics_sync"):
+        self.expiry = expiry
+        self.series_count = series_count
+        self.evict = evict
+        self.metric_series_count = metric_series_count
+        self.group = group
+        self._task = None
+
+    @property
+    def interval(self):
+        return getattr(settings, 'METRICS_SWEEP_INTERVAL', 1.0)
+
+    @property
+    def batch(self):
+        return getattr(settings, 'METRICS_SWEEP_BATCH', 1000)
+
+    @property
+    def max_series(self):
+        return getattr(settings, 'METRICS_MAX_SERIES', None)
+
+    @property
+    def needed(self):
+        return self.expiry.has_ttl or self.max_series is not None
+
+    def wake(self):
+        """掃除が必要であればタスクを開始（イベントループの外では何もしない）"""
+        if not self.needed:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    def sweep_once(self):
+        """最大batch件のメトリクスを削除し、削除した件数を返す"""
+        evicted = self.evict(self.expiry.pop_expired(self.batch))
+
+        # 系列数が上限を超えている場合は最も長く更新されていないものから削除する
+        # （超過分は系列数で数えるため、削除対象ごとの系列数を差し引いて必要な分だけ選ぶ）
+        max_series = self.max_series
+        while max_series is not None and evicted < self.batch:
+            overflow = self.series_count() - max_series
+            if overflow <= 0:
+                break
+            victims = []
+            while overflow > 0 and evicted + len(victims) < self.batch:
+                victim = self.expiry.pop_least_recent(1)
+                if not victim:
+                    break
+                victims += victim
+                overflow -= self.metric_series_count(victim[0])
+            if not victims:
+                break
+            evicted += self.evict(victims)
+        return evicted
+
+    async def sweep(self):
+        """上限を超えなくなるまで少しずつ削除し、削除した件数を返す"""
+        evicted = 0
+        while True:
+            count = self.sweep_once()
+            evicted += count
+            if count < self.batch:
+                break
+            await asyncio.sleep(0)
+
+        if evicted:
+            await timed_group_send(get_channel_layer(), self.group, {"type": "metrics_update"})
+        return evicted
+
+    async def _run(self):
+        while self.needed:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"Error sweeping metrics: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,177 @@
+import asyncio
+import math
+import random
+from django.conf import settings
+from channels.layers import get_channel_layer
+from .instrumentation import timed_group_send
+
+
+def check_period(period):
+    """周期（秒）が正の有限値か検証"""
+    if not (math.isfinite(period) and period > 0):
+        raise ValueError(f"period must be positive: {period}")
+    return period
+
+
+def check_range(low, high, low_name='min', high_name='max'):
+    """範囲の下限・上限が有限値で low <= high か検証"""
+    if not (math.isfinite(low) and math.isfinite(high)):
+        raise ValueError(f"{low_name} and {high_name} must be finite")
+    if low > high:
+        raise ValueError(f"{low_name} must not be greater than {high_name}: {low} > {high}")
+
+
+class SineGenerator:
+    """正弦波"""
+
+    def __init__(self, amplitude=50.0, period=60.0, offset=50.0):
+        self.amplitude = float(amplitude)
+        self.period = check_period(float(period))
+        self.offset = float(offset)
+
+    def value(self, elapsed, dt):
+        return self.offset + self.amplitude * math.sin(2 * math.pi * elapsed / self.period)
+
+
+class SawtoothGenerator:
+    """のこぎり波（minからmaxまで増加して戻る）"""
+
+    def __init__(self, min=0.0, max=100.0, period=60.0):
+        self.min = float(min)
+        self.max = float(max)
+        self.period = check_period(float(period))
+        check_range(self.min, self.max)
+
+    def value(self, elapsed, dt):
+        return self.min + (self.max - self.min) * ((elapsed / self.period) % 1.0)
+
+
+class RandomWalkGenerator:
+    """ランダムウォーク（min〜maxの範囲に制限）"""
+
+    def __init__(self, start=50.0, step=1.0, min=0.0, max=100.0):
+        self.current = float(start)
+        self.step = float(step)
+        self.min = float(min)
+        self.max = float(max)
+        check_range(self.min, self.max)
+        if not self.step >= 0:
+            raise ValueError(f"step must not be negative: {self.step}")
+
+    def value(self, elapsed, dt):
+        self.current += random.uniform(-self.step, self.step)
+        self.current = min(max(self.current, self.min), self.max)
+        return self.current
+
+
+class StepGenerator:
+    """一定周期でlowとhighを切り替えるステップ波形"""
+
+    def __init__(self, low=0.0, high=100.0, period=60.0):
+        self.low = float(low)
+        self.high = float(high)
+        self.period = check_period(float(period))
+        check_range(self.low, self.high, 'low', 'high')
+
+    def value(self, elapsed, dt):
+        return self.high if int(elapsed / self.period) % 2 else self.low
+
+
+class PoissonSpikeGenerator:
+    """ポアソン過程で発生するスパイク（rateは1秒あたりの平均発生回数）"""
+
+    def __init__(self, rate=0.1, base=0.0, height=100.0):
+        self.rate = float(rate)
+        if not (math.isfinite(self.rate) and self.rate >= 0):
+            raise ValueError(f"rate must not be negative: {self.rate}")
+        self.base = float(base)
+        self.height = float(height)
+
+    def value(self, elapsed, dt):
+        # dt秒の間に1回以上スパイクが発生する確率
+        if random.random() < 1.0 - math.exp(-self.rate * dt):
+            return self.base + self.height
+        return self.base
+
+
+GENERATOR_TYPES = {
+    'sine': SineGenerator,
+    'sawtooth': SawtoothGenerator,
+    'random_walk': RandomWalkGenerator,
+    'step': StepGenerator,
+    'poisson_spike': PoissonSpikeGenerator,
+}
+
+
+def create_generator(generator_type, params=None):
+    """種類とパラメータから値ジェネレーターを作成"""
+    if generator_type not in GENERATOR_TYPES:
+        raise ValueError(f"Unknown generator type: {generator_type}")
+    try:
+        return GENERATOR_TYPES[generator_type](**(params or {}))
+    except TypeError as e:
+        raise ValueError(f"Invalid generator params: {e}")
+
+
+class GeneratorScheduler:
+    """全ての値ジェネレーターを1つのasyncioタスクで駆動するスケジューラー
+
+    ティックごとに全ジェネレーターの値をまとめて計算し、apply に一括で渡す。
+    apply は反映したメトリクス情報のリストを返し、それを metric_sync_batch として
+    1回だけ送信する。
+    """
+
+    def __init__(self, apply, group="metrics_sync"):
+        self.apply = apply
+        self.group = group
+        self._generators = {}   # メトリクスID -> (ジェネレーター, 開始時刻)
+        self._task = None
+
+    @property
+    def interval(self):
+        return 1.0 / getattr(settings, 'METRICS_GENERATOR_TICK_HZ', 10)
+
+    def attach(self, metric_id, generator):
+        """メトリクスにジェネレーターを設定（既存のものは置き換える）"""
+        loop = asyncio.get_running_loop()
+        self._generators[metric_id] = (generator, loop.time())
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    def detach(self, metric_id):
+        """メトリクスからジェネレーターを解除"""
+        return self._generators.pop(metric_id, None) is not None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        channel_layer = get_channel_layer()
+        next_tick = last_tick = loop.time()
+
+        while self._generators:
+            now = loop.time()
+            dt = now - last_tick
+            last_tick = now
+
+            values = {}
+            for metric_id, (generator, started_at) in list(self._generators.items()):
+                try:
+                    values[metric_id] = generator.value(now - started_at, dt)
+                except Exception as e:
+                    # 失敗したジェネレーターのみ解除し、他のジェネレーターは動かし続ける
+                    print(f"Error in generator for metric {metric_id}: {e}")
+                    self.detach(metric_id)
+            synced = self.apply(values)
+            if synced:
+                await timed_group_send(
+                    channel_layer,
+                    self.group,
+                    {
+                        "type": "metric_sync_batch",
+                        "metrics": synced,
+                        "sender_channel": None  # サーバーからの更新
+                    }
+                )
+
+            # 処理時間に関わらず一定間隔でティックする（遅延時は追いつこうとしない）
+            next_tick = max(next_tick + self.interval, loop.time())
+            await asyncio.sleep(next_tick - loop.time())
@@ -0,0 +1,94 @@
+import codecs
+import json
+
+# 一度に読み込むバイト数
+READ_CHUNK_SIZE = 64 * 1024
+
+# NDJSONとして扱うContent-Type
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+# 配列の要素の直後に来る文字
+_DELIMITERS = _WHITESPACE + ',]'
+
+
+def iter_ndjson(stream):
+    """NDJSONを1行ずつ読み込み、各行のJSONを順に返す（空行は無視）"""
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Invalid JSON on line {number}: {e.msg}') from None
+
+
+def iter_json_array(stream, chunk_size=READ_CHUNK_SIZE):
+    """JSON配列を少しずつ読み込み、要素を順に返す
+
+    本文全体を一度にデコードせず、読み込んだ分だけ raw_decode で要素を取り出す。
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer, pos, eof = '', 0, False
+
+    def fill():
+        # 未処理の部分を残して次のチャンクを追加
+        nonlocal buffer, pos, eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + decoder.decode(chunk, final=eof)
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    skip_whitespace()
+    if buffer[pos:pos + 1] != '[':
+        raise ValueError('Body must be a JSON array')
+    pos += 1
+
+    expect_value = True     # 次に要素が来るか（カンマの直後・配列の先頭）
+    first = True
+    while True:
+        skip_whitespace()
+        if pos >= len(buffer):
+            raise ValueError('Unexpected end of JSON array')
+        char = buffer[pos]
+        if char == ']' and (first or not expect_value):
+            pos += 1
+            skip_whitespace()
+            if pos < len(buffer):
+                raise ValueError(f'Extra data after JSON array at position {pos}')
+            return
+        if char == ',' and not expect_value:
+            pos += 1
+            expect_value = True
+            continue
+        if not expect_value:
+            raise ValueError(f'Expected "," or "]" at position {pos}')
+
+        # 要素が途中で切れている場合や、直後に区切り文字がなく数値の途中で
+        # 切れている可能性がある場合（"1.5e" など）は続きを読んでからやり直す
+        while True:
+            try:
+                value, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ValueError(f'Invalid JSON array element: {e.msg}') from None
+                fill()
+                continue
+            if not eof and (end == len(buffer) or buffer[end] not in _DELIMITERS):
+                fill()
+                continue
+            break
+        pos = end
+        yield value
+        expect_value = False
+        first = False
@@ -0,0 +1,74 @@
+import functools
+import time
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+
+# エクスポーター自身の計測用レジストリ（モックのメトリクスとは分けて公開する）
+INTERNAL_REGISTRY = CollectorRegistry()
+
+METRICS_RENDER_SECONDS = Histogram(
+    'mock_exporter_metrics_render_seconds',
+    'Time spent rendering the /metrics exposition',
+    registry=INTERNAL_REGISTRY)
+
+METRICS_PAYLOAD_BYTES = Histogram(
+    'mock_exporter_metrics_payload_bytes',
+    'Size of the /metrics response body',
+    buckets=(1e3, 1e4, 1e5, 1e6, 1e7, 1e8),
+    registry=INTERNAL_REGISTRY)
+
+VIEW_SECONDS = Histogram(
+    'mock_exporter_view_duration_seconds',
+    'Time spent handling a request',
+    ['view'],
+    registry=INTERNAL_REGISTRY)
+
+GROUP_SEND_SECONDS = Histogram(
+    'mock_exporter_group_send_seconds',
+    'Time spent in channel layer group_send',
+    ['group'],
+    registry=INTERNAL_REGISTRY)
+
+WEBSOCKET_MESSAGES = Counter(
+    'mock_exporter_websocket_messages_total',
+    'WebSocket messages handled by consumers',
+    ['consumer', 'direction'],
+    registry=INTERNAL_REGISTRY)
+
+WEBSOCKET_QUEUE_DISCARDED = Counter(
+    'mock_exporter_websocket_send_queue_discarded_total',
+    'Messages discarded from per-connection WebSocket send queues',
+    ['reason'],
+    registry=INTERNAL_REGISTRY)
+
+WEBSOCKET_CLIENTS = Gauge(
+    'mock_exporter_websocket_clients',
+    'Number of connected WebSocket clients',
+    registry=INTERNAL_REGISTRY)
+
+WEBHOOK_BUFFER_DEPTH = Gauge(
+    'mock_exporter_webhook_buffer_depth',
+    'Number of webhook messages held in the buffer',
+    registry=INTERNAL_REGISTRY)
+
+
+def timed_view(name):
+    """非同期ビューの処理時間を計測するデコレーター"""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                VIEW_SECONDS.labels(name).observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+async def timed_group_send(channel_layer, group, message):
+    """group_sendの所要時間を計測して送信"""
+    started = time.perf_counter()
+    try:
+        await channel_layer.group_send(group, message)
+    finally:
+        GROUP_SEND_SECONDS.labels(group).observe(time.perf_counter() - started)
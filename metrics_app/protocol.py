@@ -0,0 +1,27 @@
+import struct
+
+# バイナリのメトリクス同期を使う場合にクライアントが指定するサブプロトコル
+BINARY_SUBPROTOCOL = 'mock-exporter.binary.v1'
+
+# バイナリフレームの1要素: メトリクスID, 値（1フレームに複数並べて一括送信する）
+VALUE_UPDATE = struct.Struct('<Id')
+
+# バイナリフレームで扱えるメトリクスIDの上限（uint32）
+MAX_METRIC_ID = 2 ** 32 - 1
+
+
+def valid_metric_id(metric_id):
+    """バイナリフレームに格納できるメトリクスIDか"""
+    return isinstance(metric_id, int) and not isinstance(metric_id, bool) and 0 <= metric_id <= MAX_METRIC_ID
+
+
+def pack_values(updates):
+    """(メトリクスID, 値) のリストをバイナリフレームに変換"""
+    return b''.join(VALUE_UPDATE.pack(metric_id, value) for metric_id, value in updates)
+
+
+def unpack_values(data):
+    """バイナリフレームを (メトリクスID, 値) のリストに変換"""
+    if len(data) % VALUE_UPDATE.size:
+        raise ValueError('Invalid frame length')
+    return list(VALUE_UPDATE.iter_unpack(data))
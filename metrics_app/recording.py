@@ -0,0 +1,206 @@
+import asyncio
+import mmap
+import os
+import struct
+import time
+from django.conf import settings
+from channels.layers import get_channel_layer
+from .instrumentation import timed_group_send
+
+# ファイル先頭のマジックナンバー
+RECORDING_MAGIC = b'MXREC1\n'
+
+# 名前レコード: 種別, 記録時のメトリクスID, 名前のバイト長（この後に名前が続く）
+NAME_RECORD = struct.Struct('<cIH')
+# 値レコード: 種別, 記録開始からの経過秒数, 記録時のメトリクスID, 値
+VALUE_RECORD = struct.Struct('<cdId')
+
+NAME_TYPE = b'N'
+VALUE_TYPE = b'V'
+
+# 再生が遅れている場合でもこの件数ごとにイベントループへ制御を返す
+REPLAY_YIELD_RECORDS = 1000
+
+
+def recording_path(file_name):
+    """記録ファイル名をMETRICS_RECORDING_DIR配下のパスに変換"""
+    if not file_name or os.path.basename(file_name) != file_name:
+        raise ValueError(f"Invalid recording name: {file_name}")
+    return os.path.join(settings.METRICS_RECORDING_DIR, file_name)
+
+
+class MetricRecorder:
+    """メトリクス値の変更をバイナリ形式で追記するレコーダー
+
+    メトリクスごとに最初の1回（および名前変更時）だけ名前レコードを書き、
+    以降は固定長の値レコードのみを追記する。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 既存の記録を上書きしないよう新規ファイルとして作成する
+        self._file = open(path, 'xb')
+        self._file.write(RECORDING_MAGIC)
+        self._started_at = time.monotonic()
+        self._names = {}    # メトリクスID -> 記録済みの名前
+        self.count = 0
+
+    def record(self, metric_id, prometheus_name, value):
+        """値の変更を1件記録"""
+        if self._names.get(metric_id) != prometheus_name:
+            encoded = prometheus_name.encode('utf-8')
+            self._file.write(NAME_RECORD.pack(NAME_TYPE, metric_id, len(encoded)) + encoded)
+            self._names[metric_id] = prometheus_name
+        self._file.write(VALUE_RECORD.pack(
+            VALUE_TYPE, time.monotonic() - self._started_at, metric_id, value))
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+def read_records(path):
+    """記録ファイルをmmapで開き、レコードを順に返すジェネレーター
+
+    ファイル全体を読み込まないため、大きな記録でもメモリ使用量は一定。
+    末尾の書きかけレコードは無視する。
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < len(RECORDING_MAGIC):
+            raise ValueError('Invalid recording file')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(RECORDING_MAGIC)] != RECORDING_MAGIC:
+                raise ValueError('Invalid recording file')
+
+            offset = len(RECORDING_MAGIC)
+            while offset < size:
+                record_type = data[offset:offset + 1]
+                if record_type == NAME_TYPE:
+                    if offset + NAME_RECORD.size > size:
+                        break
+                    _, metric_id, length = NAME_RECORD.unpack_from(data, offset)
+                    offset += NAME_RECORD.size
+                    if offset + length > size:
+                        break
+                    yield NAME_TYPE, metric_id, data[offset:offset + length].decode('utf-8')
+                    offset += length
+                elif record_type == VALUE_TYPE:
+                    if offset + VALUE_RECORD.size > size:
+                        break
+                    _, elapsed, metric_id, value = VALUE_RECORD.unpack_from(data, offset)
+                    offset += VALUE_RECORD.size
+                    yield VALUE_TYPE, metric_id, (elapsed, value)
+                else:
+                    raise ValueError(f"Invalid record at offset {offset}")
+
+
+class MetricReplayer:
+    """記録ファイルを指定倍速で再生するクラス
+
+    resolve は記録時のPrometheus名から (現在のメトリクスID, 新規作成したか) を返すコルーチン関数で、
+    apply はメトリクスID -> 値の辞書を一括反映して同期用のメトリクス情報を返す。
+    ティック内に到達したレコードはまとめて反映される。
+    """
+
+    def __init__(self, path, resolve, apply, speed=1.0, group="metrics_sync"):
+        if speed <= 0:
+            raise ValueError('speed must be positive')
+        self.path = path
+        self.resolve = resolve
+        self.apply = apply
+        self.speed = float(speed)
+        self.group = group
+        self.count = 0
+        self._task = None
+
+    @property
+    def interval(self):
+        return 1.0 / getattr(settings, 'METRICS_GENERATOR_TICK_HZ', 10)
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        # 開始前にファイル形式を検証する
+        records = read_records(self.path)
+        next(records, None)
+        records.close()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self.running:
+            self._task.cancel()
+
+    async def _flush(self, channel_layer, pending, created):
+        if created:
+            # 再生のために作成したメトリクスを一覧に反映させる
+            await timed_group_send(channel_layer, self.group, {"type": "metrics_update"})
+        synced = self.apply(pending)
+        self.count += len(pending)
+        if synced:
+            await timed_group_send(
+                channel_layer,
+                self.group,
+                {
+                    "type": "metric_sync_batch",
+                    "metrics": synced,
+                    "sender_channel": None  # サーバーからの更新
+                }
+            )
+
+    async def _run(self):
+        try:
+            await self._replay()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error replaying {self.path}: {e}")
+            return
+        print(f"Replay finished: {self.path} ({self.count} updates)")
+
+    async def _replay(self):
+        loop = asyncio.get_running_loop()
+        channel_layer = get_channel_layer()
+        started_at = last_flush = loop.time()
+        metric_ids = {}     # 記録時のメトリクスID -> 現在のメトリクスID
+        pending = {}
+        created = False
+        processed = 0
+
+        for record_type, recorded_id, payload in read_records(self.path):
+            if record_type == NAME_TYPE:
+                metric_ids[recorded_id], is_new = await self.resolve(payload)
+                created = created or is_new
+                continue
+
+            elapsed, value = payload
+            delay = started_at + elapsed / self.speed - loop.time()
+            if delay > 0:
+                if pending:
+                    await self._flush(channel_layer, pending, created)
+                    pending = {}
+                    created = False
+                # 少なくとも1ティック待機して、その間のレコードをまとめる
+                await asyncio.sleep(max(delay, self.interval))
+                last_flush = loop.time()
+            else:
+                # 予定より遅れている（倍速が大きい）場合は待機しないため、
+                # 一定件数ごとに制御を返し、1ティック経過していればその間の分を反映する
+                processed += 1
+                if processed % REPLAY_YIELD_RECORDS == 0:
+                    if pending and loop.time() - last_flush >= self.interval:
+                        await self._flush(channel_layer, pending, created)
+                        pending = {}
+                        created = False
+                        last_flush = loop.time()
+                    await asyncio.sleep(0)
+
+            metric_id = metric_ids.get(recorded_id)
+            if metric_id is not None:
+                pending[metric_id] = value
+
+        if pending:
+            await self._flush(channel_layer, pending, created)
@@ -0,0 +1,66 @@
+import threading
+
+
+class MessageRingBuffer:
+    """固定容量のリングバッファ
+
+    追加されたメッセージには単調増加のシーケンス番号（seq）が振られる。
+    追加・取得開始位置の計算はいずれもO(1)で、容量を超えると古いものから上書きされる。
+    """
+
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError('capacity must be positive')
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._next_seq = 1      # 次に割り当てるシーケンス番号
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._next_seq - 1, self.capacity)
+
+    @property
+    def last_seq(self):
+        """最後に追加されたメッセージのシーケンス番号（空なら0）"""
+        return self._next_seq - 1
+
+    @property
+    def first_seq(self):
+        """保持している最も古いメッセージのシーケンス番号"""
+        return self._next_seq - len(self)
+
+    def append(self, message):
+        """メッセージを追加してシーケンス番号を返す"""
+        with self._lock:
+            seq = self._next_seq
+            self._items[seq % self.capacity] = dict(message, seq=seq)
+            self._next_seq += 1
+            return seq
+
+    def extend(self, messages):
+        """複数のメッセージをまとめて追加し、最後のシーケンス番号を返す"""
+        messages = list(messages)
+        with self._lock:
+            # 容量を超える分は追加してもすぐ上書きされるため番号だけ進める
+            skipped = max(0, len(messages) - self.capacity)
+            self._next_seq += skipped
+            for message in messages[skipped:]:
+                seq = self._next_seq
+                self._items[seq % self.capacity] = dict(message, seq=seq)
+                self._next_seq += 1
+            return self._next_seq - 1
+
+    def since(self, seq=0, limit=None):
+        """seqより新しいメッセージを古い順に最大limit件返す"""
+        with self._lock:
+            start = max(seq + 1, self.first_seq)
+            end = self._next_seq
+            if limit is not None:
+                end = min(end, start + limit)
+            return [self._items[i % self.capacity] for i in range(start, end)]
+
+    def latest(self, count):
+        """最新のメッセージを古い順に最大count件返す"""
+        with self._lock:
+            start = max(self._next_seq - count, self.first_seq)
+            return [self._items[i % self.capacity] for i in range(start, self._next_seq)]
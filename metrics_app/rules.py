@@ -0,0 +1,231 @@
+import itertools
+import re
+
+# ルールの動作: 抽出した値を設定する / 一致するたびに加算する
+RULE_ACTIONS = ('set', 'inc')
+
+# JSONパスの各要素（.key / ['key'] / [0]）
+_PATH_TOKEN = re.compile(r"""\.([A-Za-z_][A-Za-z0-9_-]*)|\[(\d+)\]|\['([^']*)'\]|\["([^"]*)"\]""")
+
+
+def compile_json_path(path):
+    """$.a.b[0] 形式のJSONパスをキー・インデックスのタプルに変換"""
+    if not isinstance(path, str) or not path.startswith('$'):
+        raise ValueError('json_path must start with "$"')
+    keys, pos = [], 1
+    while pos < len(path):
+        match = _PATH_TOKEN.match(path, pos)
+        if match is None:
+            raise ValueError(f'Invalid json_path: {path}')
+        name, index, quoted, double_quoted = match.groups()
+        if index is not None:
+            keys.append(int(index))
+        else:
+            keys.append(next(key for key in (name, quoted, double_quoted) if key is not None))
+        pos = match.end()
+    if not keys or not isinstance(keys[0], str):
+        raise ValueError('json_path must start with an object key')
+    return tuple(keys)
+
+
+def extract_json_path(data, keys):
+    """JSONパスの値を取得（存在しなければNone）"""
+    for key in keys:
+        try:
+            data = data[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return data
+
+
+def to_number(value):
+    """抽出した値を数値に変換（変換できなければNone）"""
+    if isinstance(value, bool):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class WebhookRule:
+    """webhookの内容からメトリクスを更新するルール
+
+    抽出方法は json_path（JSONオブジェクト向け）と regex（メッセージ文字列向け）のいずれか。
+    作成時に抽出方法をコンパイルしておき、評価時はパスの走査・正規表現の照合のみを行う。
+    """
+
+    def __init__(self, rule_id, spec):
+        if not isinstance(spec, dict):
+            raise ValueError('rule must be an object')
+        self.id = rule_id
+        self.metric_id = spec.get('metric_id')
+        self.prometheus_name = spec.get('prometheus_name')
+        if self.metric_id is None and self.prometheus_name is None:
+            raise ValueError('metric_id or prometheus_name is required')
+        if self.metric_id is not None:
+            self.metric_id = int(self.metric_id)
+
+        self.action = spec.get('action', 'set')
+        if self.action not in RULE_ACTIONS:
+            raise ValueError(f'Unknown action: {self.action}')
+        self.amount = float(spec.get('amount', 1))
+
+        self.json_path = spec.get('json_path')
+        self.regex = spec.get('regex')
+        if (self.json_path is None) == (self.regex is None):
+            raise ValueError('Exactly one of json_path or regex is required')
+
+        if self.json_path is not None:
+            self.content_type = 'json'
+            self.keys = compile_json_path(self.json_path)
+            # JSONオブジェクトの最上位のキーで候補を絞り込む
+            self.match_key = self.keys[0]
+        else:
+            self.content_type = 'text'
+            try:
+                self.pattern = re.compile(self.regex)
+            except re.error as e:
+                raise ValueError(f'Invalid regex: {e}') from None
+            if self.action == 'set' and self.pattern.groups < 1:
+                raise ValueError('regex for set action must have a capture group')
+            # メッセージに含まれる必要がある文字列（指定しない場合は常に照合する）
+            self.match_key = spec.get('keyword') or None
+            if self.match_key is not None and not isinstance(self.match_key, str):
+                raise ValueError('keyword must be a string')
+
+    @property
+    def target(self):
+        """更新対象のメトリクス (メトリクスID, Prometheus名)"""
+        return (self.metric_id, self.prometheus_name)
+
+    def evaluate(self, payload):
+        """ルールを適用し、設定値または加算値を返す（一致しなければNone）"""
+        if self.content_type == 'json':
+            value = extract_json_path(payload, self.keys)
+            if value is None:
+                return None
+            return self.amount if self.action == 'inc' else to_number(value)
+
+        if self.action == 'inc':
+            # メッセージ内で一致した回数だけ加算する
+            count = sum(1 for _ in self.pattern.finditer(payload))
+            return self.amount * count if count else None
+        match = self.pattern.search(payload)
+        if match is None:
+            return None
+        return to_number(match.group(1))
+
+    def to_dict(self):
+        spec = {
+            'rule_id': self.id,
+            'metric_id': self.metric_id,
+            'prometheus_name': self.prometheus_name,
+            'action': self.action,
+        }
+        if self.action == 'inc':
+            spec['amount'] = self.amount
+        if self.content_type == 'json':
+            spec['json_path'] = self.json_path
+        else:
+            spec['regex'] = self.regex
+            spec['keyword'] = self.match_key
+        return spec
+
+
+class WebhookRuleSet:
+    """webhookからメトリクスを更新するルールの集合
+
+    JSONパスのルールは最上位のキーごとに、正規表現のルールはキーワードごとに索引を作り、
+    各webhookは索引で絞り込んだ候補のルールとのみ照合する。
+    """
+
+    def __init__(self):
+        self._rules = {}            # ルールID -> ルール
+        self._ids = itertools.count(1)
+        self._json_index = {}       # 最上位のキー -> JSONパスのルール
+        self._keyword_index = {}    # キーワード -> 正規表現のルール
+        self._keyword_pattern = None
+        self._keyword_prefixes = {} # キーワード -> そのキーワードの先頭部分に一致する他のキーワード
+        self._text_rules = []       # キーワードのない正規表現のルール
+
+    def __len__(self):
+        return len(self._rules)
+
+    def add(self, spec):
+        """ルールを追加"""
+        rule = WebhookRule(next(self._ids), spec)
+        self._rules[rule.id] = rule
+        self._rebuild_index()
+        return rule
+
+    def remove(self, rule_id):
+        """ルールを削除"""
+        if self._rules.pop(rule_id, None) is None:
+            return False
+        self._rebuild_index()
+        return True
+
+    def clear(self):
+        self._rules.clear()
+        self._rebuild_index()
+
+    def rules(self):
+        return list(self._rules.values())
+
+    def _rebuild_index(self):
+        self._json_index, self._keyword_index, self._text_rules = {}, {}, []
+        for rule in self._rules.values():
+            if rule.content_type == 'json':
+                self._json_index.setdefault(rule.match_key, []).append(rule)
+            elif rule.match_key is not None:
+                self._keyword_index.setdefault(rule.match_key, []).append(rule)
+            else:
+                self._text_rules.append(rule)
+        # 全キーワードを1つの正規表現にまとめ、1回の走査で含まれるキーワードを求める
+        # （先読みにより重なり合うキーワードも見つかる。同じ位置では最長のもののみ一致するため、
+        # その先頭部分に一致する短いキーワードは _keyword_prefixes で補う）
+        keywords = sorted(self._keyword_index, key=len, reverse=True)
+        self._keyword_pattern = re.compile(
+            '(?=(' + '|'.join(re.escape(keyword) for keyword in keywords) + '))'
+        ) if keywords else None
+        self._keyword_prefixes = {
+            keyword: [other for other in keywords if other != keyword and keyword.startswith(other)]
+            for keyword in keywords
+        }
+
+    def candidates(self, data, text):
+        """webhookの内容に対して照合する候補のルールと対象を返す"""
+        if isinstance(data, dict) and self._json_index:
+            for key in data.keys() & self._json_index.keys():
+                for rule in self._json_index[key]:
+                    yield rule, data
+        if isinstance(text, str):
+            if self._keyword_pattern is not None:
+                found = set(self._keyword_pattern.findall(text))
+                for keyword in list(found):
+                    found.update(self._keyword_prefixes[keyword])
+                for keyword in found:
+                    for rule in self._keyword_index[keyword]:
+                        yield rule, text
+            for rule in self._text_rules:
+                yield rule, text
+
+    def evaluate(self, items):
+        """(JSONデータ, メッセージ文字列) のリストにルールを適用
+
+        (対象 -> 抽出した値のリスト, 対象 -> 加算値の合計) を返す。値はwebhookの順に並ぶ。
+        """
+        values, increments = {}, {}
+        if not self._rules:
+            return values, increments
+        for data, text in items:
+            for rule, payload in self.candidates(data, text):
+                result = rule.evaluate(payload)
+                if result is None:
+                    continue
+                if rule.action == 'inc':
+                    increments[rule.target] = increments.get(rule.target, 0.0) + result
+                else:
+                    values.setdefault(rule.target, []).append(result)
+        return values, increments
@@ -0,0 +1,79 @@
+import asyncio
+from collections import deque
+from django.conf import settings
+from .instrumentation import WEBSOCKET_QUEUE_DISCARDED
+
+
+class ClientSendQueue:
+    """WebSocketクライアントごとの上限付き送信キュー
+
+    メトリクス値はメトリクスIDごとに最新の値のみを保持する（古い値は上書きされる）。
+    webhookメッセージは上限を超えると古いものから捨てる。
+    メトリクス一覧の更新通知は何度届いても1回分のみ保持する。
+    ライタータスクは take() で溜まった分をまとめて取り出して送信するため、
+    送信が遅いクライアントがいてもグループへの配信は待たされない。
+    """
+
+    def __init__(self, max_messages=None):
+        if max_messages is None:
+            max_messages = getattr(settings, 'WEBSOCKET_SEND_QUEUE_SIZE', 100)
+        self._metrics = {}                              # メトリクスID -> 最新のメトリクス情報
+        self._messages = deque(maxlen=max_messages)     # webhookメッセージ（古い順）
+        self._webhook_count = 0                         # 捨てたものを含むwebhookの件数
+        self._metrics_update = False
+        self._ready = asyncio.Event()
+        self.dropped = 0
+        self.compacted = 0
+
+    def __len__(self):
+        return len(self._metrics) + len(self._messages) + self._metrics_update
+
+    def put_metrics(self, metrics):
+        """メトリクス値を追加（同じメトリクスの未送信の値は上書きする）"""
+        compacted = 0
+        for metric in metrics:
+            metric_id = metric.get('metric_id')
+            if metric_id in self._metrics:
+                compacted += 1
+            self._metrics[metric_id] = metric
+        if compacted:
+            self.compacted += compacted
+            WEBSOCKET_QUEUE_DISCARDED.labels('compacted').inc(compacted)
+        self._ready.set()
+
+    def put_messages(self, messages, count=None):
+        """webhookメッセージを追加（上限を超えた分は古いものから捨てる）
+
+        count は一括webhookで通知対象外のものを含めた件数。
+        """
+        messages = list(messages)
+        dropped = max(0, len(self._messages) + len(messages) - self._messages.maxlen)
+        self._messages.extend(messages)
+        self._webhook_count += len(messages) if count is None else count
+        if dropped:
+            self.dropped += dropped
+            WEBSOCKET_QUEUE_DISCARDED.labels('dropped').inc(dropped)
+        self._ready.set()
+
+    def put_metrics_update(self):
+        """メトリクス一覧の更新通知を追加（未送信の通知があれば1つにまとめる）"""
+        if self._metrics_update:
+            self.compacted += 1
+            WEBSOCKET_QUEUE_DISCARDED.labels('compacted').inc()
+        self._metrics_update = True
+        self._ready.set()
+
+    def take(self):
+        """溜まっている全てを (webhookメッセージ, webhookの件数, 一覧の更新通知の有無, メトリクス値) で取り出す"""
+        batch = (list(self._messages), self._webhook_count, self._metrics_update, list(self._metrics.values()))
+        self._messages.clear()
+        self._webhook_count = 0
+        self._metrics_update = False
+        self._metrics = {}
+        self._ready.clear()
+        return batch
+
+    async def get(self):
+        """送信するものが溜まるまで待って取り出す"""
+        await self._ready.wait()
+        return self.take()
@@ -0,0 +1,396 @@
+import asyncio
+import json
+import threading
+from collections import deque
+import redis
+import redis.asyncio
+
+# Redisキーの共通プレフィックス
+KEY_PREFIX = 'mock_exporter:'
+
+# 変更履歴として保持する件数（これより遅れたワーカーは全体を読み直す）
+CHANGES_SIZE = 10000
+
+# 変更履歴を読む際に余分に読む件数（バージョン取得後の他のワーカーの書き込み分）
+CHANGES_SLACK = 64
+
+# 一度に予約するメトリクスIDの件数
+METRIC_ID_BLOCK = 100
+
+# 書き込みに失敗した場合の再試行間隔（秒）の初期値と上限（失敗するたびに倍にする）
+FLUSH_RETRY_DELAY = 0.1
+FLUSH_RETRY_MAX_DELAY = 5.0
+
+# 選択中のメトリクスIDが未変更であることを表す値
+UNCHANGED = object()
+
+
+class SharedMetricState:
+    """複数ワーカー間でメトリクスの状態を共有するRedisバックエンド
+
+    各ワーカーはローカルのCollectorを複製として保持し、変更はRedisへ書き込む。
+    書き込みはバッファに溜め、イベントループ上ではasyncioタスクがredis.asyncioでまとめて書き込む
+    （イベントループ外からの呼び出しではその場で書き込む）。
+    書き込みごとに共有バージョンを進め、変更したメトリクスIDを変更履歴に追加する。
+    読み込み時はバージョンが変わっていれば変更履歴の差分を読み、変更されたメトリクスのみを取得する。
+    自分の書き込みだけで進んだ場合は読み直さない。
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._async_redis = None    # (イベントループ, redis.asyncioのクライアント)
+        self._version = None        # ローカルに反映済みのバージョン
+        self._lock = threading.Lock()
+        self._metrics = {}          # 未書き込みの定義: メトリクスID -> JSON（削除はNone）
+        self._values = {}           # 未書き込みの値: メトリクスID -> 値の文字列
+        self._current = UNCHANGED   # 未書き込みの選択中のメトリクスID
+        self._writing = None        # 書き込み中の変更
+        self._task = None
+        self._ids = deque()         # 予約済みのメトリクスID
+        self._reserving = None
+
+    def _key(self, name):
+        return KEY_PREFIX + name
+
+    def _async_client(self):
+        """実行中のイベントループ用のredis.asyncioクライアント"""
+        loop = asyncio.get_running_loop()
+        if self._async_redis is None or self._async_redis[0] is not loop:
+            self._async_redis = (loop, redis.asyncio.Redis.from_url(self.url, decode_responses=True))
+        return self._async_redis[1]
+
+    def next_metric_id(self):
+        """全ワーカーで一意なメトリクスIDを取得
+
+        IDは METRIC_ID_BLOCK 件ずつ予約し、イベントループ上では残りが半分を切った時点で
+        次の分を非同期に予約しておく。イベントループ上では先に ensure_metric_ids() を呼び出し、
+        その場での同期的な予約（イベントループ外からの呼び出しのみ）でループを止めないようにする。
+        """
+        if not self._ids:
+            self._add_ids(self._redis.incrby(self._key('metric_id_counter'), METRIC_ID_BLOCK))
+        metric_id = self._ids.popleft()
+        if len(self._ids) < METRIC_ID_BLOCK // 2:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return metric_id
+            if self._reserving is None or self._reserving.done() or self._reserving.get_loop() is not loop:
+                self._reserving = loop.create_task(self._reserve_ids())
+        return metric_id
+
+    async def ensure_metric_ids(self):
+        """予約済みのIDがなければredis.asyncioで予約する（イベントループ上で next_metric_id() の前に呼び出す）"""
+        if self._ids:
+            return
+        reserving = self._reserving
+        if reserving is not None and not reserving.done() and reserving.get_loop() is asyncio.get_running_loop():
+            await reserving
+        if not self._ids:
+            self._add_ids(await self._async_client().incrby(self._key('metric_id_counter'), METRIC_ID_BLOCK))
+
+    def _add_ids(self, last):
+        self._ids.extend(range(last - METRIC_ID_BLOCK + 1, last + 1))
+
+    async def _reserve_ids(self):
+        try:
+            self._add_ids(await self._async_client().incrby(self._key('metric_id_counter'), METRIC_ID_BLOCK))
+        except Exception as e:
+            print(f"Error reserving metric IDs: {e}")
+
+    def save_metric(self, metric_id, info, value):
+        """メトリクスの定義と値を保存"""
+        with self._lock:
+            self._metrics[metric_id] = json.dumps(info)
+            self._values[metric_id] = repr(float(value))
+        self._schedule()
+
+    def save_values(self, values):
+        """複数のメトリクス値をまとめて保存"""
+        if not values:
+            return
+        with self._lock:
+            for metric_id, value in values.items():
+                self._values[metric_id] = repr(float(value))
+        self._schedule()
+
+    def delete_metrics(self, metric_ids):
+        """メトリクスをまとめて削除"""
+        if not metric_ids:
+            return
+        with self._lock:
+            for metric_id in metric_ids:
+                self._metrics[metric_id] = None
+                self._values.pop(metric_id, None)
+        self._schedule()
+
+    def save_current_metric_id(self, metric_id):
+        """現在選択中のメトリクスIDを保存"""
+        with self._lock:
+            self._current = metric_id
+        self._schedule()
+
+    def _schedule(self):
+        """イベントループ上では書き込みタスクを開始し、それ以外ではその場で書き込む"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._flush_loop())
+            self._task.add_done_callback(self._flush_done)
+
+    def _take(self):
+        """未書き込みの変更を取り出す（なければNone）"""
+        with self._lock:
+            if not self._metrics and not self._values and self._current is UNCHANGED:
+                return None
+            batch = (self._metrics, self._values, self._current)
+            self._metrics, self._values, self._current = {}, {}, UNCHANGED
+            self._writing = batch
+            return batch
+
+    def _write_commands(self, pipe, batch):
+        """変更を書き込み、共有バージョンを進めるコマンドを追加"""
+        metrics, values, current = batch
+        saved = {metric_id: info for metric_id, info in metrics.items() if info is not None}
+        deleted = [metric_id for metric_id, info in metrics.items() if info is None]
+        if saved:
+            pipe.hset(self._key('metrics'), mapping=saved)
+        if values:
+            pipe.hset(self._key('values'), mapping=values)
+        if deleted:
+            pipe.hdel(self._key('metrics'), *deleted)
+            pipe.hdel(self._key('values'), *deleted)
+        if current is not UNCHANGED:
+            if current is None:
+                pipe.delete(self._key('current_metric_id'))
+            else:
+                pipe.set(self._key('current_metric_id'), current)
+        # 変更履歴の1件は1バージョン分（MULTIで同時に実行されるため件数とバージョンが対応する）
+        pipe.rpush(self._key('changes'), json.dumps(sorted(set(metrics) | set(values))))
+        pipe.ltrim(self._key('changes'), -CHANGES_SIZE, -1)
+        pipe.incr(self._key('version'))
+
+    def _committed(self, version):
+        self._writing = None
+        # 他のワーカーの変更を挟んでいなければ、読み直し不要
+        if self._version is not None and version == self._version + 1:
+            self._version = version
+
+    def flush(self):
+        """未書き込みの変更をその場で書き込む"""
+        batch = self._take()
+        if batch is None:
+            return
+        try:
+            pipe = self._redis.pipeline()
+            self._write_commands(pipe, batch)
+            self._committed(pipe.execute()[-1])
+        except Exception:
+            # 書き込めなかった変更は次の書き込みで再度書き込む
+            self._restore(batch)
+            raise
+
+    def _restore(self, batch):
+        """書き込めなかった変更を未書き込みの変更に戻す（その後の変更を優先する）"""
+        metrics, values, current = batch
+        with self._lock:
+            self._metrics = {**metrics, **self._metrics}
+            self._values = {**values, **self._values}
+            if self._current is UNCHANGED:
+                self._current = current
+            self._writing = None
+
+    async def _flush_loop(self):
+        delay = FLUSH_RETRY_DELAY
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            try:
+                pipe = self._async_client().pipeline()
+                self._write_commands(pipe, batch)
+                self._committed((await pipe.execute())[-1])
+                delay = FLUSH_RETRY_DELAY
+            except Exception as e:
+                # 書き込めなかった変更は未書き込みに戻し、間隔を空けて再試行する
+                # （待っている間の変更もまとめて書き込む）
+                self._restore(batch)
+                print(f"Error writing shared state (retrying in {delay}s): {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, FLUSH_RETRY_MAX_DELAY)
+
+    def _flush_done(self, task):
+        if task.cancelled():
+            # イベントループの終了時（リクエストごとにループを作る環境など）は残りをその場で書き込む
+            if self._writing is not None:
+                self._restore(self._writing)
+            self.flush()
+
+    def _read_changes_commands(self, pipe, version):
+        """前回の反映以降の変更履歴を読むコマンドを追加"""
+        pipe.get(self._key('version'))
+        if self._version is not None and 0 < version - self._version <= CHANGES_SIZE:
+            pipe.lrange(self._key('changes'), -(version - self._version + CHANGES_SLACK), -1)
+
+    def _changed_ids(self, results):
+        """(バージョン, 変更されたメトリクスID) を返す（全体を読み直す必要があればIDはNone）"""
+        version = int(results[0] or 0)
+        if len(results) < 2:
+            return version, None
+        count = version - self._version
+        if count <= 0 or count > len(results[1]):
+            # 変更履歴から溢れた分がある・Redisがリセットされた場合は全体を読み直す
+            return version, None
+        metric_ids = set()
+        for entry in results[1][-count:]:
+            metric_ids.update(json.loads(entry))
+        return version, sorted(metric_ids)
+
+    def _read_metrics_commands(self, pipe, metric_ids):
+        """変更されたメトリクス（metric_idsがNoneなら全て）を読むコマンドを追加"""
+        if metric_ids is None:
+            pipe.hgetall(self._key('metrics'))
+            pipe.hgetall(self._key('values'))
+        elif metric_ids:
+            pipe.hmget(self._key('metrics'), metric_ids)
+            pipe.hmget(self._key('values'), metric_ids)
+        pipe.get(self._key('current_metric_id'))
+        pipe.get(self._key('metric_id_counter'))
+
+    def _changes(self, version, metric_ids, results, known_ids):
+        """読み込んだ内容を (メトリクスID -> 定義と値（削除はNone）, 選択中のメトリクスID, IDカウンター) に変換"""
+        if metric_ids is None:
+            metrics = {int(metric_id): info for metric_id, info in results[0].items()}
+            values = {int(metric_id): value for metric_id, value in results[1].items()}
+            # ローカルにあってRedisにないメトリクスは他のワーカーで削除されたもの
+            changes = {metric_id: None for metric_id in known_ids if metric_id not in metrics}
+        elif metric_ids:
+            metrics = dict(zip(metric_ids, results[0]))
+            values = dict(zip(metric_ids, results[1]))
+            changes = {}
+        else:
+            metrics, values, changes = {}, {}, {}
+        current_metric_id, counter = results[-2:]
+
+        # 未書き込み・書き込み中の変更はローカルの方が新しいため上書きしない
+        with self._lock:
+            local = set(self._metrics) | set(self._values)
+            if self._writing is not None:
+                local.update(self._writing[0], self._writing[1])
+        for metric_id, info in metrics.items():
+            if metric_id in local:
+                continue
+            if info is None:
+                changes[metric_id] = None
+                continue
+            info = json.loads(info)
+            info['value'] = float(values.get(metric_id) or 0)
+            changes[metric_id] = info
+        for metric_id in local:
+            changes.pop(metric_id, None)
+
+        self._version = version
+        return (changes,
+                int(current_metric_id) if current_metric_id is not None else None,
+                int(counter or 0))
+
+    def load_if_changed(self, known_ids=()):
+        """前回の反映以降に変更があれば変更されたメトリクスを読み込む（変更がなければNone）
+
+        known_ids はローカルのメトリクスID（全体を読み直す場合に削除を検出するために使う）。
+        戻り値は (メトリクスID -> 定義と値（削除はNone）, 選択中のメトリクスID, IDカウンター)。
+        """
+        version = int(self._redis.get(self._key('version')) or 0)
+        if version == self._version:
+            return None
+        pipe = self._redis.pipeline()
+        self._read_changes_commands(pipe, version)
+        version, metric_ids = self._changed_ids(pipe.execute())
+        pipe = self._redis.pipeline()
+        self._read_metrics_commands(pipe, metric_ids)
+        return self._changes(version, metric_ids, pipe.execute(), known_ids)
+
+    async def aload_if_changed(self, known_ids=()):
+        """load_if_changed() のredis.asyncio版（イベントループを止めない）"""
+        client = self._async_client()
+        version = int(await client.get(self._key('version')) or 0)
+        if version == self._version:
+            return None
+        pipe = client.pipeline()
+        self._read_changes_commands(pipe, version)
+        version, metric_ids = self._changed_ids(await pipe.execute())
+        pipe = client.pipeline()
+        self._read_metrics_commands(pipe, metric_ids)
+        return self._changes(version, metric_ids, await pipe.execute(), known_ids)
+
+    def message_buffer(self, capacity):
+        """ワーカー間で共有するwebhookメッセージバッファを作成"""
+        return SharedMessageBuffer(self._redis, self._key('webhook_'), capacity)
+
+
+class SharedMessageBuffer:
+    """MessageRingBufferと同じインターフェースを持つRedis上のメッセージバッファ
+
+    メッセージはシーケンス番号をスコアとするソート済みセットに保存し、
+    容量を超えた分は古いものから削除する。
+    """
+
+    def __init__(self, client, prefix, capacity):
+        if capacity <= 0:
+            raise ValueError('capacity must be positive')
+        self.capacity = capacity
+        self._redis = client
+        self._seq_key = prefix + 'seq'
+        self._messages_key = prefix + 'messages'
+
+    def __len__(self):
+        return self._redis.zcard(self._messages_key)
+
+    @property
+    def last_seq(self):
+        return int(self._redis.get(self._seq_key) or 0)
+
+    @property
+    def first_seq(self):
+        oldest = self._redis.zrange(self._messages_key, 0, 0, withscores=True)
+        return int(oldest[0][1]) if oldest else self.last_seq + 1
+
+    def append(self, message):
+        seq = self._redis.incr(self._seq_key)
+        pipe = self._redis.pipeline()
+        pipe.zadd(self._messages_key, {json.dumps(dict(message, seq=seq)): seq})
+        pipe.zremrangebyrank(self._messages_key, 0, -self.capacity - 1)
+        pipe.execute()
+        return seq
+
+    def extend(self, messages):
+        messages = list(messages)
+        if not messages:
+            return self.last_seq
+        last_seq = self._redis.incrby(self._seq_key, len(messages))
+        first_seq = last_seq - len(messages) + 1
+        # 容量を超える分は書き込まずに番号だけ進める
+        skipped = max(0, len(messages) - self.capacity)
+        pipe = self._redis.pipeline()
+        pipe.zadd(self._messages_key, {
+            json.dumps(dict(message, seq=seq)): seq
+            for seq, message in enumerate(messages[skipped:], first_seq + skipped)
+        })
+        pipe.zremrangebyrank(self._messages_key, 0, -self.capacity - 1)
+        pipe.execute()
+        return last_seq
+
+    def since(self, seq=0, limit=None):
+        if limit is None:
+            items = self._redis.zrangebyscore(self._messages_key, f'({seq}', '+inf')
+        else:
+            items = self._redis.zrangebyscore(self._messages_key, f'({seq}', '+inf', start=0, num=limit)
+        return [json.loads(item) for item in items]
+
+    def latest(self, count):
+        if count <= 0:
+            return []
+        return [json.loads(item) for item in self._redis.zrange(self._messages_key, -count, -1)]
@@ -0,0 +1,167 @@
+import asyncio
+import os
+import struct
+import tempfile
+from .collector import METRIC_TYPES
+
+# ファイル先頭のマジックナンバー
+SNAPSHOT_MAGIC = b'MXSNAP4\n'
+
+# ヘッダー: IDカウンター, 選択中のメトリクスID（なしは-1）, メトリクス数
+HEADER = struct.Struct('<QqI')
+# メトリクス: ID, 値, 元の名前・Prometheus名・作成日時のバイト長, 種類, 観測数, バケット数, ラベル数, 子の数
+# （この後に各文字列、バケット上限、バケットごとの件数、ラベル名、
+#   子ごとのラベル値・値・観測数・バケットごとの件数が続く）
+METRIC = struct.Struct('<IdIIIBdIII')
+# 文字列の前に置くバイト長
+STRING_LEN = struct.Struct('<I')
+# 子の値, 観測数
+CHILD = struct.Struct('<dd')
+
+
+def pack_strings(values):
+    """バイト長を前に付けた文字列を連結"""
+    chunks = []
+    for value in values:
+        value = value.encode('utf-8')
+        chunks += (STRING_LEN.pack(len(value)), value)
+    return b''.join(chunks)
+
+
+def unpack_strings(data, offset, count):
+    """pack_strings の文字列を count 個読み込み、(文字列のタプル, 次のオフセット) を返す"""
+    values = []
+    for _ in range(count):
+        (length,) = STRING_LEN.unpack_from(data, offset)
+        offset += STRING_LEN.size
+        values.append(str(data[offset:offset + length], 'utf-8'))
+        offset += length
+    return tuple(values), offset
+
+
+def write_snapshot(path, metric_id_counter, current_metric_id, metrics):
+    """スナップショットを書き込む
+
+    metrics は (ID, 元の名前, Prometheus名, 作成日時, 値, 種類, 観測数, バケット上限, バケットごとの件数,
+    ラベル名, 子) のリスト。子は (ラベル値, 値, 観測数, バケットごとの件数) のリスト。
+    一時ファイルに書き込んでからfsyncして置き換えるため、
+    書き込み途中でクラッシュしても前回のスナップショットは壊れない。
+    """
+    chunks = [SNAPSHOT_MAGIC, HEADER.pack(
+        metric_id_counter,
+        -1 if current_metric_id is None else current_metric_id,
+        len(metrics))]
+    for (metric_id, original_name, prometheus_name, created_at, value,
+         metric_type, count, bounds, bucket_counts, label_names, children) in metrics:
+        original_name = original_name.encode('utf-8')
+        prometheus_name = prometheus_name.encode('utf-8')
+        created_at = created_at.encode('utf-8')
+        chunks.append(METRIC.pack(
+            metric_id, value, len(original_name), len(prometheus_name), len(created_at),
+            METRIC_TYPES.index(metric_type), count, len(bounds), len(label_names), len(children)))
+        chunks += (original_name, prometheus_name, created_at)
+        if bounds:
+            chunks.append(struct.pack(f'<{2 * len(bounds)}d', *bounds, *bucket_counts))
+        if label_names:
+            chunks.append(pack_strings(label_names))
+        for label_values, child_value, child_count, child_buckets in children:
+            chunks += (pack_strings(label_values), CHILD.pack(child_value, child_count))
+            if bounds:
+                chunks.append(struct.pack(f'<{len(bounds)}d', *child_buckets))
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b''.join(chunks))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_snapshot(path):
+    """スナップショットを読み込む
+
+    (IDカウンター, 選択中のメトリクスID, メトリクスのリスト) を返す。
+    メトリクスの形式は write_snapshot と同じ。
+    """
+    with open(path, 'rb') as f:
+        data = memoryview(f.read())
+
+    if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError('Invalid snapshot file')
+
+    offset = len(SNAPSHOT_MAGIC)
+    metric_id_counter, current_metric_id, count = HEADER.unpack_from(data, offset)
+    offset += HEADER.size
+
+    metrics = []
+    for _ in range(count):
+        (metric_id, value, original_len, prometheus_len, created_len,
+         type_index, observed, bucket_len, label_len, child_len) = METRIC.unpack_from(data, offset)
+        offset += METRIC.size
+        original_name = str(data[offset:offset + original_len], 'utf-8')
+        offset += original_len
+        prometheus_name = str(data[offset:offset + prometheus_len], 'utf-8')
+        offset += prometheus_len
+        created_at = str(data[offset:offset + created_len], 'utf-8')
+        offset += created_len
+        buckets = struct.unpack_from(f'<{2 * bucket_len}d', data, offset)
+        offset += 16 * bucket_len
+        label_names, offset = unpack_strings(data, offset, label_len)
+        children = []
+        for _ in range(child_len):
+            label_values, offset = unpack_strings(data, offset, label_len)
+            child_value, child_count = CHILD.unpack_from(data, offset)
+            offset += CHILD.size
+            child_buckets = struct.unpack_from(f'<{bucket_len}d', data, offset)
+            offset += 8 * bucket_len
+            children.append((label_values, child_value, child_count, child_buckets))
+        metrics.append((metric_id, original_name, prometheus_name, created_at, value,
+                        METRIC_TYPES[type_index], observed, buckets[:bucket_len], buckets[bucket_len:],
+                        label_names, children))
+
+    return metric_id_counter, (None if current_metric_id < 0 else current_metric_id), metrics
+
+
+class PeriodicSnapshot:
+    """一定間隔でスナップショットを保存するasyncioタスク
+
+    collect はイベントループ上で呼び出すため、ビューによる変更の途中の状態を読むことはない。
+    collect は (バージョン, write_snapshot の引数) のコピー（変更がなければNone）を返し、
+    ファイルへの書き込みはイベントループを止めないよう別スレッドで行う。
+    書き込みが完了したら saved にそのバージョンを渡す。
+    """
+
+    def __init__(self, path, collect, saved, interval):
+        self.path = path
+        self.collect = collect
+        self.saved = saved
+        self.interval = interval
+        self._task = None
+
+    def wake(self):
+        """保存タスクを開始（イベントループの外では何もしない）"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                state = self.collect()
+                if state is None:
+                    continue
+                version, snapshot = state
+                await asyncio.to_thread(write_snapshot, self.path, *snapshot)
+                self.saved(version)
+            except Exception as e:
+                print(f"Error saving snapshot: {e}")
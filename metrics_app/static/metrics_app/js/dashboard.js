@@ -4,6 +4,43 @@ let socket = null;
 let currentMetricId = null;
 let isUpdating = false; // WebSocketからの更新中フラグ
 
+// メトリクス値をバイナリフレームで送受信するサブプロトコル
+const BINARY_SUBPROTOCOL = 'mock-exporter.binary.v1';
+// バイナリフレームの1要素のバイト数（メトリクスID: uint32, 値: float64、リトルエンディアン）
+const VALUE_UPDATE_SIZE = 12;
+let receivedNames = {}; // サーバーから受信した名前: メトリクスID -> {metric_name, prometheus_name}
+let sentNames = {};     // サーバーに送信済みの名前: メトリクスID -> "元の名前\nPrometheus名"
+let metricsVersion = null;  // 最後に反映したメトリクス一覧のバージョン
+let metricsInstance = null; // バージョンを払い出したサーバーのインスタンスID
+
+function isBinaryProtocol() {
+    return socket !== null && socket.protocol === BINARY_SUBPROTOCOL;
+}
+
+// バイナリフレームを {metric_id, metric_value} の配列に変換
+function unpackValues(buffer) {
+    const view = new DataView(buffer);
+    const updates = [];
+    for (let offset = 0; offset + VALUE_UPDATE_SIZE <= buffer.byteLength; offset += VALUE_UPDATE_SIZE) {
+        updates.push({
+            metric_id: view.getUint32(offset, true),
+            metric_value: view.getFloat64(offset + 4, true)
+        });
+    }
+    return updates;
+}
+
+// [メトリクスID, 値] の配列をバイナリフレームに変換
+function packValues(updates) {
+    const buffer = new ArrayBuffer(updates.length * VALUE_UPDATE_SIZE);
+    const view = new DataView(buffer);
+    updates.forEach(([metricId, metricValue], i) => {
+        view.setUint32(i * VALUE_UPDATE_SIZE, metricId, true);
+        view.setFloat64(i * VALUE_UPDATE_SIZE + 4, metricValue, true);
+    });
+    return buffer;
+}
+
 // 日時を統一フォーマットで表示する関数
 function formatDateTime(date = new Date()) {
     const year = date.getFullYear();
@@ -20,21 +57,54 @@ function connectWebSocket() {
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
     const wsUrl = `${protocol}//${window.location.host}/ws/webhook/`;
     
-    socket = new WebSocket(wsUrl);
+    socket = new WebSocket(wsUrl, [BINARY_SUBPROTOCOL]);
+    socket.binaryType = 'arraybuffer';
+    // 名前は接続ごとに送り直す
+    receivedNames = {};
+    sentNames = {};
     
     socket.onopen = function(e) {
         console.log('WebSocket接続が確立されました');
         updateConnectionStatus(true);
+        // 再接続時は切断中の変更のみを取得
+        if (metricsVersion !== null) {
+            loadMetricsList();
+        }
     };
     
     socket.onmessage = function(e) {
+        if (e.data instanceof ArrayBuffer) {
+            // バイナリフレームはメトリクス値の一括更新（名前は受信済みのものを使う）
+            unpackValues(e.data).forEach(update => {
+                const names = receivedNames[update.metric_id];
+                if (names) {
+                    updateMetricFromWebSocket({ ...names, ...update });
+                }
+            });
+            return;
+        }
+        
         const data = JSON.parse(e.data);
         console.log('WebSocketメッセージ受信:', data);
         
         if (data.type === 'webhook_message') {
             addWebhookMessage(data.message);
+        } else if (data.type === 'webhook_batch') {
+            // 一括webhookは最新の一部のみ通知される
+            data.messages.forEach(addWebhookMessage);
         } else if (data.type === 'metric_sync') {
             updateMetricFromWebSocket(data);
+        } else if (data.type === 'metric_sync_batch') {
+            // 一括更新はまとめて反映
+            data.metrics.forEach(updateMetricFromWebSocket);
+        } else if (data.type === 'metric_names') {
+            // 以降のバイナリフレームで使う名前を記録
+            data.metrics.forEach(metric => {
+                receivedNames[metric.metric_id] = {
+                    metric_name: metric.metric_name,
+                    prometheus_name: metric.prometheus_name
+                };
+            });
         } else if (data.type === 'metrics_update') {
             // メトリクス一覧を再読み込み
             loadMetricsList();
@@ -109,12 +179,23 @@ function addWebhookMessage(message) {
 
 async function loadMetricsList() {
     try {
-        const response = await fetch('/get_metrics_list/');
+        // 前回取得したバージョン以降の差分のみを要求
+        let url = '/get_metrics_list/';
+        if (metricsVersion !== null) {
+            url += `?since_version=${metricsVersion}&instance=${metricsInstance}`;
+        }
+        const response = await fetch(url);
         const data = await response.json();
         
         if (data.status === 'success') {
             currentMetricId = data.current_metric_id;
-            displayMetricsList(data.metrics);
+            if (data.full) {
+                displayMetricsList(data.metrics);
+            } else {
+                applyMetricsDelta(data.metrics, data.deleted);
+            }
+            metricsVersion = data.version;
+            metricsInstance = data.instance;
         }
     } catch (error) {
         console.error('メトリクス一覧の読み込みエラー:', error);
@@ -135,35 +216,80 @@ function displayMetricsList(metrics) {
     noMetricMessage.style.display = 'none';
     
     metrics.forEach(metric => {
-        const row = document.createElement('div');
-        row.className = 'metric-row';
-        row.dataset.metricId = metric.metric_id;
-        
-        if (metric.metric_id === currentMetricId) {
-            row.classList.add('selected');
+        listDiv.appendChild(createMetricRow(metric));
+    });
+}
+
+// 差分（作成・変更されたメトリクスと削除されたメトリクスID）を一覧に反映
+function applyMetricsDelta(metrics, deleted) {
+    const listDiv = document.getElementById('metricsList');
+    const noMetricMessage = document.getElementById('noMetricMessage');
+    
+    deleted.forEach(metricId => {
+        const row = listDiv.querySelector(`.metric-row[data-metric-id="${metricId}"]`);
+        if (row) row.remove();
+    });
+    
+    metrics.forEach(metric => {
+        const row = listDiv.querySelector(`.metric-row[data-metric-id="${metric.metric_id}"]`);
+        if (row) {
+            updateMetricFromWebSocket({
+                metric_id: metric.metric_id,
+                metric_name: metric.original_name,
+                prometheus_name: metric.prometheus_name,
+                metric_value: metric.value
+            });
+        } else {
+            listDiv.appendChild(createMetricRow(metric));
         }
-        
-        row.innerHTML = `
-            <div class="metric-name-section">
-                <input type="text" class="metric-name-input" value="${metric.original_name}" 
-                       data-metric-id="${metric.metric_id}" placeholder="メトリクス名を入力">
-                <div class="prometheus-name">Prometheus名: ${metric.prometheus_name}</div>
-            </div>
-            <div class="metric-value-section">
-                <input type="range" class="metric-slider" min="0" max="100" value="${metric.value}"
-                       data-metric-id="${metric.metric_id}">
-                <span class="metric-value">${metric.value}</span>
-            </div>
-            <div class="metric-actions">
-                <button class="button btn-danger btn-small" onclick="deleteMetric(${metric.metric_id})">削除</button>
-            </div>
-        `;
-        
-        listDiv.appendChild(row);
-        
-        // イベントリスナーを追加
-        setupMetricRowEvents(row, metric.metric_id);
     });
+    
+    // 選択状態を反映
+    listDiv.querySelectorAll('.metric-row').forEach(row => {
+        row.classList.toggle('selected', Number(row.dataset.metricId) === currentMetricId);
+    });
+    
+    noMetricMessage.style.display = listDiv.children.length === 0 ? 'block' : 'none';
+}
+
+// histogram・summaryは値を直接設定できない（observe_metrics で観測値を記録する）
+function isObservedType(metricType) {
+    return metricType === 'histogram' || metricType === 'summary';
+}
+
+// ラベル付きメトリクスは子ごとに値を持つため、スライダーでは設定できない
+function isLabeledMetric(metric) {
+    return Array.isArray(metric.label_names) && metric.label_names.length > 0;
+}
+
+function createMetricRow(metric) {
+    const row = document.createElement('div');
+    row.className = 'metric-row';
+    row.dataset.metricId = metric.metric_id;
+    
+    if (metric.metric_id === currentMetricId) {
+        row.classList.add('selected');
+    }
+    
+    row.innerHTML = `
+        <div class="metric-name-section">
+            <input type="text" class="metric-name-input" value="${metric.original_name}" 
+                   data-metric-id="${metric.metric_id}" placeholder="メトリクス名を入力">
+            <div class="prometheus-name">Prometheus名: ${metric.prometheus_name}${isLabeledMetric(metric) ? ` {${metric.label_names.join(', ')}}` : ''}</div>
+        </div>
+        <div class="metric-value-section">
+            <input type="range" class="metric-slider" min="0" max="100" value="${metric.value}"
+                   data-metric-id="${metric.metric_id}" ${isObservedType(metric.type) || isLabeledMetric(metric) ? 'disabled' : ''}>
+            <span class="metric-value">${metric.value}</span>
+        </div>
+        <div class="metric-actions">
+            <button class="button btn-danger btn-small" onclick="deleteMetric(${metric.metric_id})">削除</button>
+        </div>
+    `;
+    
+    // イベントリスナーを追加
+    setupMetricRowEvents(row, metric.metric_id);
+    return row;
 }
 
 function setupMetricRowEvents(row, metricId) {
@@ -263,7 +389,22 @@ async function updateMetricValue(metricId, metricName, metricValue) {
             }
             
             // WebSocketで他のクライアントに通知
-            if (socket && socket.readyState === WebSocket.OPEN) {
+            if (socket && socket.readyState === WebSocket.OPEN && isBinaryProtocol()) {
+                // 名前は初回と変更時のみ送り、値はバイナリフレームで送る
+                const names = `${data.original_name}\n${data.prometheus_name}`;
+                if (sentNames[metricId] !== names) {
+                    sentNames[metricId] = names;
+                    socket.send(JSON.stringify({
+                        type: 'metric_names',
+                        metrics: [{
+                            metric_id: metricId,
+                            metric_name: data.original_name,
+                            prometheus_name: data.prometheus_name
+                        }]
+                    }));
+                }
+                socket.send(packValues([[metricId, data.value]]));
+            } else if (socket && socket.readyState === WebSocket.OPEN) {
                 socket.send(JSON.stringify({
                     type: 'metric_update',
                     metric_id: metricId,
@@ -0,0 +1,63 @@
+import asyncio
+from django.conf import settings
+from channels.layers import get_channel_layer
+from .instrumentation import timed_group_send
+
+
+class MetricSyncCoalescer:
+    """metric_sync の送信をティック単位でまとめるクラス
+
+    ティック内ではメトリクスごとに最新の値のみを保持し、
+    ティックごとに1回だけ metric_sync_batch としてグループに送信する。
+    送信回数はスライダー操作の速さではなくティックレートに比例する。
+    """
+
+    def __init__(self, group):
+        self.group = group
+        self._pending = {}      # メトリクスID -> 最新のメトリクス情報
+        self._task = None
+        self._last_flush = None
+
+    @property
+    def interval(self):
+        tick_hz = getattr(settings, 'METRICS_SYNC_TICK_HZ', 20)
+        return 1.0 / tick_hz if tick_hz > 0 else 0
+
+    async def submit(self, metric):
+        """メトリクス値の同期を予約（同じメトリクスは最新の値で上書き）"""
+        if not self.interval:
+            # コアレッシング無効時は従来どおり即時送信
+            await timed_group_send(get_channel_layer(), self.group, {"type": "metric_sync", **metric})
+            return
+
+        self._pending[metric['metric_id']] = metric
+
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        channel_layer = get_channel_layer()
+
+        while self._pending:
+            # 前回の送信から1ティック経過するまで待機
+            if self._last_flush is not None:
+                delay = self._last_flush + self.interval - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            pending, self._pending = self._pending, {}
+            self._last_flush = loop.time()
+            await timed_group_send(
+                channel_layer,
+                self.group,
+                {
+                    "type": "metric_sync_batch",
+                    "metrics": list(pending.values())
+                }
+            )
+
+
+# スライダー同期用の共有インスタンス
+metric_sync_coalescer = MetricSyncCoalescer("metrics_sync")
@@ -0,0 +1,188 @@
+import itertools
+import math
+import random
+import re
+import time
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.utils import floatToGoString
+from .collector import escape_label_value, exposition_names
+
+# 1チャンクに含める最大行数
+SYNTHETIC_CHUNK_LINES = 10000
+
+# 合成メトリクスの種類
+SYNTHETIC_TYPES = ('gauge', 'counter')
+
+# 系列ごとの値の生成方法
+SYNTHETIC_FUNCTIONS = ('constant', 'index', 'random', 'sine', 'linear')
+
+# counterのファミリーで使える（時間に対して減少しない）値の生成方法
+MONOTONIC_FUNCTIONS = ('constant', 'index', 'linear')
+
+LABEL_NAME = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+
+
+class SyntheticTarget:
+    """仕様から系列を都度生成する合成ターゲット
+
+    メトリクスファミリー・ラベルの次元（名前とカーディナリティ）・値の生成方法のみを保持し、
+    スクレイプのたびにラベルの全組み合わせをexposition形式で生成する。
+    系列ごとの状態を持たないため、系列数に関わらずメモリ使用量は一定となる。
+
+    spec の例::
+
+        {"families": [{"name": "synthetic_load", "type": "gauge"}],
+         "labels": {"instance": 1000, "pod": 100},
+         "value": {"function": "sine", "amplitude": 50, "offset": 50, "period": 60}}
+    """
+
+    def __init__(self, name, spec, max_series=None):
+        if not isinstance(spec, dict):
+            raise ValueError('spec must be an object')
+        self.name = name
+        self.created = time.time()
+
+        families = spec.get('families')
+        if not isinstance(families, list) or not families:
+            raise ValueError('families must be a non-empty list')
+        self.families = []
+        reserved = set()
+        for family in families:
+            if isinstance(family, str):
+                family = {'name': family}
+            metric_type = family.get('type', 'gauge')
+            if metric_type not in SYNTHETIC_TYPES:
+                raise ValueError(f'Unknown synthetic metric type: {metric_type}')
+            family_name = family.get('name')
+            # prometheus_clientと同じ規則で名前を検証する
+            GaugeMetricFamily(family_name, '')
+            # counterの foo と foo_total のように、expositionで同じ名前になるファミリーは作成できない
+            names = exposition_names(family_name, metric_type)
+            if reserved.intersection(names):
+                raise ValueError(f'Duplicated family name: {family_name}')
+            reserved.update(names)
+            self.families.append((family_name, metric_type, family.get('help') or f'Synthetic metric of target {name}'))
+
+        labels = spec.get('labels') or {}
+        if isinstance(labels, dict):
+            labels = [{'name': key, 'cardinality': value} for key, value in labels.items()]
+        self.labels = []
+        for label in labels:
+            label_name = label.get('name')
+            if not isinstance(label_name, str) or not LABEL_NAME.match(label_name) or label_name.startswith('__'):
+                raise ValueError(f'Invalid label name: {label_name}')
+            cardinality = int(label.get('cardinality', 1))
+            if cardinality < 1:
+                raise ValueError(f'cardinality must be positive: {label_name}')
+            self.labels.append((label_name, cardinality, str(label.get('prefix', f'{label_name}-'))))
+        if len({label[0] for label in self.labels}) != len(self.labels):
+            raise ValueError('Duplicated label names')
+
+        if max_series is not None and self.series_count > max_series:
+            raise ValueError(f'Too many series: {self.series_count} (max {max_series})')
+
+        value = spec.get('value') or {}
+        if not isinstance(value, dict):
+            value = {'function': 'constant', 'value': value}
+        self.function = value.get('function', 'constant')
+        if self.function not in SYNTHETIC_FUNCTIONS:
+            raise ValueError(f'Unknown value function: {self.function}')
+        self.params = {key: float(param) for key, param in value.items() if key not in ('function', 'seed')}
+        self.seed = value.get('seed')
+        if any(metric_type == 'counter' for _, metric_type, _ in self.families):
+            self._check_monotonic()
+
+    def _check_monotonic(self):
+        """counterの値は負にならず、スクレイプごとに減少しない生成方法である必要がある"""
+        if self.function not in MONOTONIC_FUNCTIONS:
+            raise ValueError(f'Counter families require one of {", ".join(MONOTONIC_FUNCTIONS)}: {self.function}')
+        if self.function == 'constant' and not self.params.get('value', 1.0) >= 0:
+            raise ValueError('value of counter families must not be negative')
+        if self.function == 'linear' and not (self.params.get('start', 0.0) >= 0 and self.params.get('rate', 1.0) >= 0):
+            raise ValueError('start and rate of counter families must not be negative')
+
+    @property
+    def series_per_family(self):
+        return math.prod(cardinality for _, cardinality, _ in self.labels)
+
+    @property
+    def series_count(self):
+        return len(self.families) * self.series_per_family
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'families': [{'name': name, 'type': metric_type} for name, metric_type, _ in self.families],
+            'labels': [{'name': name, 'cardinality': cardinality, 'prefix': prefix} for name, cardinality, prefix in self.labels],
+            'value': dict(self.params, function=self.function, seed=self.seed),
+            'series': self.series_count,
+        }
+
+    def _values(self, start, count, total, elapsed, rng):
+        """系列番号 start から count 件分の値の文字列を返す"""
+        params = self.params
+        if self.function == 'index':
+            return [floatToGoString(float(index)) for index in range(start, start + count)]
+        if self.function == 'random':
+            low, high = params.get('min', 0.0), params.get('max', 100.0)
+            return [floatToGoString(rng.uniform(low, high)) for _ in range(count)]
+        if self.function == 'sine':
+            # 系列ごとに位相をずらし、全系列が同じ値にならないようにする
+            amplitude, offset = params.get('amplitude', 50.0), params.get('offset', 50.0)
+            phase = elapsed / params.get('period', 60.0)
+            return [
+                floatToGoString(offset + amplitude * math.sin(2 * math.pi * (phase + index / total)))
+                for index in range(start, start + count)
+            ]
+        if self.function == 'linear':
+            value = params.get('start', 0.0) + params.get('rate', 1.0) * elapsed
+        else:
+            value = params.get('value', 1.0)
+        return itertools.repeat(floatToGoString(value), count)
+
+    def iter_exposition(self, openmetrics=False, chunk_lines=SYNTHETIC_CHUNK_LINES):
+        """exposition形式のテキストを最大chunk_lines行ずつのバイト列で生成"""
+        elapsed = time.time() - self.created
+        rng = random.Random(self.seed)
+        total = self.series_per_family
+        # ラベルの値は次元ごとに1度だけ整形（エスケープ）し、最後の次元以外の組み合わせを外側で回す
+        parts = [
+            [f'{label_name}="{escape_label_value(prefix)}{i}"' for i in range(cardinality)]
+            for label_name, cardinality, prefix in self.labels
+        ]
+        outer_parts, inner_parts = (parts[:-1], parts[-1]) if parts else ([], [''])
+
+        lines = []
+        for name, metric_type, help_text in self.families:
+            if metric_type == 'counter':
+                # text形式は *_total をメトリクス名とし、OpenMetrics形式は *_total を除いた名前とする
+                base = name.removesuffix('_total')
+                family_name = base if openmetrics else f'{base}_total'
+                sample = f'{base}_total'
+            else:
+                family_name = sample = name
+            help_text = help_text.replace('\\', r'\\').replace('\n', r'\n')
+            if openmetrics:
+                help_text = help_text.replace('"', r'\"')
+            lines.append(f'# HELP {family_name} {help_text}\n# TYPE {family_name} {metric_type}\n')
+
+            index = 0
+            for outer in itertools.product(*outer_parts):
+                if parts:
+                    head = f'{sample}{{' + ''.join(f'{part},' for part in outer)
+                    tail = '}'
+                else:
+                    head, tail = sample, ''
+                for start in range(0, len(inner_parts), chunk_lines):
+                    inner = inner_parts[start:start + chunk_lines]
+                    values = self._values(index, len(inner), total, elapsed, rng)
+                    lines.extend([f'{head}{part}{tail} {value}\n' for part, value in zip(inner, values)])
+                    index += len(inner)
+                    if len(lines) >= chunk_lines:
+                        yield ''.join(lines).encode('utf-8')
+                        lines = []
+
+        if openmetrics:
+            lines.append('# EOF\n')
+        if lines:
+            yield ''.join(lines).encode('utf-8')
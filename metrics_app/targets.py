@@ -0,0 +1,94 @@
+import itertools
+import re
+from .collector import DynamicMetricsCollector
+
+# ターゲット名に使える文字（/metrics/<name> のパスにそのまま使う）
+TARGET_NAME = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+class VirtualTarget:
+    """/metrics/<name> で公開する仮想エクスポーター
+
+    ターゲットごとに専用のCollectorを持ち、スクレイプ時はそのターゲットの系列のみを出力する。
+    メトリクスはターゲット内のPrometheus名で指定する。
+    """
+
+    def __init__(self, name):
+        if not isinstance(name, str) or not TARGET_NAME.match(name):
+            raise ValueError(f'Invalid target name: {name}')
+        self.name = name
+        self.collector = DynamicMetricsCollector()
+        self._ids = itertools.count(1)
+
+    def add_metric(self, spec):
+        """メトリクスを追加（name, type, buckets, label_names, value）"""
+        if not isinstance(spec, dict) or not spec.get('name'):
+            raise ValueError('metric name is required')
+        metric_id = next(self._ids)
+        metric_type = spec.get('type', 'gauge')
+        self.collector.add(metric_id, spec['name'], metric_type=metric_type, buckets=spec.get('buckets'),
+                           label_names=spec.get('label_names'))
+        if spec.get('value') is not None and not spec.get('label_names'):
+            self.collector.set(metric_id, float(spec['value']))
+        return metric_id
+
+    def metric_id(self, name):
+        metric_id = self.collector.metric_id_for(name)
+        if metric_id is None:
+            raise LookupError(f'Metric not found: {self.name}/{name}')
+        return metric_id
+
+    def to_dict(self):
+        return {'name': self.name, 'metrics': len(self.collector), 'series': self.collector.series_count}
+
+
+class VirtualTargetSet:
+    """仮想エクスポーターの集合"""
+
+    def __init__(self):
+        self._targets = {}      # ターゲット名 -> VirtualTarget
+
+    def __len__(self):
+        return len(self._targets)
+
+    def __iter__(self):
+        return iter(list(self._targets.values()))
+
+    def get(self, name):
+        return self._targets.get(name)
+
+    def create_many(self, names, metrics=()):
+        """同じメトリクス構成のターゲットをまとめて作成
+
+        名前の重複やメトリクス定義の誤りがあれば、1つも作成せずにValueErrorを送出する。
+        """
+        names = list(names)
+        if len(set(names)) != len(names):
+            raise ValueError('Duplicated target names')
+        for name in names:
+            if name in self._targets:
+                raise ValueError(f'Target already exists: {name}')
+
+        targets = []
+        for name in names:
+            target = VirtualTarget(name)
+            for spec in metrics:
+                target.add_metric(spec)
+            targets.append(target)
+
+        for target in targets:
+            self._targets[target.name] = target
+        return targets
+
+    def delete_many(self, names=None, prefix=None):
+        """名前の一覧または前方一致でターゲットをまとめて削除し、削除した名前を返す"""
+        if names is None and prefix is None:
+            deleted = list(self._targets)
+        else:
+            deleted = [
+                name for name in (names if names is not None else list(self._targets))
+                if name in self._targets and (prefix is None or name.startswith(prefix))
+            ]
+        for name in deleted:
+            del self._targets[name]
+        return deleted
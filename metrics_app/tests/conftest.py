@@ -0,0 +1,13 @@
+import os
+
+import django
+import pytest
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'metrics_app.tests.settings')
+django.setup()
+
+
+@pytest.fixture
+def client():
+    from django.test import Client
+    return Client(HTTP_HOST='localhost')
@@ -0,0 +1,10 @@
+# テスト用の設定（スナップショットやRedisを使わずに単一プロセスの状態で動かす）
+from mock_exporter.settings import *
+
+METRICS_SNAPSHOT_PATH = None
+REDIS_URL = None
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from metrics_app.generators import GeneratorScheduler, create_generator
+
+
+@pytest.mark.parametrize('generator_type, params', [
+    ('sine', {'period': 0}),
+    ('sawtooth', {'period': -1}),
+    ('sawtooth', {'min': 10, 'max': 0}),
+    ('random_walk', {'min': 10, 'max': 0}),
+    ('random_walk', {'step': -1}),
+    ('step', {'low': 100, 'high': 0}),
+    ('step', {'period': float('nan')}),
+    ('poisson_spike', {'rate': -0.1}),
+    ('sine', {'unknown': 1}),
+    ('unknown', {}),
+])
+def test_create_generator_rejects_invalid_params(generator_type, params):
+    with pytest.raises(ValueError):
+        create_generator(generator_type, params)
+
+
+class BrokenGenerator:
+    def value(self, elapsed, dt):
+        raise RuntimeError('broken')
+
+
+def test_failing_generator_is_detached_without_stopping_others():
+    applied = []
+    scheduler = GeneratorScheduler(lambda values: applied.append(values) or [])
+
+    async def run():
+        scheduler.attach(1, create_generator('step', {'low': 5, 'high': 5}))
+        scheduler.attach(2, BrokenGenerator())
+        await asyncio.sleep(0.25)
+        # 失敗したジェネレーターのみ解除され、スケジューラーは動き続けている
+        assert not scheduler._task.done()
+        assert not scheduler.detach(2)
+        assert scheduler.detach(1)
+        await asyncio.wait_for(scheduler._task, 1)
+
+    asyncio.run(run())
+    assert len(applied) >= 2
+    assert all(values == {1: 5.0} for values in applied)
@@ -0,0 +1,54 @@
+import io
+import json
+
+import pytest
+
+from metrics_app.ingest import iter_json_array, iter_ndjson
+
+CHUNK_SIZES = [1, 3, 64 * 1024]
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('body', [
+    '[]',
+    ' \n[ ] \n',
+    '[1, 2.5, -3e-2, 1.5E10, 0]',
+    '[{"message": "a,b]"}, "x\\"]", [1, [2, {}]], null, true, false]',
+    '[{"message": "日本語のメッセージ"}, "😀"]',
+    '[\n  {"message": "first"},\n  {"message": "second", "value": 12345}\n]\n',
+])
+def test_iter_json_array(body, chunk_size):
+    items = iter_json_array(io.BytesIO(body.encode('utf-8')), chunk_size)
+    assert list(items) == json.loads(body)
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('body', [
+    '',
+    '{"message": "not an array"}',
+    '[1,]',
+    '[,1]',
+    '[1 2]',
+    '[1, 2',
+    '[{"message": "unterminated}]',
+    '[tru]',
+    '[1] extra',
+    '[1][2]',
+])
+def test_iter_json_array_rejects_malformed_input(body, chunk_size):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.BytesIO(body.encode('utf-8')), chunk_size))
+
+
+def test_iter_json_array_yields_before_reading_everything():
+    stream = io.BytesIO(b'[{"message": "a"}, ' + b' ' * 1000 + b'{"message": "b"}]')
+    items = iter_json_array(stream, 16)
+    assert next(items) == {'message': 'a'}
+    assert stream.tell() < 100
+
+
+def test_iter_ndjson():
+    stream = io.BytesIO(b'{"message": "a"}\n\n{"message": "b"}\n')
+    assert list(iter_ndjson(stream)) == [{'message': 'a'}, {'message': 'b'}]
+    with pytest.raises(ValueError, match='line 2'):
+        list(iter_ndjson(io.BytesIO(b'{}\n{\n')))
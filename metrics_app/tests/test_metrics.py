@@ -0,0 +1,45 @@
+import json
+
+from metrics_app import views
+
+
+def post(client, path, data):
+    return client.post(path, json.dumps(data), content_type='application/json').json()
+
+
+def test_repeated_scrape_returns_not_modified(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    etag = response['ETag']
+
+    # 動的メトリクスが変わらなければ標準メトリクスの値が変わっていても304を返す
+    response = client.get('/metrics', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    metric = post(client, '/create_metric/', {'metric_name': 'etag_test'})
+    assert metric['status'] == 'success'
+    response = client.get('/metrics', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+    assert b'etag_test 0.0' in response.content
+    views.delete_metric_by_id(metric['metric_id'])
+
+
+def test_counter_cannot_be_decreased(client):
+    metric_id = post(client, '/create_metric/', {'metric_name': 'decrease_test', 'type': 'counter'})['metric_id']
+    try:
+        assert post(client, '/update_metric/', {'metric_id': metric_id, 'metric_value': 10})['value'] == 10
+        assert post(client, '/update_metric/', {'metric_id': metric_id, 'metric_value': 5})['status'] == 'error'
+
+        result = post(client, '/bulk_update_metrics/', [
+            {'metric_id': metric_id, 'value': 3},
+            {'metric_id': metric_id, 'value': 12},
+        ])
+        assert [item['status'] for item in result['results']] == ['error', 'success']
+
+        # ジェネレーター・再生・webhookルールでは小さい値を無視する
+        assert views.apply_metric_values({metric_id: 1.0}) == []
+        assert views.current_metrics[metric_id]['value'] == 12
+        assert views.metrics_collector.get(metric_id) == 12
+    finally:
+        views.delete_metric_by_id(metric_id)
@@ -0,0 +1,41 @@
+import pytest
+
+from metrics_app.snapshot import read_snapshot, write_snapshot
+
+
+METRICS = [
+    (1, 'CPU使用率', 'cpu_usage', '2026-01-01T00:00:00', 42.5,
+     'gauge', 0.0, (), (), (), []),
+    (2, 'requests', 'http_requests', '2026-01-01T00:00:01', 0.0,
+     'counter', 0.0, (), (), ('instance', 'path'), [
+         (('web-1', '/'), 10.0, 0.0, ()),
+         (('web-2', '/ログイン'), 3.0, 0.0, ()),
+     ]),
+    (3, 'latency', 'request_latency_seconds', '2026-01-01T00:00:02', 1.25,
+     'histogram', 4.0, (0.1, 1.0, float('inf')), (1.0, 3.0, 4.0), (), []),
+    (4, 'labeled latency', 'labeled_latency_seconds', '', 0.0,
+     'histogram', 0.0, (0.5, float('inf')), (0.0, 0.0), ('job',), [
+         (('api',), 0.7, 2.0, (1.0, 2.0)),
+     ]),
+    (5, 'summary', 'response_size_bytes', '', 300.0,
+     'summary', 2.0, (), (), (), []),
+]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'metrics.snapshot')
+    write_snapshot(path, 5, 3, METRICS)
+    assert read_snapshot(path) == (5, 3, METRICS)
+
+
+def test_round_trip_without_selected_metric(tmp_path):
+    path = str(tmp_path / 'metrics.snapshot')
+    write_snapshot(path, 0, None, [])
+    assert read_snapshot(path) == (0, None, [])
+
+
+def test_rejects_unknown_format(tmp_path):
+    path = tmp_path / 'metrics.snapshot'
+    path.write_bytes(b'MXSNAP3\n' + bytes(20))
+    with pytest.raises(ValueError):
+        read_snapshot(str(path))
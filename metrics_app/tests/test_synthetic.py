@@ -0,0 +1,41 @@
+import pytest
+
+from metrics_app.synthetic import SyntheticTarget
+
+
+@pytest.mark.parametrize('value', [
+    {'function': 'sine'},
+    {'function': 'random'},
+    {'function': 'linear', 'rate': -1},
+    {'function': 'linear', 'start': -5},
+    {'function': 'constant', 'value': -1},
+])
+def test_counter_families_require_monotonic_values(value):
+    with pytest.raises(ValueError):
+        SyntheticTarget('t', {'families': [{'name': 'requests_total', 'type': 'counter'}], 'value': value})
+
+
+def test_gauge_families_accept_any_function():
+    SyntheticTarget('t', {'families': ['load'], 'value': {'function': 'sine'}})
+
+
+@pytest.mark.parametrize('families', [
+    [{'name': 'foo', 'type': 'counter'}, {'name': 'foo_total', 'type': 'counter'}],
+    [{'name': 'foo', 'type': 'counter'}, {'name': 'foo_total'}],
+    [{'name': 'foo', 'type': 'counter'}, {'name': 'foo'}],
+    ['foo', 'foo'],
+])
+def test_rejects_colliding_family_names(families):
+    with pytest.raises(ValueError):
+        SyntheticTarget('t', {'families': families})
+
+
+def test_counter_exposition():
+    target = SyntheticTarget('t', {
+        'families': [{'name': 'requests', 'type': 'counter'}],
+        'labels': {'pod': 2},
+        'value': {'function': 'index'},
+    })
+    text = b''.join(target.iter_exposition()).decode()
+    assert '# TYPE requests_total counter\n' in text
+    assert 'requests_total{pod="pod-1"} 1.0\n' in text
@@ -0,0 +1,37 @@
+import json
+
+from django.test import override_settings
+
+from metrics_app import views
+
+
+def post(client, path, data):
+    return client.post(path, json.dumps(data), content_type='application/json')
+
+
+@override_settings(VIRTUAL_TARGETS_MAX_COUNT=3)
+def test_create_targets_rejects_too_many(client):
+    response = post(client, '/create_targets/', {'prefix': 'too-many-', 'count': 4})
+    assert response.status_code == 400
+    response = post(client, '/create_targets/', {'names': ['a', 'b', 'c', 'd']})
+    assert response.status_code == 400
+    assert not any(target.name.startswith('too-many-') for target in views.virtual_targets)
+
+
+def test_targets_report_series(client):
+    response = post(client, '/create_targets/', {'prefix': 'series-', 'count': 2, 'metrics': [
+        {'name': 'up', 'value': 1},
+        {'name': 'requests_total', 'type': 'counter', 'label_names': ['path']},
+    ]})
+    assert response.json()['created'] == 2
+    try:
+        response = post(client, '/update_target_metrics/', [
+            {'target': 'series-1', 'metric': 'requests_total', 'value': 1, 'labels': {'path': '/'}},
+            {'target': 'series-1', 'metric': 'requests_total', 'value': 1, 'labels': {'path': '/login'}},
+        ])
+        assert response.json()['updated'] == 2
+        targets = {target.name: target.to_dict() for target in views.virtual_targets}
+        assert targets['series-1'] == {'name': 'series-1', 'metrics': 2, 'series': 3}
+        assert targets['series-2'] == {'name': 'series-2', 'metrics': 2, 'series': 1}
+    finally:
+        post(client, '/delete_targets/', {'prefix': 'series-'})
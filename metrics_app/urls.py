@@ -4,8 +4,24 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('metrics', views.metrics, name='metrics'),
+    path('metrics/<str:target>', views.target_metrics, name='target_metrics'),
+    path('internal_metrics', views.internal_metrics, name='internal_metrics'),
     path('update_metric/', views.update_metric, name='update_metric'),
+    path('bulk_update_metrics/', views.bulk_update_metrics, name='bulk_update_metrics'),
+    path('observe_metrics/', views.observe_metrics, name='observe_metrics'),
+    path('get_metric_children/', views.get_metric_children, name='get_metric_children'),
+    path('delete_metric_children/', views.delete_metric_children, name='delete_metric_children'),
+    path('attach_generator/', views.attach_generator, name='attach_generator'),
+    path('detach_generator/', views.detach_generator, name='detach_generator'),
+    path('start_recording/', views.start_recording, name='start_recording'),
+    path('stop_recording/', views.stop_recording, name='stop_recording'),
+    path('start_replay/', views.start_replay, name='start_replay'),
+    path('stop_replay/', views.stop_replay, name='stop_replay'),
     path('webhook/', views.webhook, name='webhook'),
+    path('webhook/batch/', views.webhook_batch, name='webhook_batch'),
+    path('add_webhook_rules/', views.add_webhook_rules, name='add_webhook_rules'),
+    path('get_webhook_rules/', views.get_webhook_rules, name='get_webhook_rules'),
+    path('delete_webhook_rules/', views.delete_webhook_rules, name='delete_webhook_rules'),
     path('get_webhook_messages/', views.get_webhook_messages, name='get_webhook_messages'),
     path('get_current_metrics/', views.get_current_metrics, name='get_current_metrics'),
     path('get_metrics_list/', views.get_metrics_list, name='get_metrics_list'),
@@ -13,4 +29,11 @@ urlpatterns = [
     path('select_metric/', views.select_metric, name='select_metric'),
     path('delete_metric/', views.delete_metric, name='delete_metric'),
     path('cleanup_metrics/', views.cleanup_metrics, name='cleanup_metrics'),
+    path('create_targets/', views.create_targets, name='create_targets'),
+    path('delete_targets/', views.delete_targets, name='delete_targets'),
+    path('update_target_metrics/', views.update_target_metrics, name='update_target_metrics'),
+    path('get_targets/', views.get_targets, name='get_targets'),
+    path('create_synthetic_target/', views.create_synthetic_target, name='create_synthetic_target'),
+    path('delete_synthetic_target/', views.delete_synthetic_target, name='delete_synthetic_target'),
+    path('get_synthetic_targets/', views.get_synthetic_targets, name='get_synthetic_targets'),
 ]
@@ -1,18 +1,59 @@
 from django.shortcuts import render
-from django.http import HttpResponse, JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django.views.decorators.csrf import csrf_exempt
-from prometheus_client import Gauge, generate_latest, CONTENT_TYPE_LATEST, REGISTRY
+from django.views.decorators.http import condition
+from prometheus_client import REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.exposition import choose_encoder, gzip_accepted
+import atexit
+import gzip
+import itertools
 import json
+import os
+import time
+import zlib
+from bisect import bisect_right
 from datetime import datetime
 from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from asgiref.sync import sync_to_async
 import re
+from .collector import (
+    METRIC_TYPES, OBSERVED_TYPES, DynamicMetricsCollector, histogram_buckets, validate_label_names,
+)
+from .sync import metric_sync_coalescer
+from .ringbuffer import MessageRingBuffer
+from .generators import GeneratorScheduler, create_generator
+from .recording import MetricRecorder, MetricReplayer, recording_path
+from .shared_state import SharedMetricState
+from .snapshot import PeriodicSnapshot, read_snapshot, write_snapshot
+from .changelog import MetricChangeLog
+from .expiry import MetricExpiry, MetricSweeper
+from .ingest import NDJSON_CONTENT_TYPES, iter_json_array, iter_ndjson
+from .rules import WebhookRuleSet
+from .targets import VirtualTargetSet
+from .synthetic import SyntheticTarget
+from .instrumentation import (
+    INTERNAL_REGISTRY, METRICS_PAYLOAD_BYTES, METRICS_RENDER_SECONDS, WEBHOOK_BUFFER_DEPTH,
+    timed_group_send, timed_view,
+)
+
+# 動的メトリクスの値を保持するCollector
+# REGISTRYには登録せず、/metrics ではキャッシュ済みのexpositionを連結する
+metrics_collector = DynamicMetricsCollector()
 
 # 動的に作成されたメトリクスを保存する辞書（ID管理）
 metrics_registry = {}
 
-# webhookメッセージを保存するリスト（実際のプロダクションではデータベースを使用）
-webhook_messages = []
+# 複数ワーカーで状態を共有するバックエンド（REDIS_URL未設定時はNone）
+shared_state = SharedMetricState(settings.REDIS_URL) if getattr(settings, 'REDIS_URL', None) else None
+
+# webhookメッセージを保存するリングバッファ（実際のプロダクションではデータベースを使用）
+if shared_state is not None:
+    webhook_messages = shared_state.message_buffer(getattr(settings, 'WEBHOOK_BUFFER_SIZE', 1000))
+else:
+    webhook_messages = MessageRingBuffer(getattr(settings, 'WEBHOOK_BUFFER_SIZE', 1000))
+WEBHOOK_BUFFER_DEPTH.set_function(lambda: len(webhook_messages))
 
 # 現在のメトリクス値を保存（ID管理）
 current_metrics = {}
@@ -23,19 +64,248 @@ metric_id_counter = 0
 # 現在選択中のメトリクスID
 current_metric_id = None
 
+# 自動命名で使用した連番（ベース名 -> 最後に使用した番号）
+metric_name_counters = {}
+
+# 値の変更を記録中のレコーダー（記録していない場合はNone）
+metric_recorder = None
+
+# 再生中のリプレイヤー
+metric_replayer = None
+
+# 最後にスナップショットを保存した時点のCollectorのバージョン
+snapshot_version = None
+
+# スナップショットを定期的に保存するタスク（サーバープロセスで有効にした場合のみ）
+metric_snapshot = None
+
+# メトリクス一覧の差分取得用の変更履歴
+metric_changes = MetricChangeLog(getattr(settings, 'METRICS_CHANGELOG_SIZE', 10000))
+
+# メトリクスの最終更新時刻とTTL（期限切れ・上限超過の削除に使う）
+metric_expiry = MetricExpiry()
+
+# webhookの内容からメトリクスを更新するルール
+webhook_rules = WebhookRuleSet()
+
+# /metrics/<target> で公開する仮想エクスポーター
+virtual_targets = VirtualTargetSet()
+
+# /metrics?synthetic=<name> で都度生成する合成ターゲット
+synthetic_targets = {}
+
+def collect_metrics_snapshot():
+    """スナップショットに保存する内容を (Collectorのバージョン, write_snapshot の引数) で返す
+
+    ファイルへの書き込み中に変更されないよう、メトリクスの状態はコピーして返す。
+    前回の保存から変更がなければNone。
+    """
+    version = metrics_collector.version
+    if version == snapshot_version:
+        return None
+    
+    metrics = []
+    for metric_id, info in list(current_metrics.items()):
+        metric_type, value, count, bounds, bucket_counts = metrics_collector.state(metric_id)
+        metrics.append((
+            metric_id, info['original_name'], info['prometheus_name'],
+            metrics_registry[metric_id]['created_at'], value,
+            metric_type, count, bounds, bucket_counts,
+            metrics_collector.label_names(metric_id), metrics_collector.children_state(metric_id)))
+    return version, (metric_id_counter, current_metric_id, metrics)
+
+def metrics_snapshot_saved(version):
+    """スナップショットの保存が完了したCollectorのバージョンを記録"""
+    global snapshot_version
+    snapshot_version = version
+
+def save_metrics_snapshot(path):
+    """メトリクスの状態をスナップショットとして保存（変更がなければ何もしない）"""
+    state = collect_metrics_snapshot()
+    if state is None:
+        return False
+    version, snapshot = state
+    write_snapshot(path, *snapshot)
+    metrics_snapshot_saved(version)
+    return True
+
+def restore_metrics_snapshot(path):
+    """スナップショットからメトリクスを一括で復元"""
+    global metric_id_counter, current_metric_id, snapshot_version
+    counter, selected, metrics = read_snapshot(path)
+    
+    # ラベルなしのgaugeはまとめて追加し、それ以外は種類・観測値・子を個別に復元
+    metrics_collector.add_many(
+        (metric[0], metric[2], metric[4]) for metric in metrics
+        if metric[5] == 'gauge' and not metric[9])
+    for (metric_id, original_name, prometheus_name, created_at, value,
+         metric_type, count, bounds, bucket_counts, label_names, children) in metrics:
+        if metric_type != 'gauge' or label_names:
+            metrics_collector.add(metric_id, prometheus_name, metric_type=metric_type,
+                                  buckets=bounds or None, label_names=label_names)
+            metrics_collector.load_observations(metric_id, value, count, bucket_counts)
+            if children:
+                metrics_collector.load_children(metric_id, children)
+        metrics_registry[metric_id] = {
+            'original_name': original_name,
+            'prometheus_name': prometheus_name,
+            'created_at': created_at,
+            'type': metric_type
+        }
+        if bounds:
+            metrics_registry[metric_id]['buckets'] = list(bounds[:-1])
+        if label_names:
+            metrics_registry[metric_id]['label_names'] = list(label_names)
+        current_metrics[metric_id] = {
+            'original_name': original_name,
+            'prometheus_name': prometheus_name,
+            'type': metric_type,
+            'label_names': list(label_names),
+            'value': value
+        }
+        # TTLはスナップショットに含まれないため既定値を使う
+        metric_expiry.track(metric_id, getattr(settings, 'METRICS_DEFAULT_TTL', None))
+    
+    metric_id_counter = max(metric_id_counter, counter)
+    current_metric_id = selected
+    snapshot_version = metrics_collector.version
+    print(f"Restored {len(metrics)} metrics from snapshot: {path}")
+
+def start_metrics_snapshot():
+    """スナップショットから復元し、定期的な保存と終了時の保存を開始する
+
+    管理コマンドなどで状態を読み書きしないよう、サーバープロセス（asgi.py）からのみ呼び出す。
+    共有状態（Redis）を使う場合はRedis側で永続化されるためスナップショットは使わない。
+    """
+    global metric_snapshot
+    path = getattr(settings, 'METRICS_SNAPSHOT_PATH', None)
+    if not path or shared_state is not None or metric_snapshot is not None:
+        return
+    
+    # 起動時にスナップショットから復元
+    if os.path.exists(path):
+        try:
+            restore_metrics_snapshot(path)
+        except Exception as e:
+            print(f"Error restoring snapshot: {e}")
+    
+    # 定期的な保存はイベントループ上で状態をコピーして行い（最初のリクエストで開始）、終了時にも保存する
+    metric_snapshot = PeriodicSnapshot(path, collect_metrics_snapshot, metrics_snapshot_saved,
+                                       getattr(settings, 'METRICS_SNAPSHOT_INTERVAL', 10))
+    atexit.register(save_metrics_snapshot, path)
+
 def initialize_default_metrics():
     """初期メトリクスを作成"""
     if not metrics_registry:  # まだメトリクスが作成されていない場合のみ
         create_new_metric("custom_metric_value")
 
+async def reserve_metric_ids():
+    """イベントループ上で get_next_metric_id() を呼び出す前に、共有状態のIDを非同期に予約しておく"""
+    if shared_state is not None:
+        await shared_state.ensure_metric_ids()
+
 def get_next_metric_id():
     """次のメトリクスIDを取得"""
     global metric_id_counter
-    metric_id_counter += 1
+    if shared_state is not None:
+        # 全ワーカーで一意なIDを払い出す
+        metric_id_counter = shared_state.next_metric_id()
+    else:
+        metric_id_counter += 1
     return metric_id_counter
 
-def create_new_metric(metric_name="new_metric"):
-    """新しいメトリクスを作成"""
+def sync_shared_state():
+    """他のワーカーによる共有状態の変更をローカルに反映"""
+    # イベントループ上から呼ばれた場合は削除のスケジューラーとスナップショットの保存を開始しておく
+    metric_sweeper.wake()
+    if metric_snapshot is not None:
+        metric_snapshot.wake()
+    if shared_state is None:
+        return
+    changed = shared_state.load_if_changed(metrics_registry)
+    if changed is not None:
+        apply_shared_changes(*changed)
+
+async def async_sync_shared_state():
+    """sync_shared_state() の非同期ビュー用（Redisの読み込みでイベントループを止めない）"""
+    # 削除のスケジューラーとスナップショットの保存を開始しておく
+    metric_sweeper.wake()
+    if metric_snapshot is not None:
+        metric_snapshot.wake()
+    if shared_state is None:
+        return
+    changed = await shared_state.aload_if_changed(metrics_registry)
+    if changed is not None:
+        apply_shared_changes(*changed)
+
+def apply_shared_changes(changes, selected_metric_id, counter):
+    """共有状態から読み込んだ変更（メトリクスID -> 定義と値、削除はNone）をローカルに反映"""
+    global current_metric_id, metric_id_counter
+    previous_metric_id = current_metric_id
+    current_metric_id, metric_id_counter = selected_metric_id, counter
+    
+    for metric_id, info in changes.items():
+        if info is None:
+            # 他のワーカーで削除されたメトリクス
+            if metric_id in metrics_registry:
+                metrics_collector.remove(metric_id)
+                generator_scheduler.detach(metric_id)
+                metric_expiry.forget(metric_id)
+                del metrics_registry[metric_id]
+                del current_metrics[metric_id]
+                metric_changes.record(metric_id)
+            continue
+        
+        # 他のワーカーで作成・変更されたメトリクス
+        value = info.pop('value')
+        try:
+            metric_type = info.setdefault('type', 'gauge')
+            if metric_id not in metrics_registry:
+                metrics_collector.add(metric_id, info['prometheus_name'], value,
+                                      metric_type=metric_type, buckets=info.get('buckets'),
+                                      label_names=info.get('label_names', ()))
+                current_metrics[metric_id] = {
+                    'type': metric_type,
+                    'label_names': info.get('label_names', []),
+                    'value': metrics_collector.get(metric_id)
+                }
+                metric_expiry.track(metric_id, info.get('ttl'))
+                metric_changes.record(metric_id)
+            else:
+                metrics_collector.rename(metric_id, info['prometheus_name'])
+                # histogram・summaryの観測値とラベル付きメトリクスの子の値はワーカーごとに保持する
+                if metric_type in OBSERVED_TYPES or info.get('label_names'):
+                    value = current_metrics[metric_id]['value']
+                elif metric_type == 'counter':
+                    # counterは減少させられないため、ローカルより古い値は無視する
+                    value = max(value, current_metrics[metric_id]['value'])
+                if (current_metrics[metric_id]['value'] != value
+                        or current_metrics[metric_id]['original_name'] != info['original_name']
+                        or current_metrics[metric_id]['prometheus_name'] != info['prometheus_name']):
+                    metric_changes.record(metric_id)
+                if current_metrics[metric_id]['value'] != value:
+                    metrics_collector.set(metric_id, value)
+                    current_metrics[metric_id]['value'] = value
+                    # 他のワーカーでの更新も最終更新として扱う
+                    metric_expiry.touch(metric_id)
+            
+            metrics_registry[metric_id] = info
+            current_metrics[metric_id]['original_name'] = info['original_name']
+            current_metrics[metric_id]['prometheus_name'] = info['prometheus_name']
+        except ValueError as e:
+            print(f"Error syncing metric: ID={metric_id}, {e}")
+    
+    if current_metric_id not in metrics_registry:
+        current_metric_id = next(iter(metrics_registry), None)
+    if current_metric_id != previous_metric_id:
+        metric_changes.record()
+
+def create_new_metric(metric_name="new_metric", metric_type='gauge', buckets=None, label_names=(), ttl=None):
+    """新しいメトリクスを作成
+
+    bucketsはhistogramのバケット上限、label_namesはラベル名、
+    ttlは最終更新から削除までの秒数（Noneなら METRICS_DEFAULT_TTL）。
+    """
     global current_metric_id
     
     metric_id = get_next_metric_id()
@@ -43,23 +313,42 @@ def create_new_metric(metric_name="new_metric"):
     
     try:
         # 新しいメトリクスを作成
-        gauge = Gauge(prometheus_name, f"Dynamic metric {metric_id} created from web interface")
+        metrics_collector.add(metric_id, prometheus_name, metric_type=metric_type, buckets=buckets,
+                              label_names=label_names)
         
         metrics_registry[metric_id] = {
-            'gauge': gauge,
             'original_name': metric_name,
             'prometheus_name': prometheus_name,
-            'created_at': datetime.now().isoformat()
+            'created_at': datetime.now().isoformat(),
+            'type': metric_type
         }
+        if metric_type == 'histogram':
+            # +Infはそのまま保存できないため除いておく（復元時に補われる）
+            metrics_registry[metric_id]['buckets'] = list(histogram_buckets(buckets)[:-1])
+        if label_names:
+            metrics_registry[metric_id]['label_names'] = list(label_names)
+        if ttl is None:
+            ttl = getattr(settings, 'METRICS_DEFAULT_TTL', None)
+        if ttl is not None:
+            metrics_registry[metric_id]['ttl'] = ttl
         
         current_metrics[metric_id] = {
             'original_name': metric_name,
             'prometheus_name': prometheus_name,
+            'type': metric_type,
+            'label_names': list(label_names),
             'value': 0
         }
         
         # 新しく作成したメトリクスを現在選択中に設定
         current_metric_id = metric_id
+        metric_changes.record(metric_id)
+        metric_expiry.track(metric_id, ttl)
+        metric_sweeper.wake()
+        
+        if shared_state is not None:
+            shared_state.save_metric(metric_id, metrics_registry[metric_id], 0)
+            shared_state.save_current_metric_id(metric_id)
         
         print(f"Created new metric: ID={metric_id}, name={prometheus_name}")
         return metric_id
@@ -68,6 +357,116 @@ def create_new_metric(metric_name="new_metric"):
         print(f"Error creating metric: {e}")
         return None
 
+def set_metric_value(metric_id, value, publish=True, labels=None):
+    """メトリクス値を設定
+
+    publish=False の場合は共有状態への書き込みを行わない（呼び出し側でまとめて書き込む）。
+    labels を指定した場合はラベル付きメトリクスの子の値を設定する（子の値はワーカーごとに保持する）。
+    counterに現在値より小さい値を指定した場合は ValueError。
+    """
+    if labels is not None:
+        metrics_collector.set(metric_id, value, labels)
+        metric_changes.record(metric_id)
+        metric_expiry.touch(metric_id)
+        return
+    
+    metrics_collector.set(metric_id, value)
+    metric_expiry.touch(metric_id)
+    current_metrics[metric_id]['value'] = value
+    metric_changes.record(metric_id)
+    
+    if metric_recorder is not None:
+        metric_recorder.record(metric_id, current_metrics[metric_id]['prometheus_name'], value)
+    
+    if publish and shared_state is not None:
+        shared_state.save_values({metric_id: value})
+
+def observe_metric_values(metric_id, values, labels=None):
+    """観測値をまとめて記録し、記録した件数を返す（histogram・summary・counter）"""
+    count = metrics_collector.observe_many(metric_id, values, labels)
+    metric_expiry.touch(metric_id)
+    if labels is None:
+        current_metrics[metric_id]['value'] = metrics_collector.get(metric_id)
+    metric_changes.record(metric_id)
+    return count
+
+def publish_metric_values(metric_ids):
+    """ローカルのメトリクス値を共有状態にまとめて書き込む"""
+    if shared_state is not None:
+        shared_state.save_values({
+            metric_id: current_metrics[metric_id]['value']
+            for metric_id in metric_ids if metric_id in current_metrics
+        })
+
+def apply_metric_values(values):
+    """複数のメトリクス値を一括で反映し、同期用のメトリクス情報を返す"""
+    synced = []
+    for metric_id, value in values.items():
+        if metric_id not in current_metrics:
+            continue
+        info = current_metrics[metric_id]
+        if info['label_names']:
+            # ラベル付きメトリクスは子を指定しないと更新できない
+            continue
+        if info['type'] in OBSERVED_TYPES:
+            # 値を設定できない種類では生成・再生された値を観測値として記録する
+            observe_metric_values(metric_id, (value,))
+            value = info['value']
+        elif info['type'] == 'counter' and not value >= info['value']:
+            # counterは減少させられないため、現在値より小さい値は反映しない
+            continue
+        else:
+            set_metric_value(metric_id, value, publish=False)
+        synced.append({
+            "metric_id": metric_id,
+            "metric_name": info['original_name'],
+            "prometheus_name": info['prometheus_name'],
+            "metric_value": value
+        })
+    publish_metric_values(metric['metric_id'] for metric in synced)
+    return synced
+
+# 値ジェネレーターを駆動するスケジューラー
+generator_scheduler = GeneratorScheduler(apply_metric_values)
+
+def evict_metrics(metric_ids):
+    """期限切れ・上限超過のメトリクスをまとめて削除し、削除した件数を返す"""
+    global current_metric_id
+    evicted = [metric_id for metric_id in metric_ids if metric_id in metrics_registry]
+    if not evicted:
+        return 0
+    
+    for metric_id in evicted:
+        metrics_collector.remove(metric_id)
+        generator_scheduler.detach(metric_id)
+        del metrics_registry[metric_id]
+        del current_metrics[metric_id]
+        metric_changes.record(metric_id)
+    
+    # 現在選択中のメトリクスだった場合は、他のメトリクスを選択
+    if current_metric_id not in metrics_registry:
+        current_metric_id = next(iter(metrics_registry), None)
+        if shared_state is not None:
+            shared_state.save_current_metric_id(current_metric_id)
+    
+    if shared_state is not None:
+        shared_state.delete_metrics(evicted)
+    
+    print(f"Evicted {len(evicted)} metrics")
+    return len(evicted)
+
+# 期限切れ・上限超過のメトリクスを削除するスケジューラー
+metric_sweeper = MetricSweeper(metric_expiry, lambda: metrics_collector.series_count, evict_metrics,
+                               metrics_collector.metric_series_count)
+
+async def resolve_replay_metric(prometheus_name):
+    """再生対象のメトリクスIDを取得（存在しない場合は作成）"""
+    metric_id = metrics_collector.metric_id_for(prometheus_name)
+    if metric_id is not None:
+        return metric_id, False
+    await reserve_metric_ids()
+    return create_new_metric(prometheus_name), True
+
 def convert_to_prometheus_name(metric_name):
     """メトリクス名をPrometheus形式に変換"""
     prometheus_name = re.sub(r'[^a-zA-Z0-9_]', '_', metric_name)
@@ -87,31 +486,24 @@ def update_metric_name(metric_id, new_name):
     old_prometheus_name = metrics_registry[metric_id]['prometheus_name']
     new_prometheus_name = convert_to_prometheus_name(new_name)
     
-    # 同名のメトリクスが他に存在するかチェック
-    for existing_id, info in metrics_registry.items():
-        if existing_id != metric_id and info['prometheus_name'] == new_prometheus_name:
-            new_prometheus_name = f"{new_prometheus_name}_{metric_id}"
-            break
+    # 同名のメトリクス（*_total などを含む）が他に存在するかチェック
+    if not metrics_collector.name_available(new_prometheus_name, metrics_collector.metric_type(metric_id), metric_id):
+        new_prometheus_name = f"{new_prometheus_name}_{metric_id}"
     
     try:
-        # 新しい名前でメトリクスを再作成
-        old_gauge = metrics_registry[metric_id]['gauge']
-        old_value = current_metrics[metric_id]['value']
-        
-        # 古いメトリクスを削除
-        REGISTRY.unregister(old_gauge)
-        
-        # 新しいメトリクスを作成
-        new_gauge = Gauge(new_prometheus_name, f"Dynamic metric {metric_id} created from web interface")
-        new_gauge.set(old_value)
+        # Collector上の名前のみ変更（値はそのまま保持される）
+        metrics_collector.rename(metric_id, new_prometheus_name)
         
         # 情報を更新
-        metrics_registry[metric_id]['gauge'] = new_gauge
         metrics_registry[metric_id]['original_name'] = new_name
         metrics_registry[metric_id]['prometheus_name'] = new_prometheus_name
         
         current_metrics[metric_id]['original_name'] = new_name
         current_metrics[metric_id]['prometheus_name'] = new_prometheus_name
+        metric_changes.record(metric_id)
+        
+        if shared_state is not None:
+            shared_state.save_metric(metric_id, metrics_registry[metric_id], current_metrics[metric_id]['value'])
         
         print(f"Updated metric name: ID={metric_id}, {old_prometheus_name} -> {new_prometheus_name}")
         return True
@@ -126,13 +518,15 @@ def delete_metric_by_id(metric_id):
         return False
     
     try:
-        # Prometheusレジストリから削除
-        gauge = metrics_registry[metric_id]['gauge']
-        REGISTRY.unregister(gauge)
+        # Collectorから削除
+        metrics_collector.remove(metric_id)
+        generator_scheduler.detach(metric_id)
+        metric_expiry.forget(metric_id)
         
         # 内部レジストリから削除
         del metrics_registry[metric_id]
         del current_metrics[metric_id]
+        metric_changes.record(metric_id)
         
         # 現在選択中のメトリクスだった場合は、他のメトリクスを選択
         global current_metric_id
@@ -141,6 +535,11 @@ def delete_metric_by_id(metric_id):
                 current_metric_id = next(iter(metrics_registry.keys()))
             else:
                 current_metric_id = None
+            if shared_state is not None:
+                shared_state.save_current_metric_id(current_metric_id)
+        
+        if shared_state is not None:
+            shared_state.delete_metrics([metric_id])
         
         print(f"Deleted metric: ID={metric_id}")
         return True
@@ -151,23 +550,311 @@ def delete_metric_by_id(metric_id):
 
 def index(request):
     """メイン画面を表示"""
+    sync_shared_state()
     # 初期メトリクスを作成
     initialize_default_metrics()
     return render(request, 'metrics_app/index.html')
 
+def negotiate_metrics_format(request):
+    """Accept / Accept-Encoding ヘッダーから /metrics の形式を決定
+
+    (エンコーダー, Content-Type, OpenMetrics形式か, gzip圧縮するか) を返す。
+    """
+    encoder, content_type = choose_encoder(request.headers.get('Accept'))
+    openmetrics = content_type.startswith('application/openmetrics-text')
+    compress = gzip_accepted(request.headers.get('Accept-Encoding', ''))
+    return encoder, content_type, openmetrics, compress
+
+def metrics_etag_variant(request):
+    """ETagで形式・圧縮の違いを区別するための文字列"""
+    _, _, openmetrics, compress = negotiate_metrics_format(request)
+    return ('-om' if openmetrics else '') + ('-gz' if compress else '')
+
+def metrics_etag(request):
+    """/metrics のETag（動的メトリクスが変更された場合のみ変化する）
+
+    プロセス情報などの標準メトリクス（REGISTRY）は毎回値が変わるためETagには含めない。
+    """
+    if 'synthetic' in request.GET:
+        # 合成ターゲットは値が時刻に依存するためETagを付けない
+        return None
+    sync_shared_state()
+    return metrics_collector.etag(metrics_etag_variant(request))
+
+async def stream_synthetic_metrics(target, openmetrics, compress):
+    """合成ターゲットのexpositionをチャンクごとに送信（gzipもチャンク単位で圧縮）
+
+    ASGIで全体をメモリに読み込まずに送信できるよう、非同期イテレーターとして実装している。
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
+    for chunk in target.iter_exposition(openmetrics):
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+            if not chunk:
+                continue
+        yield chunk
+    if compressor is not None:
+        yield compressor.flush()
+
+def synthetic_metrics_response(request, name):
+    """合成ターゲットのメトリクスをストリーミングで返す"""
+    target = synthetic_targets.get(name)
+    if target is None:
+        return HttpResponse(f'Synthetic target not found: {name}\n', status=404, content_type='text/plain')
+    
+    _, content_type, openmetrics, compress = negotiate_metrics_format(request)
+    response = StreamingHttpResponse(stream_synthetic_metrics(target, openmetrics, compress), content_type=content_type)
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
+
+@condition(etag_func=metrics_etag)
 def metrics(request):
-    """Prometheusメトリクスエンドポイント"""
-    return HttpResponse(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+    """Prometheusメトリクスエンドポイント（?synthetic=<name> で合成ターゲットを出力）"""
+    if 'synthetic' in request.GET:
+        return synthetic_metrics_response(request, request.GET['synthetic'])
+    
+    encoder, content_type, openmetrics, compress = negotiate_metrics_format(request)
+    
+    # プロセス情報などの標準メトリクスは毎回生成し、動的メトリクスはキャッシュを利用
+    started = time.perf_counter()
+    standard = encoder(REGISTRY)
+    if openmetrics:
+        # # EOF は動的メトリクスの後ろに付ける
+        standard = standard.removesuffix(b'# EOF\n')
+    
+    if compress:
+        # gzipは複数メンバーの連結が可能なため、動的メトリクス部分は圧縮済みのキャッシュを使う
+        body = gzip.compress(standard) + metrics_collector.render(openmetrics, compress=True)
+    else:
+        body = standard + metrics_collector.render(openmetrics)
+    METRICS_RENDER_SECONDS.observe(time.perf_counter() - started)
+    METRICS_PAYLOAD_BYTES.observe(len(body))
+    
+    response = HttpResponse(body, content_type=content_type)
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
+
+def target_metrics_etag(request, target):
+    """/metrics/<target> のETag（ターゲットが存在しない場合はNone）"""
+    virtual_target = virtual_targets.get(target)
+    if virtual_target is None:
+        return None
+    return virtual_target.collector.etag(metrics_etag_variant(request))
+
+@condition(etag_func=target_metrics_etag)
+def target_metrics(request, target):
+    """仮想エクスポーターのメトリクスエンドポイント（そのターゲットの系列のみ）"""
+    virtual_target = virtual_targets.get(target)
+    if virtual_target is None:
+        return HttpResponse(f'Target not found: {target}\n', status=404, content_type='text/plain')
+    
+    _, content_type, openmetrics, compress = negotiate_metrics_format(request)
+    response = HttpResponse(virtual_target.collector.render(openmetrics, compress), content_type=content_type)
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
+
+@csrf_exempt
+def create_targets(request):
+    """仮想エクスポーターをまとめて作成する
+
+    {"names": [...]} または {"prefix": "node-", "count": 100} で名前を指定し、
+    "metrics" に各ターゲットに作成するメトリクス（name, type, buckets, value）を指定する。
+    作成するターゲット数が VIRTUAL_TARGETS_MAX_COUNT を超える場合は400を返す。
+    """
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            max_count = getattr(settings, 'VIRTUAL_TARGETS_MAX_COUNT', 10000)
+            names = data.get('names')
+            if names is None:
+                prefix = data.get('prefix', 'target-')
+                start = int(data.get('start', 1))
+                count = int(data.get('count', 1))
+                if count > max_count:
+                    return JsonResponse(
+                        {'status': 'error', 'message': f'Too many targets: {count} (max {max_count})'},
+                        status=400)
+                names = [f"{prefix}{i}" for i in range(start, start + count)]
+            metrics = data.get('metrics', [])
+            if not isinstance(names, list) or not isinstance(metrics, list):
+                return JsonResponse({'status': 'error', 'message': 'names and metrics must be lists'})
+            if len(names) > max_count:
+                return JsonResponse(
+                    {'status': 'error', 'message': f'Too many targets: {len(names)} (max {max_count})'},
+                    status=400)
+            
+            targets = virtual_targets.create_many(names, metrics)
+            print(f"Created {len(targets)} virtual targets")
+            
+            return JsonResponse({
+                'status': 'success',
+                'created': len(targets),
+                'targets': [target.name for target in targets]
+            })
+            
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
+    
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+@csrf_exempt
+def delete_targets(request):
+    """仮想エクスポーターをまとめて削除する（names / prefix、どちらもなければ全て）"""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            deleted = virtual_targets.delete_many(data.get('names'), data.get('prefix'))
+            print(f"Deleted {len(deleted)} virtual targets")
+            
+            return JsonResponse({'status': 'success', 'deleted': len(deleted)})
+            
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
+    
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+@csrf_exempt
+def update_target_metrics(request):
+    """仮想エクスポーターのメトリクス値を一括で更新する
+
+    updates の各要素は target, metric と、value（設定）または values（観測値）を持つ。
+    ラベル付きメトリクスでは labels で子を指定する。
+    """
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            updates = data.get('updates') if isinstance(data, dict) else data
+            if not isinstance(updates, list):
+                return JsonResponse({'status': 'error', 'message': 'updates must be a list'})
+            
+            results = []
+            for index, item in enumerate(updates):
+                try:
+                    if not isinstance(item, dict):
+                        raise ValueError('update must be an object')
+                    virtual_target = virtual_targets.get(item.get('target'))
+                    if virtual_target is None:
+                        raise LookupError(f"Target not found: {item.get('target')}")
+                    metric_id = virtual_target.metric_id(item.get('metric'))
+                    
+                    if item.get('values') is not None:
+                        virtual_target.collector.observe_many(metric_id, item['values'], item.get('labels'))
+                    elif item.get('value') is not None:
+                        virtual_target.collector.set(metric_id, float(item['value']), item.get('labels'))
+                    else:
+                        raise ValueError('value or values is required')
+                    results.append({'index': index, 'status': 'success'})
+                except Exception as e:
+                    results.append({'index': index, 'status': 'error', 'message': str(e)})
+            
+            failed = sum(1 for result in results if result['status'] == 'error')
+            return JsonResponse({
+                'status': 'success',
+                'updated': len(results) - failed,
+                'failed': failed,
+                'results': results
+            })
+            
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
+    
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+def get_targets(request):
+    """仮想エクスポーターの一覧を取得するAPI
+
+    ?format=http_sd の場合はPrometheusのHTTPサービスディスカバリー形式で返す。
+    """
+    if request.GET.get('format') == 'http_sd':
+        host = request.get_host()
+        return JsonResponse([
+            {'targets': [host], 'labels': {'__metrics_path__': f'/metrics/{target.name}', 'target': target.name}}
+            for target in virtual_targets
+        ], safe=False)
+    
+    return JsonResponse({
+        'status': 'success',
+        'targets': [target.to_dict() for target in virtual_targets]
+    })
 
 @csrf_exempt
-def update_metric(request):
+def create_synthetic_target(request):
+    """合成ターゲットを作成（同じ名前があれば置き換える）
+
+    families・labels（ラベル名 -> カーディナリティ）・value（値の生成方法）で系列を定義する。
+    """
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            name = data.get('name')
+            if not name:
+                return JsonResponse({'status': 'error', 'message': 'name is required'})
+            
+            target = SyntheticTarget(name, data, getattr(settings, 'SYNTHETIC_MAX_SERIES', None))
+            synthetic_targets[name] = target
+            print(f"Created synthetic target: {name} ({target.series_count} series)")
+            
+            return JsonResponse({'status': 'success', 'target': target.to_dict()})
+            
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
+    
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+@csrf_exempt
+def delete_synthetic_target(request):
+    """合成ターゲットを削除"""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            name = data.get('name')
+            if synthetic_targets.pop(name, None) is None:
+                return JsonResponse({'status': 'error', 'message': f'Synthetic target not found: {name}'})
+            print(f"Deleted synthetic target: {name}")
+            
+            return JsonResponse({'status': 'success', 'name': name})
+            
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
+    
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+def get_synthetic_targets(request):
+    """合成ターゲットの一覧を取得するAPI"""
+    return JsonResponse({
+        'status': 'success',
+        'targets': [target.to_dict() for target in synthetic_targets.values()]
+    })
+
+def internal_metrics(request):
+    """エクスポーター自身の計測メトリクスエンドポイント"""
+    return HttpResponse(generate_latest(INTERNAL_REGISTRY), content_type=CONTENT_TYPE_LATEST)
+
+@csrf_exempt
+@timed_view('update_metric')
+async def update_metric(request):
     """メトリクス値を更新"""
+    await async_sync_shared_state()
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
             metric_id = data.get('metric_id')
+            prometheus_name = data.get('prometheus_name')
             metric_name = data.get('metric_name')
             metric_value = data.get('metric_value')
+            labels = data.get('labels')
+            
+            # Prometheus名で指定された場合はIDに変換
+            if metric_id is None and prometheus_name is not None:
+                metric_id = metrics_collector.metric_id_for(prometheus_name)
+                if metric_id is None:
+                    return JsonResponse({'status': 'error', 'message': 'Metric not found'})
             
             # メトリクスIDが指定されていない場合は現在選択中のメトリクスを使用
             if metric_id is None:
@@ -185,27 +872,30 @@ def update_metric(request):
             if metric_value is not None:
                 if metric_id in metrics_registry:
                     metric_value = float(metric_value)
-                    metrics_registry[metric_id]['gauge'].set(metric_value)
-                    current_metrics[metric_id]['value'] = metric_value
+                    set_metric_value(metric_id, metric_value, labels=labels)
+            
+            # ラベル付きメトリクスの子はダッシュボードに表示しないため通知しない
+            if labels is not None and metric_id in metrics_registry:
+                return JsonResponse({
+                    'status': 'success',
+                    'metric_id': metric_id,
+                    'labels': labels,
+                    'value': metrics_collector.get(metric_id, labels)
+                })
             
             # 現在のメトリクス情報を取得
             if metric_id in metrics_registry:
                 metric_info = metrics_registry[metric_id]
                 current_info = current_metrics[metric_id]
                 
-                # WebSocketで他のクライアントに通知
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "metrics_sync",
-                    {
-                        "type": "metric_sync",
-                        "metric_id": metric_id,
-                        "metric_name": current_info['original_name'],
-                        "prometheus_name": current_info['prometheus_name'],
-                        "metric_value": current_info['value'],
-                        "sender_channel": None  # サーバーからの更新
-                    }
-                )
+                # WebSocketで他のクライアントに通知（ティック単位でまとめて送信）
+                await metric_sync_coalescer.submit({
+                    "metric_id": metric_id,
+                    "metric_name": current_info['original_name'],
+                    "prometheus_name": current_info['prometheus_name'],
+                    "metric_value": current_info['value'],
+                    "sender_channel": None  # サーバーからの更新
+                })
                 
                 return JsonResponse({
                     'status': 'success',
@@ -223,8 +913,454 @@ def update_metric(request):
     return JsonResponse({'status': 'error', 'message': 'POST method required'})
 
 @csrf_exempt
-def webhook(request):
+@timed_view('bulk_update_metrics')
+async def bulk_update_metrics(request):
+    """複数のメトリクス値を一括で更新（WebSocket通知は1回のみ）"""
+    await async_sync_shared_state()
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            # 配列そのもの、または {"updates": [...]} の両方を受け付ける
+            updates = data.get('updates') if isinstance(data, dict) else data
+            if not isinstance(updates, list):
+                return JsonResponse({'status': 'error', 'message': 'updates must be a list'})
+
+            results = []
+            synced = {}
+            for index, item in enumerate(updates):
+                try:
+                    if not isinstance(item, dict):
+                        raise ValueError('update must be an object')
+
+                    metric_id = item.get('metric_id')
+                    prometheus_name = item.get('prometheus_name')
+                    if metric_id is None and prometheus_name is not None:
+                        metric_id = metrics_collector.metric_id_for(prometheus_name)
+                    elif metric_id is not None:
+                        metric_id = int(metric_id)
+
+                    if metric_id is None or metric_id not in metrics_registry:
+                        raise LookupError('Metric not found')
+
+                    metric_value = item.get('metric_value', item.get('value'))
+                    if metric_value is None:
+                        raise ValueError('metric_value is required')
+                    metric_value = float(metric_value)
+                    labels = item.get('labels')
+
+                    set_metric_value(metric_id, metric_value, publish=False, labels=labels)
+
+                    result = {'index': index, 'status': 'success', 'metric_id': metric_id, 'value': metric_value}
+                    if labels is None:
+                        # 同じメトリクスへの複数更新は最後の値のみ通知する
+                        synced[metric_id] = metric_value
+                    else:
+                        result['labels'] = labels
+                    results.append(result)
+                except Exception as e:
+                    results.append({'index': index, 'status': 'error', 'message': str(e)})
+
+            if synced:
+                publish_metric_values(synced)
+                
+                # WebSocketで他のクライアントにまとめて通知
+                channel_layer = get_channel_layer()
+                await timed_group_send(
+                    channel_layer,
+                    "metrics_sync",
+                    {
+                        "type": "metric_sync_batch",
+                        "metrics": [
+                            {
+                                "metric_id": metric_id,
+                                "metric_name": current_metrics[metric_id]['original_name'],
+                                "prometheus_name": current_metrics[metric_id]['prometheus_name'],
+                                "metric_value": metric_value
+                            }
+                            for metric_id, metric_value in synced.items()
+                            if metric_id in current_metrics
+                        ],
+                        "sender_channel": None  # サーバーからの更新
+                    }
+                )
+
+            failed = sum(1 for result in results if result['status'] == 'error')
+            return JsonResponse({
+                'status': 'success',
+                'updated': len(results) - failed,
+                'failed': failed,
+                'results': results
+            })
+
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
+
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+@csrf_exempt
+@timed_view('observe_metrics')
+async def observe_metrics(request):
+    """複数のメトリクスに観測値を一括で記録（WebSocket通知は1回のみ）
+
+    histogram・summaryには観測値を、counterには増分を記録する。
+    """
+    await async_sync_shared_state()
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            # 配列そのもの、または {"observations": [...]} の両方を受け付ける
+            observations = data.get('observations') if isinstance(data, dict) else data
+            if not isinstance(observations, list):
+                return JsonResponse({'status': 'error', 'message': 'observations must be a list'})
+
+            results = []
+            observed = set()
+            for index, item in enumerate(observations):
+                try:
+                    if not isinstance(item, dict):
+                        raise ValueError('observation must be an object')
+
+                    metric_id = item.get('metric_id')
+                    prometheus_name = item.get('prometheus_name')
+                    if metric_id is None and prometheus_name is not None:
+                        metric_id = metrics_collector.metric_id_for(prometheus_name)
+                    elif metric_id is not None:
+                        metric_id = int(metric_id)
+
+                    if metric_id is None or metric_id not in metrics_registry:
+                        raise LookupError('Metric not found')
+
+                    values = item.get('values')
+                    if not isinstance(values, list):
+                        raise ValueError('values must be a list')
+
+                    labels = item.get('labels')
+                    count = observe_metric_values(metric_id, values, labels)
+                    result = {'index': index, 'status': 'success', 'metric_id': metric_id, 'observed': count}
+                    if labels is None:
+                        observed.add(metric_id)
+                    else:
+                        result['labels'] = labels
+                    results.append(result)
+                except Exception as e:
+                    results.append({'index': index, 'status': 'error', 'message': str(e)})
+
+            if observed:
+                # counterの値のみ共有状態に書き込む（histogram・summaryの観測値はワーカーごとに保持）
+                publish_metric_values(
+                    metric_id for metric_id in observed
+                    if current_metrics[metric_id]['type'] not in OBSERVED_TYPES)
+
+                # WebSocketで他のクライアントにまとめて通知
+                channel_layer = get_channel_layer()
+                await timed_group_send(
+                    channel_layer,
+                    "metrics_sync",
+                    {
+                        "type": "metric_sync_batch",
+                        "metrics": [
+                            {
+                                "metric_id": metric_id,
+                                "metric_name": current_metrics[metric_id]['original_name'],
+                                "prometheus_name": current_metrics[metric_id]['prometheus_name'],
+                                "metric_value": current_metrics[metric_id]['value']
+                            }
+                            for metric_id in observed
+                            if metric_id in current_metrics
+                        ],
+                        "sender_channel": None  # サーバーからの更新
+                    }
+                )
+
+            failed = sum(1 for result in results if result['status'] == 'error')
+            return JsonResponse({
+                'status': 'success',
+                'observed': sum(result.get('observed', 0) for result in results),
+                'failed': failed,
+                'results': results
+            })
+
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
+
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+def get_metric_children(request):
+    """ラベル付きメトリクスの子の一覧を取得するAPI
+
+    ?metric_id= または ?prometheus_name= でメトリクスを指定し、
+    ?match=name=value で完全一致するラベルの子に絞り込む（複数指定可）。
+    """
+    sync_shared_state()
+    try:
+        metric_id = request.GET.get('metric_id')
+        prometheus_name = request.GET.get('prometheus_name')
+        if metric_id is None and prometheus_name is not None:
+            metric_id = metrics_collector.metric_id_for(prometheus_name)
+        elif metric_id is not None:
+            metric_id = int(metric_id)
+        
+        if metric_id is None or metric_id not in metrics_registry:
+            return JsonResponse({'status': 'error', 'message': 'Metric not found'})
+        
+        match = dict(matcher.split('=', 1) for matcher in request.GET.getlist('match'))
+        label_names = metrics_collector.label_names(metric_id)
+        children = metrics_collector.children(metric_id, match)
+        
+        return JsonResponse({
+            'status': 'success',
+            'metric_id': metric_id,
+            'label_names': list(label_names),
+            'children': [
+                {'labels': dict(zip(label_names, key)), 'value': value, 'count': count}
+                for key, value, count in children
+            ]
+        })
+        
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
+
+@csrf_exempt
+def delete_metric_children(request):
+    """ラベルが一致する子をまとめて削除する
+
+    match はラベル名 -> 値（完全一致）、match_re はラベル名 -> 正規表現（全体一致）。
+    どちらも指定しない場合は全ての子を削除する（メトリクス自体は残る）。
+    """
+    sync_shared_state()
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            metric_id = data.get('metric_id')
+            prometheus_name = data.get('prometheus_name')
+            if metric_id is None and prometheus_name is not None:
+                metric_id = metrics_collector.metric_id_for(prometheus_name)
+            elif metric_id is not None:
+                metric_id = int(metric_id)
+            
+            if metric_id is None or metric_id not in metrics_registry:
+                return JsonResponse({'status': 'error', 'message': 'Metric not found'})
+            
+            removed = metrics_collector.remove_children(metric_id, data.get('match'), data.get('match_re'))
+            if removed:
+                metric_changes.record(metric_id)
+            print(f"Deleted {removed} children of metric: ID={metric_id}")
+            
+            return JsonResponse({'status': 'success', 'metric_id': metric_id, 'deleted': removed})
+            
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
+    
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+@csrf_exempt
+async def attach_generator(request):
+    """メトリクスに値ジェネレーターを設定する"""
+    await async_sync_shared_state()
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            metric_id = data.get('metric_id')
+            prometheus_name = data.get('prometheus_name')
+            
+            if metric_id is None and prometheus_name is not None:
+                metric_id = metrics_collector.metric_id_for(prometheus_name)
+            elif metric_id is not None:
+                metric_id = int(metric_id)
+            
+            if metric_id is None or metric_id not in metrics_registry:
+                return JsonResponse({'status': 'error', 'message': 'Metric not found'})
+            
+            if current_metrics[metric_id]['label_names']:
+                return JsonResponse({'status': 'error', 'message': 'Generators are not supported for labeled metrics'})
+            
+            generator = create_generator(data.get('type'), data.get('params'))
+            generator_scheduler.attach(metric_id, generator)
+            
+            return JsonResponse({
+                'status': 'success',
+                'metric_id': metric_id,
+                'type': data.get('type')
+            })
+            
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
+    
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+@csrf_exempt
+async def detach_generator(request):
+    """メトリクスの値ジェネレーターを解除する"""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            metric_id = data.get('metric_id')
+            
+            if metric_id is None:
+                return JsonResponse({'status': 'error', 'message': 'metric_id is required'})
+            
+            if not generator_scheduler.detach(int(metric_id)):
+                return JsonResponse({'status': 'error', 'message': 'Generator not found'})
+            
+            return JsonResponse({'status': 'success', 'metric_id': int(metric_id)})
+            
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
+    
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+@csrf_exempt
+async def start_recording(request):
+    """メトリクス値の変更の記録を開始する"""
+    if request.method == 'POST':
+        try:
+            global metric_recorder
+            data = json.loads(request.body)
+            path = recording_path(data.get('name'))
+            
+            if metric_recorder is not None:
+                return JsonResponse({'status': 'error', 'message': 'Recording already in progress'})
+            
+            metric_recorder = MetricRecorder(path)
+            print(f"Started recording: {path}")
+            
+            return JsonResponse({'status': 'success', 'name': data.get('name')})
+            
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
+    
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+@csrf_exempt
+async def stop_recording(request):
+    """メトリクス値の変更の記録を終了する"""
+    if request.method == 'POST':
+        global metric_recorder
+        if metric_recorder is None:
+            return JsonResponse({'status': 'error', 'message': 'Not recording'})
+        
+        recorder, metric_recorder = metric_recorder, None
+        recorder.close()
+        print(f"Stopped recording: {recorder.path} ({recorder.count} updates)")
+        
+        return JsonResponse({'status': 'success', 'recorded': recorder.count})
+    
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+@csrf_exempt
+async def start_replay(request):
+    """記録したメトリクス値を指定倍速で再生する"""
+    if request.method == 'POST':
+        try:
+            global metric_replayer
+            data = json.loads(request.body)
+            path = recording_path(data.get('name'))
+            
+            if metric_replayer is not None and metric_replayer.running:
+                return JsonResponse({'status': 'error', 'message': 'Replay already in progress'})
+            
+            metric_replayer = MetricReplayer(
+                path, resolve_replay_metric, apply_metric_values,
+                speed=float(data.get('speed', 1.0)))
+            metric_replayer.start()
+            print(f"Started replay: {path} (x{metric_replayer.speed})")
+            
+            return JsonResponse({
+                'status': 'success',
+                'name': data.get('name'),
+                'speed': metric_replayer.speed
+            })
+            
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
+    
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+@csrf_exempt
+async def stop_replay(request):
+    """再生中のメトリクス値の再生を停止する"""
+    if request.method == 'POST':
+        if metric_replayer is None or not metric_replayer.running:
+            return JsonResponse({'status': 'error', 'message': 'Not replaying'})
+        
+        metric_replayer.stop()
+        
+        return JsonResponse({'status': 'success', 'replayed': metric_replayer.count})
+    
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+def resolve_rule_target(target):
+    """ルールの更新対象のメトリクスIDを取得（存在しなければNone）"""
+    metric_id, prometheus_name = target
+    if metric_id is None:
+        metric_id = metrics_collector.metric_id_for(prometheus_name)
+    # ルールはラベルを持たないため、ラベル付きメトリクスは対象外とする
+    if metric_id not in current_metrics or current_metrics[metric_id]['label_names']:
+        return None
+    return metric_id
+
+async def apply_webhook_rules(items):
+    """webhookの内容にルールを適用し、メトリクスをまとめて更新・通知する
+
+    items は (JSONデータ, メッセージ文字列) のリスト。更新したメトリクス数を返す。
+    """
+    values, increments = webhook_rules.evaluate(items)
+    if not values and not increments:
+        return 0
+    
+    updates, synced = {}, []
+    for target, samples in values.items():
+        metric_id = resolve_rule_target(target)
+        if metric_id is None:
+            continue
+        if current_metrics[metric_id]['type'] in OBSERVED_TYPES:
+            # histogram・summaryは抽出した全ての値をまとめて観測する
+            observe_metric_values(metric_id, samples)
+            info = current_metrics[metric_id]
+            synced.append({
+                "metric_id": metric_id,
+                "metric_name": info['original_name'],
+                "prometheus_name": info['prometheus_name'],
+                "metric_value": info['value']
+            })
+        else:
+            # それ以外は最後の値を設定する
+            updates[metric_id] = samples[-1]
+    for target, amount in increments.items():
+        metric_id = resolve_rule_target(target)
+        # 加算できるのはgauge・counterのみ
+        if metric_id is None or current_metrics[metric_id]['type'] in OBSERVED_TYPES:
+            continue
+        updates[metric_id] = updates.get(metric_id, current_metrics[metric_id]['value']) + amount
+    
+    synced += apply_metric_values(updates)
+    if synced:
+        # WebSocketで他のクライアントにまとめて通知
+        await timed_group_send(
+            get_channel_layer(),
+            "metrics_sync",
+            {
+                "type": "metric_sync_batch",
+                "metrics": synced,
+                "sender_channel": None  # サーバーからの更新
+            }
+        )
+    return len(synced)
+
+async def store_webhook_messages(messages):
+    """webhookメッセージをバッファに追加し、最後のシーケンス番号を返す
+
+    Redis上のバッファへの書き込みはイベントループを止めないよう別スレッドで行う。
+    """
+    if shared_state is not None:
+        return await sync_to_async(webhook_messages.extend, thread_sensitive=False)(messages)
+    return webhook_messages.extend(messages)
+
+@csrf_exempt
+@timed_view('webhook')
+async def webhook(request):
     """webhookエンドポイント - 外部からのメッセージを受信"""
+    await async_sync_shared_state()
     if request.method == 'POST':
         try:
             # リクエストボディからデータを取得
@@ -235,6 +1371,7 @@ def webhook(request):
                 message = data.get('message', 'No message provided')
             else:
                 # プレーンテキストの場合
+                data = None
                 message = request.body.decode('utf-8')
             
             # メッセージを保存（タイムスタンプ付き）
@@ -243,15 +1380,13 @@ def webhook(request):
                 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                 'content_type': content_type
             }
-            webhook_messages.append(webhook_message)
-            
-            # 最新の100件のみ保持
-            if len(webhook_messages) > 100:
-                webhook_messages.pop(0)
+            # 容量を超えた分は古いものから上書きされる
+            await store_webhook_messages([webhook_message])
             
             # WebSocketでリアルタイム通知を送信
             channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
+            await timed_group_send(
+                channel_layer,
                 "webhook_messages",
                 {
                     "type": "webhook_message",
@@ -259,10 +1394,14 @@ def webhook(request):
                 }
             )
             
+            # ルールに一致した内容でメトリクスを更新
+            updated = await apply_webhook_rules([(data, message if isinstance(message, str) else None)])
+            
             return JsonResponse({
                 'status': 'success', 
                 'message': 'Webhook received successfully',
-                'received_message': message
+                'received_message': message,
+                'updated_metrics': updated
             })
             
         except Exception as e:
@@ -270,92 +1409,366 @@ def webhook(request):
     
     return JsonResponse({'status': 'error', 'message': 'POST method required'})
 
-def get_webhook_messages(request):
-    """webhookメッセージを取得するAPI"""
+# 一括webhookのWebSocket通知に含める最新メッセージの件数
+WEBHOOK_BATCH_PREVIEW = 50
+
+@csrf_exempt
+@timed_view('webhook_batch')
+async def webhook_batch(request):
+    """一括webhookエンドポイント - NDJSONまたはJSON配列で複数のメッセージを受信
+
+    本文は全体を読み込まずに1件ずつ解析し、バッファへまとめて追加する。
+    WebSocket通知はバッチごとに1回のみ送信する。
+    """
+    await async_sync_shared_state()
+    if request.method == 'POST':
+        try:
+            content_type = request.content_type
+            max_batch_size = getattr(settings, 'WEBHOOK_MAX_BATCH_SIZE', 10000)
+            
+            if content_type in NDJSON_CONTENT_TYPES:
+                items = iter_ndjson(request)
+            elif 'application/json' in content_type:
+                items = iter_json_array(request)
+            else:
+                return JsonResponse({'status': 'error', 'message': f'Unsupported content type: {content_type}'})
+            
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            batch, items_data = [], []
+            for item in items:
+                if len(batch) >= max_batch_size:
+                    return JsonResponse(
+                        {'status': 'error', 'message': f'Batch too large (max {max_batch_size} messages)'},
+                        status=413)
+                items_data.append(item)
+                batch.append({
+                    'message': item.get('message', 'No message provided') if isinstance(item, dict) else item,
+                    'timestamp': timestamp,
+                    'content_type': content_type
+                })
+            
+            if not batch:
+                return JsonResponse({'status': 'success', 'received': 0})
+            
+            # 容量を超えた分は古いものから上書きされる
+            last_seq = await store_webhook_messages(batch)
+            
+            # WebSocketでリアルタイム通知を送信（最新の一部のみ）
+            channel_layer = get_channel_layer()
+            await timed_group_send(
+                channel_layer,
+                "webhook_messages",
+                {
+                    "type": "webhook_batch",
+                    "count": len(batch),
+                    "messages": [
+                        f"[{message['timestamp']}] {message['message']}"
+                        for message in batch[-WEBHOOK_BATCH_PREVIEW:]
+                    ]
+                }
+            )
+            
+            # ルールに一致した内容でメトリクスをまとめて更新
+            updated = await apply_webhook_rules([
+                (item, message['message'] if isinstance(message['message'], str) else None)
+                for item, message in zip(items_data, batch)
+            ])
+            
+            return JsonResponse({
+                'status': 'success',
+                'received': len(batch),
+                'first_seq': last_seq - len(batch) + 1,
+                'last_seq': last_seq,
+                'updated_metrics': updated
+            })
+            
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
+    
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+@csrf_exempt
+def add_webhook_rules(request):
+    """webhookからメトリクスを更新するルールを追加する
+
+    ルール1件、ルールの配列、または {"rules": [...]} を受け付ける。
+    """
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            if isinstance(data, dict) and 'rules' in data:
+                data = data['rules']
+            specs = data if isinstance(data, list) else [data]
+            
+            results = []
+            for index, spec in enumerate(specs):
+                try:
+                    rule = webhook_rules.add(spec)
+                    results.append({'index': index, 'status': 'success', 'rule': rule.to_dict()})
+                except Exception as e:
+                    results.append({'index': index, 'status': 'error', 'message': str(e)})
+            
+            failed = sum(1 for result in results if result['status'] == 'error')
+            return JsonResponse({
+                'status': 'success',
+                'added': len(results) - failed,
+                'failed': failed,
+                'results': results
+            })
+            
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
+    
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+def get_webhook_rules(request):
+    """webhookのルール一覧を取得するAPI"""
     return JsonResponse({
         'status': 'success',
-        'messages': webhook_messages[-20:]  # 最新20件を返す
+        'rules': [rule.to_dict() for rule in webhook_rules.rules()]
     })
 
-def get_current_metrics(request):
-    """現在のメトリクス値を取得するAPI"""
-    # 初期メトリクスを作成
-    initialize_default_metrics()
-    
-    metrics_data = []
-    for metric_id, info in current_metrics.items():
-        metrics_data.append({
-            'metric_id': metric_id,
-            'original_name': info['original_name'],
-            'prometheus_name': info['prometheus_name'],
-            'value': info['value']
-        })
+@csrf_exempt
+def delete_webhook_rules(request):
+    """webhookのルールを削除する（rule_id / rule_ids、all: true で全削除）"""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            if data.get('all'):
+                deleted = len(webhook_rules)
+                webhook_rules.clear()
+                return JsonResponse({'status': 'success', 'deleted': deleted})
+            
+            rule_ids = data.get('rule_ids')
+            if rule_ids is None:
+                if data.get('rule_id') is None:
+                    return JsonResponse({'status': 'error', 'message': 'rule_id is required'})
+                rule_ids = [data['rule_id']]
+            
+            deleted = sum(1 for rule_id in rule_ids if webhook_rules.remove(int(rule_id)))
+            return JsonResponse({'status': 'success', 'deleted': deleted})
+            
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': str(e)})
     
+    return JsonResponse({'status': 'error', 'message': 'POST method required'})
+
+def get_webhook_messages(request):
+    """webhookメッセージを取得するAPI
+
+    ?since=<seq> を指定するとそれより新しいメッセージのみを返す（最大 ?limit= 件）。
+    指定しない場合は従来どおり最新20件を返す。
+    """
+    try:
+        since = request.GET.get('since')
+        limit = int(request.GET.get('limit', 20 if since is None else 100))
+        if limit < 0:
+            raise ValueError('limit must not be negative')
+
+        if since is None:
+            messages = webhook_messages.latest(limit)
+        else:
+            since = int(since)
+            messages = webhook_messages.since(since, limit)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
+
     return JsonResponse({
         'status': 'success',
-        'metrics': metrics_data,
-        'current_metric_id': current_metric_id
+        'messages': messages,
+        'last_seq': messages[-1]['seq'] if messages else webhook_messages.last_seq,
+        # sinceより後のメッセージの一部が既に上書きされている場合はTrue
+        'truncated': since is not None and since + 1 < webhook_messages.first_seq
     })
 
-def get_metrics_list(request):
-    """利用可能なメトリクス一覧を取得するAPI"""
+# メトリクス一覧で返すことができる項目
+METRIC_LIST_FIELDS = ('metric_id', 'original_name', 'prometheus_name', 'type', 'label_names', 'value')
+
+# NDJSONで一度に送信する行数
+NDJSON_CHUNK_LINES = 1000
+
+def metric_list_item(metric_id, info, fields=METRIC_LIST_FIELDS):
+    """メトリクス一覧の1件分の情報（fieldsで指定された項目のみ）"""
+    return {field: metric_id if field == 'metric_id' else info[field] for field in fields}
+
+def select_metric_ids(metric_ids, prefix='', cursor=None, limit=None):
+    """メトリクスIDを絞り込み、(対象のID, 次ページのカーソル) を返す
+
+    limitを指定した場合はcursorより大きいIDを昇順に最大limit件返す（metric_ids は昇順であること）。
+    指定しない場合は一覧を作らず、絞り込み結果を順に返すイテレーターを返す。
+    """
+    selected = (
+        metric_id for metric_id in metric_ids
+        if (cursor is None or metric_id > cursor)
+        and (info := current_metrics.get(metric_id)) is not None
+        and info['prometheus_name'].startswith(prefix)
+    )
+    if limit is None:
+        return selected, None
+    
+    # 次のページがあるかを判定するため1件多く取得する
+    page = list(itertools.islice(selected, limit + 1))
+    if len(page) > limit:
+        return page[:limit], page[limit - 1]
+    return page, None
+
+def iter_metric_items(metric_ids, fields):
+    """メトリクス一覧の情報を順に生成（途中で削除されたメトリクスは除く）"""
+    for metric_id in metric_ids:
+        info = current_metrics.get(metric_id)
+        if info is not None:
+            yield metric_list_item(metric_id, info, fields)
+
+async def stream_metrics_ndjson(metric_ids, fields):
+    """メトリクス一覧をNDJSONとして一定行数ずつ生成
+
+    ASGIで全体をメモリに読み込まずに送信できるよう、非同期イテレーターとして実装している。
+    """
+    lines = []
+    for item in iter_metric_items(metric_ids, fields):
+        lines.append(json.dumps(item))
+        if len(lines) >= NDJSON_CHUNK_LINES:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+def metrics_list_etag(request):
+    """メトリクス一覧のETag（状態バージョンが変わった場合のみ変化する）"""
+    sync_shared_state()
     # 初期メトリクスを作成
     initialize_default_metrics()
+    return metric_changes.etag()
+
+def metrics_list_response(request):
+    """メトリクス一覧のレスポンスを作成
+
+    ?since_version= を指定すると、そのバージョン以降に作成・名前変更・値変更されたメトリクスと
+    削除されたメトリクスIDのみを返す（full=False）。?instance= が現在のものと異なる場合や
+    変更履歴が既に上書きされている場合は全件を返す（full=True）。
+
+    ?prefix= でPrometheus名の前方一致、?fields= で返す項目を指定できる。
+    ?limit= を指定するとIDの昇順に最大limit件を返し、続きは next_cursor を ?cursor= に指定して取得する。
+    ?format=ndjson の場合はメトリクスを1行1件のNDJSONとしてストリーミングで返す。
+    """
+    since_version = request.GET.get('since_version')
+    instance = request.GET.get('instance', metric_changes.instance)
+    # 集計中の変更は次回の差分に含まれるよう、先にバージョンを取得しておく
+    version = metric_changes.version
     
-    metrics_list = []
-    for metric_id, info in current_metrics.items():
-        metrics_list.append({
-            'metric_id': metric_id,
-            'original_name': info['original_name'],
-            'prometheus_name': info['prometheus_name'],
-            'value': info['value']
-        })
+    try:
+        fields = tuple(request.GET.get('fields', ','.join(METRIC_LIST_FIELDS)).split(','))
+        for field in fields:
+            if field not in METRIC_LIST_FIELDS:
+                raise ValueError(f'Unknown field: {field}')
+        prefix = request.GET.get('prefix', '')
+        cursor = request.GET.get('cursor')
+        cursor = int(cursor) if cursor is not None else None
+        limit = request.GET.get('limit')
+        limit = int(limit) if limit is not None else None
+        if limit is not None and limit <= 0:
+            raise ValueError('limit must be positive')
+        
+        changed = None
+        if since_version is not None and instance == metric_changes.instance:
+            changed = metric_changes.changed_since(int(since_version))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
+    
+    if changed is None:
+        deleted = []
+        if limit is None:
+            # 一覧の作成中に他のリクエストで変更されても影響しないようIDのみ複製しておく
+            metric_ids = list(current_metrics)
+        else:
+            # ページ単位の取得ではIDの昇順のインデックスをカーソルの位置から読む
+            metric_ids = metrics_collector.sorted_ids(cursor)
+    else:
+        metric_ids = sorted(changed)
+        deleted = [metric_id for metric_id in metric_ids if metric_id not in current_metrics]
+        if cursor is not None:
+            metric_ids = metric_ids[bisect_right(metric_ids, cursor):]
+    metric_ids, next_cursor = select_metric_ids(metric_ids, prefix, cursor, limit)
+    
+    if request.GET.get('format') == 'ndjson':
+        return StreamingHttpResponse(
+            stream_metrics_ndjson(metric_ids, fields), content_type='application/x-ndjson')
     
     return JsonResponse({
         'status': 'success',
-        'metrics': metrics_list,
-        'current_metric_id': current_metric_id
+        'full': changed is None,
+        'metrics': list(iter_metric_items(metric_ids, fields)),
+        'deleted': deleted,
+        'next_cursor': next_cursor,
+        'current_metric_id': current_metric_id,
+        'version': version,
+        'instance': metric_changes.instance
     })
 
-def generate_unique_metric_name(base_name="new_metric"):
+@condition(etag_func=metrics_list_etag)
+def get_current_metrics(request):
+    """現在のメトリクス値を取得するAPI"""
+    return metrics_list_response(request)
+
+@condition(etag_func=metrics_list_etag)
+def get_metrics_list(request):
+    """利用可能なメトリクス一覧を取得するAPI"""
+    return metrics_list_response(request)
+
+def generate_unique_metric_name(base_name="new_metric", metric_type='gauge'):
     """重複しないメトリクス名を生成"""
     prometheus_base = convert_to_prometheus_name(base_name)
     
-    # 既存のメトリクス名を確認
-    existing_names = set()
-    for info in metrics_registry.values():
-        existing_names.add(info['prometheus_name'])
-    
     # ベース名が使用可能かチェック
-    if prometheus_base not in existing_names:
+    if metrics_collector.name_available(prometheus_base, metric_type):
         return base_name
     
-    # 連番を付けて重複しない名前を生成
-    counter = 1
+    # 前回使用した連番の続きから重複しない名前を生成
+    counter = metric_name_counters.get(prometheus_base, 0)
     while True:
+        counter += 1
         candidate_name = f"{base_name}_{counter}"
         candidate_prometheus = convert_to_prometheus_name(candidate_name)
-        if candidate_prometheus not in existing_names:
+        if metrics_collector.name_available(candidate_prometheus, metric_type):
+            metric_name_counters[prometheus_base] = counter
             return candidate_name
-        counter += 1
 
 @csrf_exempt
-def create_metric(request):
+@timed_view('create_metric')
+async def create_metric(request):
     """新しいメトリクスを作成する"""
+    await async_sync_shared_state()
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
             metric_name = data.get('metric_name')
+            metric_type = data.get('type', 'gauge')
+            buckets = data.get('buckets')
+            label_names = validate_label_names(data.get('label_names'), metric_type)
+            ttl = data.get('ttl')
+            if ttl is not None:
+                ttl = float(ttl)
+                if not ttl > 0:
+                    return JsonResponse({'status': 'error', 'message': 'ttl must be positive'})
+            
+            if metric_type not in METRIC_TYPES:
+                return JsonResponse({'status': 'error', 'message': f'Unknown metric type: {metric_type}'})
+            if buckets is not None:
+                if metric_type != 'histogram':
+                    return JsonResponse({'status': 'error', 'message': 'buckets is only supported for histogram'})
+                buckets = histogram_buckets(buckets)
             
             # メトリクス名が指定されていない場合は自動生成
             if not metric_name:
-                metric_name = generate_unique_metric_name("new_metric")
+                metric_name = generate_unique_metric_name("new_metric", metric_type)
             
-            metric_id = create_new_metric(metric_name)
+            await reserve_metric_ids()
+            metric_id = create_new_metric(metric_name, metric_type, buckets, label_names, ttl)
             if metric_id:
                 # WebSocketで他のクライアントに通知
                 channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
+                await timed_group_send(
+                    channel_layer,
                     "webhook_messages",
                     {
                         "type": "webhook_message",
@@ -364,7 +1777,8 @@ def create_metric(request):
                 )
                 
                 # メトリクス一覧の更新を通知
-                async_to_sync(channel_layer.group_send)(
+                await timed_group_send(
+                    channel_layer,
                     "metrics_sync",
                     {
                         "type": "metrics_update"
@@ -375,7 +1789,8 @@ def create_metric(request):
                     'status': 'success',
                     'metric_id': metric_id,
                     'message': f'Metric created successfully',
-                    'metric': current_metrics[metric_id]
+                    'metric': current_metrics[metric_id],
+                    'ttl': metric_expiry.ttl(metric_id)
                 })
             else:
                 return JsonResponse({'status': 'error', 'message': 'Failed to create metric'})
@@ -388,6 +1803,7 @@ def create_metric(request):
 @csrf_exempt
 def select_metric(request):
     """現在選択中のメトリクスを変更する"""
+    sync_shared_state()
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
@@ -402,6 +1818,9 @@ def select_metric(request):
             
             global current_metric_id
             current_metric_id = metric_id
+            metric_changes.record()
+            if shared_state is not None:
+                shared_state.save_current_metric_id(metric_id)
             
             return JsonResponse({
                 'status': 'success',
@@ -415,8 +1834,9 @@ def select_metric(request):
     return JsonResponse({'status': 'error', 'message': 'POST method required'})
 
 @csrf_exempt
-def delete_metric(request):
+async def delete_metric(request):
     """指定されたメトリクスを削除する"""
+    await async_sync_shared_state()
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
@@ -433,7 +1853,8 @@ def delete_metric(request):
             if delete_metric_by_id(metric_id):
                 # WebSocketで他のクライアントに通知
                 channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
+                await timed_group_send(
+                    channel_layer,
                     "webhook_messages",
                     {
                         "type": "webhook_message",
@@ -442,7 +1863,8 @@ def delete_metric(request):
                 )
                 
                 # メトリクス一覧の更新を通知
-                async_to_sync(channel_layer.group_send)(
+                await timed_group_send(
+                    channel_layer,
                     "metrics_sync",
                     {
                         "type": "metrics_update"
@@ -463,8 +1885,9 @@ def delete_metric(request):
     return JsonResponse({'status': 'error', 'message': 'POST method required'})
 
 @csrf_exempt
-def cleanup_metrics(request):
+async def cleanup_metrics(request):
     """全てのメトリクスをクリーンアップする"""
+    await async_sync_shared_state()
     try:
         global current_metric_id
         
@@ -475,10 +1898,12 @@ def cleanup_metrics(request):
             delete_metric_by_id(metric_id)
         
         current_metric_id = None
+        metric_changes.record()
         
         # WebSocketで他のクライアントに通知
         channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
+        await timed_group_send(
+            channel_layer,
             "webhook_messages",
             {
                 "type": "webhook_message",
@@ -487,7 +1912,8 @@ def cleanup_metrics(request):
         )
         
         # メトリクス一覧の更新を通知
-        async_to_sync(channel_layer.group_send)(
+        await timed_group_send(
+            channel_layer,
             "metrics_sync",
             {
                 "type": "metrics_update"
@@ -14,3 +14,7 @@ application = ProtocolTypeRouter({
         )
     ),
 })
+
+# スナップショットの復元・保存はサーバープロセスでのみ行う（管理コマンドでは行わない）
+from metrics_app.views import start_metrics_snapshot  # noqa: E402
+start_metrics_snapshot()
@@ -58,11 +58,69 @@ DATABASES = {
 # Channels
 ASGI_APPLICATION = 'mock_exporter.asgi.application'
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+# 複数ワーカーで起動する場合はRedisのURLを指定する
+# メトリクスの状態とチャネルレイヤーがRedis上で共有される
+REDIS_URL = os.environ.get('MOCK_EXPORTER_REDIS_URL')
+
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [REDIS_URL],
+            },
+        }
     }
-}
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
+
+# スライダー同期のティックレート（Hz）。0以下で即時送信
+METRICS_SYNC_TICK_HZ = 20
+
+# WebSocketクライアントごとの送信キューに保持するwebhookメッセージ数の上限（超えた場合は古いものから捨てる）
+# メトリクス値はメトリクスごとに最新の値のみを保持する
+WEBSOCKET_SEND_QUEUE_SIZE = 100
+
+# 値ジェネレーターのティックレート（Hz）
+METRICS_GENERATOR_TICK_HZ = 10
+
+# メトリクス値の記録ファイルを保存するディレクトリ
+METRICS_RECORDING_DIR = BASE_DIR / 'recordings'
+
+# メトリクスのスナップショットの保存先（Noneで無効）と保存間隔（秒）
+# 復元・保存はサーバープロセス（asgi.py）でのみ行い、管理コマンドでは行わない
+METRICS_SNAPSHOT_PATH = BASE_DIR / 'snapshots' / 'metrics.snapshot'
+METRICS_SNAPSHOT_INTERVAL = 10
+
+# webhookメッセージを保持する件数
+WEBHOOK_BUFFER_SIZE = 1000
+
+# 一括webhookで1リクエストに受け付けるメッセージ数の上限（超えた場合は413を返す）
+WEBHOOK_MAX_BATCH_SIZE = 10000
+
+# create_targets で1リクエストに作成できる仮想エクスポーター数の上限（超えた場合は400を返す）
+VIRTUAL_TARGETS_MAX_COUNT = 10000
+
+# 合成ターゲット（/metrics?synthetic=<name>）1つあたりの系列数の上限
+SYNTHETIC_MAX_SERIES = 100000000
+
+# メトリクス一覧の差分取得用に保持する変更履歴の件数（超えた場合は全件を返す）
+METRICS_CHANGELOG_SIZE = 10000
+
+# 最終更新から一定時間（秒）が経過したメトリクスを削除する既定のTTL（Noneなら削除しない）
+# create_metric の ttl でメトリクスごとに指定できる
+METRICS_DEFAULT_TTL = None
+
+# 系列数の上限（超えた場合は最も長く更新されていないメトリクスから削除する。Noneなら上限なし）
+METRICS_MAX_SERIES = None
+
+# 期限切れ・上限超過のメトリクスを削除する間隔（秒）と、1回に削除する最大件数
+METRICS_SWEEP_INTERVAL = 1.0
+METRICS_SWEEP_BATCH = 1000
 
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = '/static/'